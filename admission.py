@@ -0,0 +1,240 @@
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from flask import current_app, g, jsonify, request
+
+from config import CONFIG
+import metrics
+
+
+class Rejected(Exception):
+    def __init__(self, message, status, retry_after, reason):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+class TokenBuckets:
+    """One token bucket per key, refilled at ``rate`` per second up to ``burst``.
+
+    Only the ``max_keys`` most recently seen keys are kept; a key that was
+    dropped starts again with a full bucket.
+    """
+
+    def __init__(self, rate, burst, max_keys=100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        """Spend a token for ``key``; return 0, or the seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RouteGate:
+    """Caps the requests in flight on one route.
+
+    Past ``limit`` a request waits, first come first served, behind at most
+    ``max_queue`` others for up to ``max_wait`` seconds. While the average
+    recent wait is above ``target_wait`` new arrivals are shed at once
+    instead of joining a queue that would only time out.
+    """
+
+    def __init__(self, limit, max_queue, max_wait, target_wait):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.target_wait = target_wait
+        self.active = 0
+        self.waiting = 0
+        self.average_wait = 0.0
+        self._cond = threading.Condition()
+
+    def _observe(self, waited):
+        self.average_wait += (waited - self.average_wait) * 0.2
+
+    def enter(self, block=True):
+        """Take a slot and return None, or return why the request was shed."""
+        with self._cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                self._observe(0.0)
+                return None
+            if not block or self.waiting >= self.max_queue:
+                return 'queue_full'
+            if self.average_wait > self.target_wait:
+                return 'latency'
+            self.waiting += 1
+            started = time.monotonic()
+            deadline = started + self.max_wait
+            try:
+                while self.active >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._observe(self.max_wait)
+                        return 'timeout'
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.active += 1
+            self._observe(time.monotonic() - started)
+            return None
+
+    def leave(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+
+class AdmissionController:
+    """Rate limits and concurrency caps checked before an API handler runs.
+
+    Per-session and per-client buckets answer 429 with the time until the
+    next token; a full or slow route answers 503. Both set Retry-After.
+    """
+
+    def __init__(self, session_rate=10, session_burst=20, ip_rate=20, ip_burst=40, max_keys=100000,
+                 concurrency=32, route_limits=None, max_queue=64, max_wait=0.25, target_wait=0.05,
+                 enabled=True):
+        self.enabled = enabled
+        self.sessions = TokenBuckets(session_rate, session_burst, max_keys)
+        self.clients = TokenBuckets(ip_rate, ip_burst, max_keys)
+        self.concurrency = concurrency
+        self.route_limits = dict(route_limits or {})
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.target_wait = target_wait
+        self.counts = Counter()
+        self._gates = {}
+        self._lock = threading.Lock()
+
+    def gate(self, route):
+        gate = self._gates.get(route)
+        if gate is None:
+            with self._lock:
+                gate = self._gates.setdefault(route, RouteGate(
+                    self.route_limits.get(route, self.concurrency),
+                    self.max_queue, self.max_wait, self.target_wait))
+        return gate
+
+    def _count(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def admit(self, route, session_id, client, block=True):
+        """Take a slot on ``route`` or raise ``Rejected``; pair with ``release``."""
+        for buckets, key, reason in ((self.sessions, session_id, 'session_rate'),
+                                     (self.clients, client, 'ip_rate')):
+            if key:
+                wait = buckets.take(key)
+                if wait:
+                    self._count(reason)
+                    raise Rejected('Too many requests', 429, math.ceil(wait), reason)
+        shed = self.gate(route).enter(block)
+        if shed:
+            self._count(shed)
+            raise Rejected('Server busy, please retry', 503, math.ceil(self.max_wait) or 1, shed)
+        self._count('admitted')
+
+    def release(self, route):
+        self.gate(route).leave()
+
+    def get_stats(self):
+        with self._lock:
+            counts = dict(self.counts)
+            gates = {route: (gate.active, gate.waiting) for route, gate in self._gates.items()}
+        return counts, gates
+
+
+def _route_limits():
+    value = CONFIG.get("admission", "route_limits", fallback="")
+    limits = {}
+    for item in value.split(','):
+        if item.strip():
+            route, _, limit = item.rpartition('=')
+            limits[route.strip()] = int(limit)
+    return limits
+
+
+def _create_controller():
+    return AdmissionController(
+        session_rate=CONFIG.getfloat("admission", "session_rate", fallback=10),
+        session_burst=CONFIG.getfloat("admission", "session_burst", fallback=20),
+        ip_rate=CONFIG.getfloat("admission", "ip_rate", fallback=20),
+        ip_burst=CONFIG.getfloat("admission", "ip_burst", fallback=40),
+        max_keys=CONFIG.getint("admission", "max_tracked_keys", fallback=100000),
+        concurrency=CONFIG.getint("admission", "concurrency", fallback=32),
+        route_limits=_route_limits(),
+        max_queue=CONFIG.getint("admission", "max_queue", fallback=64),
+        max_wait=CONFIG.getfloat("admission", "max_wait_ms", fallback=250) / 1000,
+        target_wait=CONFIG.getfloat("admission", "target_wait_ms", fallback=50) / 1000,
+        enabled=CONFIG.getboolean("admission", "enabled", fallback=True),
+    )
+
+
+admission = _create_controller()
+
+
+def _admission_metrics():
+    counts, gates = admission.get_stats()
+    lines = ['# TYPE api_admission_total counter']
+    for outcome, count in sorted(counts.items()):
+        lines.append(f'api_admission_total{{outcome="{outcome}"}} {count}')
+    lines.append('# TYPE api_in_flight gauge')
+    lines += [f'api_in_flight{{route="{route}"}} {active}' for route, (active, _) in sorted(gates.items())]
+    lines.append('# TYPE api_queued gauge')
+    lines += [f'api_queued{{route="{route}"}} {waiting}' for route, (_, waiting) in sorted(gates.items())]
+    return lines
+
+
+metrics.collectors.append(_admission_metrics)
+
+
+def rejected_response(e):
+    response = jsonify({'error': e.message})
+    response.status_code = e.status
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+def _admit():
+    route = request.endpoint
+    try:
+        # The raw cookie identifies the session without loading it from the store
+        admission.admit(route, request.cookies.get(current_app.config['SESSION_COOKIE_NAME']),
+                        request.remote_addr)
+    except Rejected as e:
+        return rejected_response(e)
+    g._admitted_route = route
+
+
+def _release(exception=None):
+    route = g.pop('_admitted_route', None)
+    if route is not None:
+        admission.release(route)
+
+
+def init_blueprint(blueprint):
+    if admission.enabled:
+        blueprint.before_request(_admit)
+        blueprint.teardown_request(_release)
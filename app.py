@@ -1,20 +1,52 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
-import sqlite3
+from flask import Flask, render_template, request, redirect, url_for, flash, session
+from markupsafe import Markup
+import multiprocessing
 from config import CONFIG
 from create_db_bikes import BikesDB
 from datetime import datetime
-from werkzeug.security import check_password_hash, generate_password_hash
 from functools import wraps
+import uuid
 from api import api
+from database import get_db, init_app
+import metrics
+import assets
+import encoding
+import sessions
+import replicas
+from replicas import get_read_db, mark_write, replica_set
+from occupancy import occupancy
+from pricing import pricing
+from lifecycle import scheduler
+from catalog import catalog
+from availability import day_range
+from booking import BookingError, checkout
+from passwords import HashingBusy, LoginThrottled, hasher
+from listing import latest_reservation
+from search import facet_counts
 
 app = Flask(__name__)
-app.secret_key = 'bikes123'
+sessions.init_app(app)
 app.register_blueprint(api)
+init_app(app)
+metrics.init_app(app)
+assets.init_app(app)
+encoding.init_app(app)
+replicas.init_app(app)
+
+# Password hashing workers import the main script, and so this module, again;
+# only the serving process migrates the database and starts background work
+if multiprocessing.current_process().name == 'MainProcess':
+    with app.app_context():
+        BikesDB.migrate(get_db())
+        occupancy.load(get_db())
+
+    if CONFIG.getboolean("lifecycle", "enabled", fallback=True):
+        scheduler.start()
+    # Started after the migrations so the first copy has the current schema
+    replica_set.start()
 
 def get_db_connection():
-    conn = sqlite3.connect(CONFIG["database"]["name"])
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_db()
 
 def login_required(f):
     @wraps(f)
@@ -41,11 +73,16 @@ def login():
     username = request.form["username"]
     password = request.form["password"]
 
-    conn = get_db_connection()
-    user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-    conn.close()
+    try:
+        user = hasher.authenticate(get_db_connection(), username, password, client=request.remote_addr)
+    except HashingBusy:
+        flash('Login is busy right now, please try again')
+        return redirect(url_for('login'))
+    except LoginThrottled:
+        flash('Too many failed logins, please try again later')
+        return redirect(url_for('login'))
 
-    if user and check_password_hash(user['password'], password):
+    if user:
         session['user_id'] = user['id']
         return redirect(url_for('overview'))
     else:
@@ -57,13 +94,18 @@ def login():
 def overview():
     return render_template('overview.html')
 
+def render_bike_cards(bikes):
+    return render_template("bike_cards.html", bikes=bikes)
+
 @app.route('/bikes')
 @login_required
 def bikes():
+    # The card markup and filter counts are built once per catalog version
+    # and shared by all users
     conn = get_db_connection()
-    all_bikes = conn.execute('SELECT Brand, model, type, price, status, image_url FROM bikes').fetchall()
-    conn.close()
-    return render_template("bikes.html", bikes=all_bikes)
+    version, cards = catalog.fragment(conn, 'bike_cards', render_bike_cards)
+    _, facets = catalog.fragment(conn, 'facets', facet_counts)
+    return render_template("bikes.html", cards=Markup(cards), facets=facets, catalog_version=version)
 
 @app.route('/rent', methods=["GET"])
 @login_required
@@ -99,7 +141,7 @@ def payment():
         
         try:
             conn = get_db_connection()
-            bike = conn.execute('SELECT price FROM bikes WHERE id = ?', (bike_id,)).fetchone()
+            bike = conn.execute('SELECT price, type FROM bikes WHERE id = ?', (bike_id,)).fetchone()
             
             if not bike:
                 flash('Bike not found')
@@ -107,132 +149,78 @@ def payment():
             
             start = datetime.strptime(start_date, '%Y-%m-%d')
             end = datetime.strptime(end_date, '%Y-%m-%d')
-            days = (end - start).days + 1
-            total_amount = days * bike['price']
+            if start > end:
+                flash('Invalid date range')
+                return redirect(url_for('bikes'))
+            start_day, end_day = day_range(start, end)
+            try:
+                pricing.check(start_day, end_day)
+            except ValueError as e:
+                flash(str(e))
+                return redirect(url_for('bikes'))
+            total_amount = pricing.quote(bike['price'], bike['type'], start_day, end_day)
             
             session['rental_info'] = {
                 'bike_id': bike_id,
                 'start_date': start_date,
                 'end_date': end_date,
-                'total_amount': total_amount
+                'total_amount': total_amount,
+                'idempotency_key': uuid.uuid4().hex
             }
             
             return render_template('payment.html', total_amount=total_amount)
             
         except Exception as e:
-            print(f"Error in GET payment: {str(e)}")  # Debug log
+            app.logger.exception('Error in GET payment')
             flash('Error processing rental')
             return redirect(url_for('bikes'))
-        finally:
-            if 'conn' in locals():
-                conn.close()
             
     elif request.method == 'POST':
-        print("Processing POST payment")  # Debug log
         if 'rental_info' not in session:
             flash('No rental information found')
             return redirect(url_for('bikes'))
         
         rental_info = session.get('rental_info')
-        print(f"Rental info: {rental_info}")  # Debug log
         
-        conn = None
         try:
-            conn = get_db_connection()
-            cursor = conn.cursor()
-            
-            # Start transaction
-            cursor.execute('BEGIN TRANSACTION')
-            print("Started transaction")  # Debug log
-            
-            # Create the reservation
-            cursor.execute('''
-                INSERT INTO reservations 
-                (bike_id, user_id, start_date, end_date, total_cost, status) 
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                rental_info['bike_id'],
-                session['user_id'],
-                rental_info['start_date'],
-                rental_info['end_date'],
-                rental_info['total_amount'],
-                'confirmed'
-            ))
-            
-            reservation_id = cursor.lastrowid
-            print(f"Created reservation {reservation_id}")  # Debug log
-            
-            # Record the payment
-            cursor.execute('''
-                INSERT INTO payments 
-                (reservation_id, amount, payment_status, payment_method) 
-                VALUES (?, ?, ?, ?)
-            ''', (
-                reservation_id,
-                rental_info['total_amount'],
-                'completed',
-                'credit_card'
-            ))
-            print("Recorded payment")  # Debug log
-            
-            # Update bike status
-            cursor.execute('''
-                UPDATE bikes 
-                SET status = 'Rented'
-                WHERE id = ?
-            ''', (rental_info['bike_id'],))
-            print("Updated bike status")  # Debug log
-            
-            # Commit transaction
-            conn.commit()
-            print("Committed transaction")  # Debug log
+            checkout(session['user_id'],
+                     rental_info['bike_id'],
+                     rental_info['start_date'],
+                     rental_info['end_date'],
+                     payment_method='credit_card',
+                     idempotency_key=rental_info.get('idempotency_key'))
+            mark_write()
             
             # Clear the rental info from session
             session.pop('rental_info', None)
             
-            print("Redirecting to thank you page")  # Debug log
             return redirect(url_for('thank_you'))
             
+        except BookingError as e:
+            flash(f'Error processing payment: {e.message}')
+            return redirect(url_for('bikes'))
         except Exception as e:
-            print(f"Error in POST payment: {str(e)}")  # Debug log
-            if conn:
-                conn.rollback()
-                print("Rolled back transaction")  # Debug log
+            app.logger.exception('Error in POST payment')
             flash(f'Error processing payment: {str(e)}')
             return redirect(url_for('bikes'))
-        finally:
-            if conn:
-                conn.close()
 
 @app.route('/thank_you')
 @login_required
 def thank_you():
     try:
-        conn = get_db_connection()
-        # Get the most recent reservation for this user
-        reservation = conn.execute('''
-            SELECT r.*, b.Brand, b.model, p.payment_status
-            FROM reservations r
-            JOIN bikes b ON r.bike_id = b.id
-            LEFT JOIN payments p ON p.reservation_id = r.id
-            WHERE r.user_id = ?
-            ORDER BY r.id DESC
-            LIMIT 1
-        ''', (session['user_id'],)).fetchone()
+        reservation = latest_reservation(get_read_db(), session['user_id'])
         
         return render_template('thank_you.html', reservation=reservation)
     except Exception as e:
-        print(f"Error in thank you page: {str(e)}")  # Debug log
+        app.logger.exception('Error in thank you page')
         flash('Error loading reservation details')
         return redirect(url_for('overview'))
-    finally:
-        if 'conn' in locals():
-            conn.close()
             
 @app.route("/logout/")
 def logout():
-    session.pop('user_id', None)
-    flash('Logged out successfully!')
+    # Deletes the stored session and the cookie. No flash: the homepage
+    # does not show them, and one would start a new session
+    session.clear()
     return redirect(url_for('homepage'))
 
 if __name__ == "__main__":
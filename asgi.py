@@ -0,0 +1,317 @@
+"""Async (ASGI) serving mode for the /api routes.
+
+Serves the same handlers as api.py, from handlers.py. They block, so each
+runs on a dedicated executor that checks connections out of the shared
+pool, while the event loop only parses requests and sends responses.
+Launch with
+
+    python asgi.py                # uvicorn on the [server] address
+    uvicorn asgi:application      # or any other ASGI server
+"""
+import asyncio
+import json
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.http import dump_cookie, parse_cookie
+
+from admission import Rejected, admission
+from app import app
+from config import CONFIG
+from database import pool
+from encoding import compressor, dumps
+import handlers
+import metrics
+from ledger import ledger
+from lifecycle import scheduler
+from passwords import hasher
+from replicas import replica_set
+from sessions import ServerSession
+
+db_executor = ThreadPoolExecutor(max_workers=pool.size, thread_name_prefix='sqlite')
+
+# Same session store and cookie as the Flask app, so both servers share logins
+session_interface = app.session_interface
+SESSION_COOKIE = app.config['SESSION_COOKIE_NAME']
+
+# The shared /api handlers, plus this server's own /metrics
+routes = []
+
+
+def compile_rule(rule):
+    """A werkzeug-style rule as a regex; ``<int:name>`` captures digits."""
+    return re.compile(re.sub(r'<int:(\w+)>', r'(?P<\1>\\d+)', rule) + '$')
+
+
+def route(method, rule):
+    """Register a coroutine handler for a werkzeug-style ``rule``."""
+    def decorator(handler):
+        routes.append((method, compile_rule(rule), rule, handler))
+        return handler
+    return decorator
+
+
+def read_pool(request):
+    """A fresh replica's pool for a read-only handler, else the primary's."""
+    if not replica_set.enabled:
+        return pool
+    # Only preloaded sessions are consulted, so reads never wait on the store
+    wrote_at = request.session.get('wrote_at') if request.session.loaded else None
+    return replica_set.choose(wrote_at) or pool
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        # Blank and repeated arguments are kept, as in Flask's request.args
+        self.args = MultiDict(parse_qsl(scope['query_string'].decode('latin-1'), keep_blank_values=True))
+        self.headers = Headers([
+            (name.decode('latin-1'), value.decode('latin-1'))
+            for name, value in scope['headers']
+        ])
+        self.body = body
+        self.client = (scope.get('client') or ('', 0))[0]
+        # Loaded on the db executor by serve, and only for routes that use it
+        self.session = ServerSession(session_interface.store,
+                                     parse_cookie(self.headers.get('cookie', '')).get(SESSION_COOKIE))
+        self.session_cookie = None
+
+    def get_json(self):
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return None
+
+
+class Call:
+    """A request, as the ``call`` that handlers.py expects.
+
+    Used on the db executor only; connections are checked out on first
+    use and returned by ``close``.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.args = request.args
+        self.headers = request.headers
+        self.session = request.session
+        self.client = request.client
+        self._held = {}
+
+    @property
+    def json(self):
+        return self.request.get_json()
+
+    def _acquire(self, source):
+        conn = self._held.get(source)
+        if conn is None:
+            conn = self._held[source] = source.acquire()
+        return conn
+
+    def db(self):
+        return self._acquire(pool)
+
+    def read_db(self):
+        return self._acquire(read_pool(self.request))
+
+    def close(self):
+        for source, conn in self._held.items():
+            source.release(conn)
+        self._held.clear()
+
+
+class Response:
+    def __init__(self, body=b'', status=200, content_type='application/json', headers=None):
+        self.body = body
+        self.status = status
+        self.headers = [('Content-Type', content_type)] + list((headers or {}).items())
+
+    def compress(self, accept_encoding):
+        """Apply the coding negotiated from ``accept_encoding`` to a large enough JSON body."""
+        headers = dict(self.headers)
+        if (not isinstance(self.body, bytes) or self.status in (204, 304)
+                or headers['Content-Type'] != 'application/json' or not compressor.applies(self.body)):
+            return
+        self.headers.append(('Vary', 'Accept-Encoding'))
+        coding = compressor.negotiate(accept_encoding)
+        if coding is None:
+            return
+        etag = headers.get('ETag')
+        weak = etag is not None and etag.startswith('W/')
+        self.body = compressor.compress(self.body, coding, None if weak else etag)
+        self.headers.append(('Content-Encoding', coding))
+        if etag is not None and not weak:
+            # The compressed bytes differ, so the tag may only match weakly
+            self.headers.remove(('ETag', etag))
+            self.headers.append(('ETag', 'W/' + etag))
+
+    async def send(self, send, request):
+        headers = list(self.headers)
+        if request.session.accessed:
+            headers.append(('Vary', 'Cookie'))
+        if request.session_cookie is not None:
+            # An empty id means the session was cleared
+            max_age = int(session_interface.ttl) if request.session_cookie else 0
+            headers.append(('Set-Cookie', dump_cookie(
+                SESSION_COOKIE, request.session_cookie, max_age=max_age, httponly=True, path='/')))
+        if isinstance(self.body, bytes):
+            headers.append(('Content-Length', str(len(self.body))))
+        await send({
+            'type': 'http.response.start',
+            'status': self.status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        if isinstance(self.body, bytes):
+            await send({'type': 'http.response.body', 'body': self.body})
+            return
+        async for chunk in self.body:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+def json_response(data, status=200, headers=None):
+    # Same encoding as Flask's jsonify outside debug mode
+    return Response(dumps(data), status, headers=headers)
+
+
+def error(message, status):
+    return json_response({'error': message}, status)
+
+
+async def stream_export(stream, source):
+    loop = asyncio.get_running_loop()
+    conn = await loop.run_in_executor(db_executor, source.acquire)
+    try:
+        chunks = stream(conn)
+        while True:
+            chunk = await loop.run_in_executor(db_executor, next, chunks, None)
+            if chunk is None:
+                break
+            yield chunk.encode()
+    finally:
+        source.release(conn)
+
+
+def serve(handler, request, uses_session, kwargs):
+    """Run a shared handler on the db executor."""
+    if uses_session:
+        request.session.data
+    call = Call(request)
+    try:
+        return handlers.handle(handler, call, **kwargs)
+    finally:
+        call.close()
+
+
+def to_response(request, reply):
+    if reply.stream is not None:
+        body = stream_export(reply.stream, read_pool(request))
+    elif reply.body is not None:
+        body = reply.body
+    else:
+        body = dumps(reply.data)
+    return Response(body, reply.status, reply.content_type, reply.headers)
+
+
+def shared(method, rule, handler, uses_session):
+    async def run(request, **kwargs):
+        reply = await asyncio.get_running_loop().run_in_executor(
+            db_executor, serve, handler, request, uses_session, kwargs)
+        return to_response(request, reply)
+    # Admission limits are named after the handler
+    run.__name__ = handler.__name__
+    route(method, rule)(run)
+
+
+for method, rule, handler, uses_session in handlers.routes:
+    shared(method, rule, handler, uses_session)
+
+
+@route('GET', r'/metrics')
+async def get_metrics(request):
+    return Response(metrics.render().encode(), content_type='text/plain; version=0.0.4')
+
+
+async def dispatch(request):
+    allowed = False
+    loop = asyncio.get_running_loop()
+    for method, pattern, name, handler in routes:
+        match = pattern.match(request.path)
+        if match is None:
+            continue
+        if method == request.method:
+            started = time.perf_counter()
+            # Same limits as the Flask api blueprint, but never queued: a
+            # wait here would stall the event loop
+            route = f'api.{handler.__name__}' if admission.enabled and request.path.startswith('/api/') else None
+            if route is not None:
+                try:
+                    admission.admit(route, request.session.sid, request.client, block=False)
+                except Rejected as e:
+                    return json_response({'error': e.message}, e.status, headers={'Retry-After': str(e.retry_after)})
+            try:
+                kwargs = {key: int(value) for key, value in match.groupdict().items()}
+                response = await handler(request, **kwargs)
+            finally:
+                if route is not None:
+                    admission.release(route)
+            response.compress(request.headers.get('accept-encoding'))
+            if request.session.loaded:
+                request.session_cookie = await loop.run_in_executor(
+                    db_executor, request.session.save, session_interface.ttl)
+            metrics.request_duration.observe((request.method, name, str(response.status)),
+                                             time.perf_counter() - started)
+            return response
+        allowed = True
+    return error('Method not allowed', 405) if allowed else error('Not found', 404)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                scheduler.stop()
+                hasher.close()
+                ledger.close()
+                replica_set.stop()
+                db_executor.shutdown(wait=True)
+                pool.close_all()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    if scope['type'] != 'http':
+        return
+
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+    request = Request(scope, body)
+    response = await dispatch(request)
+    await response.send(send, request)
+
+
+def main():
+    try:
+        import uvicorn
+    except ImportError:
+        print("The async server needs an ASGI server: pip install -r requirements.txt")
+        return 1
+    uvicorn.run(application,
+                host=CONFIG["server"]["listen_ip"],
+                port=CONFIG.getint("server", "port"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
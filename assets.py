@@ -0,0 +1,83 @@
+import json
+import mimetypes
+import os
+import threading
+
+from flask import request, send_from_directory
+
+BUILD_DIR = os.path.join('static', 'build')
+MANIFEST_PATH = os.path.join(BUILD_DIR, 'manifest.json')
+BUILD_URL = '/static/build/'
+
+# Hashed filenames never change content, so caches may keep them for good
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class AssetManifest:
+    """Maps logical ``/static/...`` paths to the outputs of build_assets.py.
+
+    Paths missing from the manifest, or every path when the build has not
+    been run, resolve to themselves so the app works off the raw files.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._lock = threading.Lock()
+
+    @property
+    def data(self):
+        if self._data is None:
+            with self._lock:
+                if self._data is None:
+                    try:
+                        with open(self.path, encoding='utf-8') as f:
+                            self._data = json.load(f)
+                    except FileNotFoundError:
+                        self._data = {'files': {}, 'images': {}}
+        return self._data
+
+    def reload(self):
+        with self._lock:
+            self._data = None
+
+    def url(self, path):
+        return self.data['files'].get(path, path)
+
+    def image(self, path):
+        """Return the thumbnail variants built for ``path``, or None."""
+        return self.data['images'].get(path)
+
+    def resolve_bike(self, bike):
+        """Point a bike dict's ``image_url`` at its sized thumbnail variants."""
+        variants = self.image(bike.get('image_url'))
+        if variants is not None:
+            bike['image_url'] = variants['jpeg']
+            bike['image_srcset'] = f"{variants['jpeg']} 1x, {variants['jpeg_2x']} 2x"
+            bike['image_webp_srcset'] = f"{variants['webp']} 1x, {variants['webp_2x']} 2x"
+        return bike
+
+    def image_fields(self, path):
+        """The image fields ``resolve_bike`` gives a bike whose ``image_url`` is ``path``."""
+        return self.resolve_bike({'image_url': path})
+
+
+manifest = AssetManifest(MANIFEST_PATH)
+
+
+def serve_build(filename):
+    directory = os.path.abspath(BUILD_DIR)
+    if request.accept_encodings.quality('gzip') > 0 and os.path.isfile(os.path.join(directory, filename + '.gz')):
+        response = send_from_directory(directory, filename + '.gz', max_age=31536000,
+                                       mimetype=mimetypes.guess_type(filename)[0])
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_from_directory(directory, filename, max_age=31536000)
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def init_app(app):
+    app.add_url_rule(BUILD_URL + '<path:filename>', 'build_asset', serve_build)
+    app.add_template_global(manifest.url, 'asset_url')
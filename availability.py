@@ -0,0 +1,61 @@
+from datetime import date, datetime
+
+# julianday() of 0001-01-01 minus one, so SQL and date.toordinal() agree
+ORDINAL_JULIAN_OFFSET = 1721424.5
+
+# Stay well below SQLITE_MAX_VARIABLE_NUMBER on older builds
+MAX_WINDOWS_PER_QUERY = 200
+
+
+def day_number(value):
+    """Convert a 'YYYY-MM-DD' string, date or datetime to an integer day number."""
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    return datetime.strptime(value, '%Y-%m-%d').date().toordinal()
+
+
+def day_range(start_date, end_date):
+    """Return the half-open [start_day, end_day) range for an inclusive rental."""
+    return day_number(start_date), day_number(end_date) + 1
+
+
+def is_available(conn, bike_id, start_date, end_date):
+    start_day, end_day = day_range(start_date, end_date)
+    conflict = conn.execute('''
+        SELECT 1 FROM reservations
+        WHERE bike_id = ? AND start_day < ? AND end_day > ?
+        LIMIT 1
+    ''', (bike_id, end_day, start_day)).fetchone()
+    return conflict is None
+
+
+def find_conflicts(conn, windows):
+    """Check many (bike_id, start_date, end_date) windows at once.
+
+    Returns a list of booleans in the same order as ``windows``, True where
+    the window overlaps an existing reservation.
+    """
+    windows = list(windows)
+    conflicts = []
+    for offset in range(0, len(windows), MAX_WINDOWS_PER_QUERY):
+        chunk = windows[offset:offset + MAX_WINDOWS_PER_QUERY]
+        params = []
+        for idx, (bike_id, start_date, end_date) in enumerate(chunk):
+            start_day, end_day = day_range(start_date, end_date)
+            params.extend((idx, bike_id, start_day, end_day))
+        values = ', '.join(['(?, ?, ?, ?)'] * len(chunk))
+        rows = conn.execute(f'''
+            WITH req(idx, bike_id, start_day, end_day) AS (VALUES {values})
+            SELECT req.idx, EXISTS (
+                SELECT 1 FROM reservations r
+                WHERE r.bike_id = req.bike_id
+                AND r.start_day < req.end_day
+                AND r.end_day > req.start_day
+            )
+            FROM req
+            ORDER BY req.idx
+        ''', params).fetchall()
+        conflicts.extend(bool(row[1]) for row in rows)
+    return conflicts
@@ -0,0 +1,111 @@
+"""Compare the legacy BETWEEN overlap check with the indexed day-number check.
+
+Run from the repository root:
+    python -m benchmarks.availability --reservations 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from availability import find_conflicts, is_available
+from create_db_bikes import BikesDB
+
+LEGACY_CHECK = '''
+    SELECT id FROM reservations
+    WHERE bike_id = ? AND
+    ((start_date BETWEEN ? AND ?) OR
+     (end_date BETWEEN ? AND ?) OR
+     (start_date <= ? AND end_date >= ?))
+'''
+
+
+def seed(conn, bikes, reservations):
+    cursor = conn.cursor()
+    for statement in (BikesDB.CREATE_TABLE_USERS, BikesDB.CREATE_TABLE_BIKES,
+                      BikesDB.CREATE_TABLE_RESERVATIONS, BikesDB.CREATE_TABLE_PAYMENTS):
+        cursor.execute(statement)
+    cursor.executemany(BikesDB.INSERT_Bikes, [
+        ('Brand', f'Model {i}', 'Naked Bike', 50.0, 'Available', '') for i in range(bikes)
+    ])
+    rng = random.Random(42)
+    base = date(2015, 1, 1)
+    rows = []
+    for _ in range(reservations):
+        start = base + timedelta(days=rng.randrange(3650))
+        end = start + timedelta(days=rng.randrange(1, 14))
+        rows.append((rng.randrange(1, bikes + 1), 1, start.isoformat(), end.isoformat(),
+                     100.0, start.toordinal(), end.toordinal() + 1))
+        if len(rows) == 100000:
+            cursor.executemany('''INSERT INTO reservations
+                (bike_id, user_id, start_date, end_date, total_cost, start_day, end_day)
+                VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+            rows = []
+    if rows:
+        cursor.executemany('''INSERT INTO reservations
+            (bike_id, user_id, start_date, end_date, total_cost, start_day, end_day)
+            VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+    conn.commit()
+
+
+def random_windows(count, bikes, first_day, span):
+    rng = random.Random(7)
+    windows = []
+    for _ in range(count):
+        start = first_day + timedelta(days=rng.randrange(span))
+        end = start + timedelta(days=rng.randrange(1, 7))
+        windows.append((rng.randrange(1, bikes + 1), start.isoformat(), end.isoformat()))
+    return windows
+
+
+def timed(label, queries, fn):
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<32} {elapsed * 1000:10.1f} ms  {elapsed / queries * 1e6:10.1f} us/check")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reservations', type=int, default=1000000)
+    parser.add_argument('--bikes', type=int, default=500)
+    parser.add_argument('--checks', type=int, default=2000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(path)
+        print(f"Seeding {args.reservations} reservations over {args.bikes} bikes...")
+        seed(conn, args.bikes, args.reservations)
+        # Booking checks land just after the seeded history, like real traffic
+        windows = random_windows(args.checks, args.bikes, date(2024, 12, 1), 90)
+
+        legacy_checks = windows[:max(1, args.checks // 20)]
+        timed('legacy BETWEEN (no index)', len(legacy_checks), lambda: [
+            conn.execute(LEGACY_CHECK, (b, s, e, s, e, s, e)).fetchone() for b, s, e in legacy_checks
+        ])
+
+        for statement in BikesDB.CREATE_INDEXES:
+            conn.execute(statement)
+        conn.execute('ANALYZE')
+
+        timed('indexed is_available', len(windows), lambda: [
+            is_available(conn, b, s, e) for b, s, e in windows
+        ])
+        timed('indexed find_conflicts (batch)', len(windows), lambda: find_conflicts(conn, windows))
+
+        single = [not is_available(conn, b, s, e) for b, s, e in windows]
+        assert single == find_conflicts(conn, windows)
+        conn.close()
+    finally:
+        os.remove(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
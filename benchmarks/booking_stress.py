@@ -0,0 +1,99 @@
+"""Fire concurrent bookings at one bike and check nothing is double-booked.
+
+Run from the repository root:
+    python -m benchmarks.booking_stress --requests 300 --workers 64
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from config import CONFIG
+
+
+def overlapping_pairs(conn, bike_id):
+    return conn.execute('''
+        SELECT COUNT(*) FROM reservations a
+        JOIN reservations b ON a.bike_id = b.bike_id AND a.id < b.id
+        WHERE a.bike_id = ? AND a.start_day < b.end_day AND a.end_day > b.start_day
+    ''', (bike_id,)).fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--workers', type=int, default=64)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    CONFIG["database"]["name"] = path
+    # Every simulated user shares one address; measure the app, not the rate limits
+    CONFIG["admission"]["enabled"] = "false"
+
+    from create_db_bikes import BikesDB
+    conn = sqlite3.connect(path)
+    BikesDB.initialize(conn)
+    conn.close()
+
+    from app import app
+
+    bike_id = 1
+    first_day = date.today() + timedelta(days=30)
+    rng = random.Random(1)
+
+    def reserve(payload, key=None):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        headers = {'Idempotency-Key': key} if key else {}
+        return client.post('/api/reservations', json=payload, headers=headers).status_code
+
+    def window():
+        start = first_day + timedelta(days=rng.randrange(60))
+        end = start + timedelta(days=rng.randrange(5))
+        return {'bike_id': bike_id, 'start_date': start.isoformat(), 'end_date': end.isoformat()}
+
+    failures = 0
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            statuses = Counter(executor.map(reserve, [window() for _ in range(args.requests)]))
+        print(f"Overlapping windows on one bike: {dict(statuses)}")
+
+        retry = window()
+        retry['start_date'] = (first_day + timedelta(days=120)).isoformat()
+        retry['end_date'] = (first_day + timedelta(days=121)).isoformat()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            replays = Counter(executor.map(lambda _: reserve(retry, 'stress-retry'), range(args.requests)))
+        print(f"Same idempotency key retried: {dict(replays)}")
+
+        conn = sqlite3.connect(path)
+        overlaps = overlapping_pairs(conn, bike_id)
+        keyed = conn.execute("SELECT COUNT(*) FROM reservations WHERE idempotency_key = 'stress-retry'").fetchone()[0]
+        conn.close()
+        print(f"Overlapping reservation pairs: {overlaps}")
+        print(f"Reservations for the retried key: {keyed}")
+        if overlaps or keyed != 1 or statuses.get(500) or replays.get(500):
+            failures += 1
+    finally:
+        from database import pool
+        from ledger import ledger
+        from lifecycle import scheduler
+        ledger.close()
+        scheduler.stop()
+        pool.close_all()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    print("FAILED" if failures else "OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
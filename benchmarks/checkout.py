@@ -0,0 +1,101 @@
+"""Compare paid checkouts committed one by one with the payment ledger's group commit.
+
+Run from the repository root:
+    python -m benchmarks.checkout --checkouts 2000 --workers 32
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from config import CONFIG
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checkouts', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=32)
+    parser.add_argument('--bikes', type=int, default=200)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    CONFIG["database"]["name"] = path
+    CONFIG["lifecycle"]["enabled"] = "false"
+
+    from create_db_bikes import BikesDB
+    conn = sqlite3.connect(path)
+    BikesDB.initialize(conn)
+    conn.executemany(BikesDB.INSERT_Bikes, [
+        (f'Brand {i}', f'Model {i}', 'Cruiser', 100.0, 'Available', '/static/images/download.jpg')
+        for i in range(args.bikes)
+    ])
+    conn.commit()
+    fleet = [bike_id for bike_id, in conn.execute("SELECT id FROM bikes WHERE status != 'Maintenance'")]
+    conn.close()
+
+    from booking import book, checkout
+    from database import pool
+    from ledger import ledger
+
+    first_day = date.today() + timedelta(days=30)
+
+    def window(n):
+        # Every checkout gets its own bike and week so none of them conflict
+        start = first_day + timedelta(days=7 * (n // len(fleet)))
+        return fleet[n % len(fleet)], start.isoformat(), (start + timedelta(days=2)).isoformat()
+
+    local = threading.local()
+    connections = []
+
+    def direct(n):
+        # Same durability as the ledger's writer so only the batching differs
+        if not hasattr(local, 'conn'):
+            local.conn = pool.connect(synchronous=ledger.synchronous)
+            connections.append(local.conn)
+        return book(local.conn, 1, *window(n), payment_method='credit_card')['payment_id']
+
+    def grouped(n):
+        return checkout(1, *window(n), payment_method='credit_card')['payment_id']
+
+    failures = 0
+    try:
+        for name, fn, offset in (('per-request commit', direct, 0), ('group commit', grouped, args.checkouts)):
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                payment_ids = list(executor.map(fn, range(offset, offset + args.checkouts)))
+            elapsed = time.perf_counter() - started
+            print(f"{name}: {args.checkouts / elapsed:,.0f} checkouts/s")
+
+            conn = sqlite3.connect(path)
+            stored = conn.execute(f'''
+                SELECT COUNT(*) FROM payments WHERE id IN ({",".join("?" * len(payment_ids))})
+            ''', payment_ids).fetchone()[0]
+            conn.close()
+            if stored != len(payment_ids):
+                print(f"  {len(payment_ids) - stored} acknowledged payments are missing")
+                failures += 1
+
+        stats = ledger.get_stats()
+        print(f"Ledger: {stats['entries']} payments in {stats['batches']} commits "
+              f"({stats['entries'] / max(stats['batches'], 1):.1f} per commit)")
+    finally:
+        ledger.close()
+        for conn in connections:
+            conn.close()
+        pool.close_all()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    print("FAILED" if failures else "OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+"""Load-test the rental flows and report per-endpoint latency as JSON.
+
+Seeds a throwaway database through BikesDB, then drives the real Flask app
+either in-process (Flask test client) or over HTTP against a local
+threaded server. Run from the repository root:
+
+    python -m benchmarks.load --bikes 500 --reservations 100000 --concurrency 16
+    python -m benchmarks.load --mode server --output run.json
+"""
+import argparse
+import contextlib
+import http.cookiejar
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from config import CONFIG
+
+SCENARIOS = ['login', 'catalog', 'availability', 'booking', 'payment', 'cancel']
+BIKE_TYPES = ['Cruiser', 'Sport Bike', 'Naked Bike', 'Adventure Bike']
+
+
+def seed(path, bikes, reservations, users, password):
+    from create_db_bikes import BikesDB
+    from werkzeug.security import generate_password_hash
+
+    conn = sqlite3.connect(path)
+    BikesDB.initialize(conn)
+    rng = random.Random(42)
+    conn.executemany(BikesDB.INSERT_Bikes, [
+        (f'Brand {i % 40}', f'Model {i}', rng.choice(BIKE_TYPES), round(rng.uniform(40, 160), 2),
+         'Available', '/static/images/download.jpg')
+        for i in range(bikes)
+    ])
+    # One hash shared by every synthetic user keeps seeding fast
+    password_hash = generate_password_hash(password)
+    conn.executemany('INSERT INTO users (username, password) VALUES (?, ?)',
+                     [(f'user{i}', password_hash) for i in range(users)])
+    fleet = conn.execute('SELECT COUNT(*) FROM bikes').fetchone()[0]
+    history_start = date.today() - timedelta(days=3650)
+    rows = []
+    for _ in range(reservations):
+        start = history_start + timedelta(days=rng.randrange(3640))
+        end = start + timedelta(days=rng.randrange(7))
+        rows.append((rng.randrange(1, fleet + 1), rng.randrange(1, users + 1), start.isoformat(),
+                     end.isoformat(), 100.0, 'confirmed', start.toordinal(), end.toordinal() + 1))
+    conn.executemany('''INSERT INTO reservations
+        (bike_id, user_id, start_date, end_date, total_cost, status, start_day, end_day)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+    conn.commit()
+    conn.close()
+    return fleet
+
+
+class TestClientSession:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json_body=None, form=None):
+        response = self.client.open(path, method=method, json=json_body, data=form)
+        try:
+            return response.status_code, response.get_data(), response.headers.get('Location')
+        finally:
+            response.close()
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, json_body=None, form=None):
+        headers = {}
+        data = None
+        if json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            data = urllib.parse.urlencode(form).encode()
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers=headers)
+        try:
+            with self.opener.open(req) as response:
+                return response.status, response.read(), response.headers.get('Location')
+        except urllib.error.HTTPError as e:
+            # Redirects land here too, since they are not followed
+            return e.code, e.read(), e.headers.get('Location')
+
+
+def start_server(app):
+    from werkzeug.serving import make_server
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.outcomes = defaultdict(Counter)
+        self.lock = threading.Lock()
+
+    def timed(self, name, session, method, path, succeeded=None, **kwargs):
+        """Time one request; ``succeeded(status, location)`` judges its outcome when given."""
+        started = time.perf_counter()
+        status, body, location = session.request(method, path, **kwargs)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.samples[name].append(elapsed)
+            self.statuses[name][status] += 1
+            if succeeded is not None:
+                self.outcomes[name]['succeeded' if succeeded(status, location) else 'failed'] += 1
+        return status, body
+
+    def report(self, wall_times):
+        endpoints = {}
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+            endpoints[name] = {
+                'requests': len(ordered),
+                'statuses': {str(code): count for code, count in sorted(self.statuses[name].items())},
+                **{outcome: self.outcomes[name][outcome] for outcome in ('succeeded', 'failed')
+                   if name in self.outcomes},
+                'p50_ms': round(pick(0.50), 3),
+                'p95_ms': round(pick(0.95), 3),
+                'p99_ms': round(pick(0.99), 3),
+                'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+                'throughput_rps': round(len(ordered) / wall_times[name], 1) if wall_times.get(name) else None,
+            }
+        return endpoints
+
+
+def run(args):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    CONFIG["database"]["name"] = path
+    # Every simulated user shares one address; measure the app, not the rate limits
+    CONFIG["admission"]["enabled"] = "false"
+    password = 'benchmark'
+    fleet = seed(path, args.bikes, args.reservations, args.users, password)
+
+    from app import app
+
+    server = None
+    if args.mode == 'server':
+        server, base_url = start_server(app)
+        make_session = lambda: HttpSession(base_url)
+    else:
+        make_session = lambda: TestClientSession(app)
+
+    recorder = Recorder()
+    wall_times = {}
+    rng = random.Random(args.seed)
+    booking_base = date.today() + timedelta(days=30)
+    counter = iter(range(10 ** 9))
+    counter_lock = threading.Lock()
+
+    def window():
+        # Spread bookings so most of them land on free dates
+        with counter_lock:
+            n = next(counter)
+        start = booking_base + timedelta(days=(n * 7) % 690)
+        return rng.randrange(1, fleet + 1), start.isoformat(), (start + timedelta(days=2)).isoformat()
+
+    sessions = []
+    for i in range(args.concurrency):
+        session = make_session()
+        session.request('POST', '/api/user/login', json_body={'username': f'user{i % args.users}', 'password': password})
+        session.request('POST', '/login/', form={'username': f'user{i % args.users}', 'password': password})
+        sessions.append(session)
+
+    booked = defaultdict(list)
+
+    def paid(location):
+        return urllib.parse.urlsplit(location or '').path == '/thank_you'
+
+    def scenario_job(name, worker, iteration):
+        session = sessions[worker]
+        if name == 'login':
+            user = f'user{(worker + iteration * args.concurrency) % args.users}'
+            recorder.timed(name, session, 'POST', '/api/user/login',
+                           json_body={'username': user, 'password': password})
+        elif name == 'catalog':
+            recorder.timed(name, session, 'GET', '/api/bikes')
+        elif name == 'availability':
+            start = booking_base + timedelta(days=rng.randrange(300))
+            recorder.timed(name, session, 'GET',
+                           f'/api/bikes/available?start={start}&end={start + timedelta(days=3)}')
+        elif name == 'booking':
+            bike_id, start, end = window()
+            status, body = recorder.timed(name, session, 'POST', '/api/reservations',
+                                          json_body={'bike_id': bike_id, 'start_date': start, 'end_date': end})
+            if status == 200:
+                booked[worker].append(json.loads(body)['reservation_id'])
+        elif name == 'payment':
+            bike_id, start, end = window()
+            session.request('GET', f'/payment?bike_id={bike_id}&start_date={start}&end_date={end}')
+            # Both outcomes are 302s: to /thank_you once paid, back to /bikes on failure
+            recorder.timed(name, session, 'POST', '/payment',
+                           succeeded=lambda status, location: status == 302 and paid(location))
+        elif name == 'cancel':
+            if booked[worker]:
+                recorder.timed(name, session, 'DELETE', f'/api/reservations/{booked[worker].pop()}')
+
+    def worker_loop(name, worker):
+        for iteration in range(args.requests // args.concurrency):
+            scenario_job(name, worker, iteration)
+
+    for name in args.scenarios:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(executor.map(lambda worker: worker_loop(name, worker), range(args.concurrency)))
+        wall_times[name] = time.perf_counter() - started
+
+    if server is not None:
+        server.shutdown()
+    from database import pool
+    from ledger import ledger
+    from lifecycle import scheduler
+    ledger.close()
+    scheduler.stop()
+    pool.close_all()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    return {
+        'config': {
+            'mode': args.mode,
+            'bikes': fleet,
+            'reservations': args.reservations,
+            'users': args.users,
+            'concurrency': args.concurrency,
+            'requests_per_scenario': args.requests,
+        },
+        'endpoints': recorder.report(wall_times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=['client', 'server'], default='client')
+    parser.add_argument('--bikes', type=int, default=200)
+    parser.add_argument('--reservations', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=400, help='requests per scenario')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    # Seeding and the app log to stdout; keep it clean for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""Compare bytes and CPU per API listing response with the old encoding path.
+
+The old path is one dict per row serialised by Flask's default jsonify,
+sent uncompressed. It is timed against rows encoded straight from the
+cursor, with the stdlib template and with orjson when it is installed,
+each sent as is, gzipped and deflated. Every path includes the query.
+Run from the repository root:
+
+    python -m benchmarks.responses --reservations 500 --bikes 500
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from config import CONFIG
+
+
+def seed(path, bikes, reservations):
+    from create_db_bikes import BikesDB
+    conn = sqlite3.connect(path)
+    BikesDB.migrate(conn)
+    rng = random.Random(1)
+    conn.executemany(BikesDB.INSERT_Bikes, [
+        (*rng.choice(BikesDB.sample_Bikes)[:4], 'Available', rng.choice(BikesDB.sample_Bikes)[5])
+        for _ in range(bikes)
+    ])
+    first_day = date(2025, 1, 1)
+    rows = []
+    for n in range(reservations):
+        start = first_day + timedelta(days=3 * n)
+        end = start + timedelta(days=2)
+        rows.append((rng.randrange(1, bikes + 1), 1, start.isoformat(), end.isoformat(),
+                     round(rng.uniform(60, 600), 2), 'confirmed', start.toordinal(), end.toordinal() + 1))
+    conn.executemany('''
+        INSERT INTO reservations (bike_id, user_id, start_date, end_date, total_cost, status, start_day, end_day)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+    conn.commit()
+    conn.close()
+
+
+def measure(fn, repeat):
+    body = fn()
+    started = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return {'bytes': len(body), 'cpu_us': round((time.process_time() - started) / repeat * 1e6)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reservations', type=int, default=500)
+    parser.add_argument('--bikes', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    CONFIG["database"]["name"] = path
+    seed(path, args.bikes, args.reservations)
+
+    from flask import Flask
+    from flask.json.provider import DefaultJSONProvider
+
+    import encoding
+    from assets import manifest
+    from database import pool
+    from listing import MAX_PAGE_SIZE, list_bikes, list_reservations
+
+    # Flask's own provider, as every API response used before
+    baseline_app = Flask(__name__)
+    jsonify = DefaultJSONProvider(baseline_app).response
+    listings = {
+        'reservations': lambda conn: list_reservations(
+            conn, 1, {'limit': str(min(args.reservations, MAX_PAGE_SIZE))})[0],
+        'bikes': lambda conn: list_bikes(conn, {'limit': str(min(args.bikes, MAX_PAGE_SIZE))})[0],
+    }
+
+    def as_dicts(rows):
+        objects = [dict(zip(rows.columns, row)) for row in rows.rows]
+        if rows.expand:
+            objects = [manifest.resolve_bike(obj) for obj in objects]
+        return objects
+
+    orjson = encoding.orjson
+    encoders = [('template', None)] + ([('orjson', orjson)] if orjson is not None else [])
+    conn = pool.acquire()
+    try:
+        for name, listing in listings.items():
+            print(f"{name} ({len(listing(conn))} rows)")
+            results = {'dicts + jsonify': measure(lambda: jsonify(as_dicts(listing(conn))).get_data(), args.repeat)}
+            for encoder, module in encoders:
+                encoding.orjson = module
+                results[encoder] = measure(lambda: listing(conn).encode(), args.repeat)
+                for coding in encoding.CODINGS:
+                    results[f'{encoder} + {coding}'] = measure(
+                        lambda: encoding.compressor.compress(listing(conn).encode(), coding), args.repeat)
+            encoding.orjson = orjson
+
+            baseline = results['dicts + jsonify']
+            for path_name, result in results.items():
+                print(f"  {path_name:<20} {result['bytes']:>9,} bytes {result['bytes'] / baseline['bytes']:>6.1%}"
+                      f"  {result['cpu_us']:>7,} us CPU {result['cpu_us'] / baseline['cpu_us']:>6.1%}")
+    finally:
+        pool.release(conn)
+        pool.close_all()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""Time /api/bikes/search query shapes against a large synthetic fleet.
+
+Seeds a throwaway database through bulk_load, so the search index is
+built the same way as for a real import, then reports per-query latency
+as JSON. A LIKE scan over the same columns is timed as a baseline.
+Run from the repository root:
+
+    python -m benchmarks.search --bikes 100000
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+from config import CONFIG
+
+BRANDS = ['Honda', 'Yamaha', 'Kawasaki', 'Suzuki', 'Ducati', 'BMW', 'Triumph', 'KTM', 'Harley-Davidson',
+          'Indian', 'Aprilia', 'Moto Guzzi', 'Royal Enfield', 'Husqvarna', 'Benelli', 'MV Agusta']
+TYPES = ['Cruiser', 'Sport Bike', 'Naked Bike', 'Adventure Bike', 'Touring', 'Scrambler', 'Enduro']
+MODEL_WORDS = ['Africa', 'Twin', 'Street', 'Triple', 'Tracer', 'Scout', 'Bobber', 'Ninja', 'Panigale',
+               'Monster', 'Duke', 'Super', 'Adventure', 'Bonneville', 'Classic', 'Sport', 'Rally', 'Tenere']
+
+QUERIES = {
+    'one_term': {'q': 'honda'},
+    'two_terms': {'q': 'honda adventure'},
+    'prefix': {'q': 'tri'},
+    'term_and_facet_filter': {'q': 'street', 'type': 'Naked Bike', 'price_max': '120'},
+    'filters_only': {'brand': 'Ducati', 'price_min': '80'},
+    'no_match': {'q': 'zzzz'},
+    'whole_fleet': {},
+}
+
+
+def records(count, rng):
+    for i in range(count):
+        yield {
+            'Brand': rng.choice(BRANDS),
+            'model': f'{rng.choice(MODEL_WORDS)} {rng.choice(MODEL_WORDS)} {rng.randrange(100, 1300)}',
+            'type': rng.choice(TYPES),
+            'price': round(rng.uniform(40, 200), 2),
+            'status': 'Available',
+        }
+
+
+def like_baseline(conn, q, limit):
+    where = ' AND '.join('(Brand LIKE ? OR model LIKE ? OR type LIKE ?)' for _ in q.split())
+    params = [f'%{term}%' for term in q.split() for _ in range(3)]
+    rows = conn.execute(f'SELECT * FROM bikes WHERE {where} ORDER BY id LIMIT ?', params + [limit]).fetchall()
+    facets = conn.execute(f'SELECT type, COUNT(*) FROM bikes WHERE {where} GROUP BY type', params).fetchall()
+    return rows, facets
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 3)
+    return {'p50_ms': pick(0.50), 'p95_ms': pick(0.95)}, result
+
+
+def run(args):
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    CONFIG["database"]["name"] = path
+
+    import bulk_load
+    from search import search_bikes
+
+    conn = sqlite3.connect(path)
+    started = time.perf_counter()
+    bulk_load.load(conn, 'bikes', records(args.bikes, random.Random(args.seed)))
+    load_seconds = time.perf_counter() - started
+    conn.close()
+
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        report = {}
+        for name, query in QUERIES.items():
+            query = dict(query, limit=str(args.limit))
+            stats, result = timed(lambda: search_bikes(conn, query), args.repeat)
+            stats['total'] = result['total']
+            if result['next_cursor']:
+                # Second page through the keyset cursor
+                page_two = dict(query, after=result['next_cursor'])
+                stats['page_two'] = timed(lambda: search_bikes(conn, page_two), args.repeat)[0]
+            report[name] = stats
+        report['like_baseline_two_terms'] = timed(
+            lambda: like_baseline(conn, 'honda adventure', args.limit), args.repeat)[0]
+    finally:
+        conn.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    return {
+        'config': {'bikes': args.bikes, 'limit': args.limit, 'repeat': args.repeat},
+        'load_seconds': round(load_seconds, 2),
+        'queries': report,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bikes', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    # bulk_load prints progress; keep stdout for the JSON report
+    with contextlib.redirect_stdout(sys.stderr):
+        report = run(args)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
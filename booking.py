@@ -0,0 +1,332 @@
+import sqlite3
+from datetime import datetime
+
+from availability import day_range, find_conflicts, is_available
+from ledger import ledger
+from lifecycle import scheduler
+from occupancy import occupancy
+from pricing import pricing
+
+
+MAX_BATCH_ITEMS = 200
+
+
+class BookingError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _parse_dates(start_date, end_date):
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise BookingError('Invalid date format')
+    if start > end:
+        raise BookingError('Invalid date range')
+    try:
+        pricing.check(*day_range(start, end))
+    except ValueError as e:
+        raise BookingError(str(e))
+    return start, end
+
+
+def _record(conn, user_id, bike_id, start_date, end_date, start, end, payment_method, idempotency_key):
+    """Run the booking statements inside the caller's write transaction."""
+    start_day, end_day = day_range(start, end)
+    if idempotency_key:
+        existing = conn.execute('''
+            SELECT r.id, r.bike_id, r.total_cost, p.id AS payment_id
+            FROM reservations r
+            LEFT JOIN payments p ON p.reservation_id = r.id
+            WHERE r.user_id = ? AND r.idempotency_key = ?
+        ''', (user_id, idempotency_key)).fetchone()
+        if existing:
+            return {
+                'reservation_id': existing['id'],
+                'bike_id': existing['bike_id'],
+                'total_cost': existing['total_cost'],
+                'payment_id': existing['payment_id'],
+                'replayed': True,
+            }
+
+    bike = conn.execute('SELECT id, price, type, status FROM bikes WHERE id = ?', (bike_id,)).fetchone()
+    if not bike or bike['status'] == 'Maintenance':
+        raise BookingError('Bike not found or not available', 404)
+
+    if not is_available(conn, bike['id'], start, end):
+        raise BookingError('Bike is already reserved for these dates')
+
+    total_cost = pricing.quote(bike['price'], bike['type'], start_day, end_day)
+    cursor = conn.execute('''
+        INSERT INTO reservations
+        (bike_id, user_id, start_date, end_date, total_cost, status, start_day, end_day, idempotency_key)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (bike['id'], user_id, start_date, end_date, total_cost,
+          'confirmed' if payment_method else 'pending',
+          start_day, end_day, idempotency_key))
+    reservation_id = cursor.lastrowid
+
+    payment_id = None
+    if payment_method:
+        cursor = conn.execute('''
+            INSERT INTO payments
+            (reservation_id, amount, payment_status, payment_method)
+            VALUES (?, ?, ?, ?)
+        ''', (reservation_id, total_cost, 'completed', payment_method))
+        payment_id = cursor.lastrowid
+
+    conn.execute('''
+        INSERT INTO user_latest_reservation (user_id, reservation_id) VALUES (?, ?)
+        ON CONFLICT (user_id) DO UPDATE SET reservation_id = excluded.reservation_id
+    ''', (user_id, reservation_id))
+    return {
+        'reservation_id': reservation_id,
+        'bike_id': bike['id'],
+        'total_cost': total_cost,
+        'payment_id': payment_id,
+        'replayed': False,
+    }
+
+
+def _booked(result, start, end):
+    if not result['replayed']:
+        start_day, end_day = day_range(start, end)
+        occupancy.mark(result['bike_id'], start_day, end_day)
+        scheduler.notify(result['bike_id'], start_day, end_day)
+    return result
+
+
+def book(conn, user_id, bike_id, start_date, end_date, payment_method=None, idempotency_key=None):
+    """Book a bike in one IMMEDIATE transaction.
+
+    The conflict check, reservation insert and optional payment insert
+    all happen under the write lock, so concurrent bookings for the same
+    bike cannot both succeed. ``bikes.status`` is left to the lifecycle
+    scheduler, which flips it when the rental actually starts. Retrying with the same
+    ``idempotency_key`` returns the original booking instead of a new one.
+    """
+    start, end = _parse_dates(start_date, end_date)
+
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+    except sqlite3.OperationalError:
+        raise BookingError('Booking system busy, please retry', 503)
+
+    try:
+        result = _record(conn, user_id, bike_id, start_date, end_date, start, end,
+                         payment_method, idempotency_key)
+        if result['replayed']:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return _booked(result, start, end)
+
+
+def checkout(user_id, bike_id, start_date, end_date, payment_method, idempotency_key=None):
+    """Book and pay through the payment ledger's group commit.
+
+    Same checks and result as ``book``, but the statements run on the
+    ledger's writer thread alongside other checkouts and this returns once
+    their shared commit is durable.
+    """
+    start, end = _parse_dates(start_date, end_date)
+    future = ledger.submit(_record, user_id, bike_id, start_date, end_date, start, end,
+                           payment_method, idempotency_key)
+    try:
+        result = future.result(timeout=ledger.ack_timeout)
+    except TimeoutError:
+        # It may still commit; a retry with the same idempotency key finds it
+        raise BookingError('Payment is still being recorded, please retry', 503)
+    except sqlite3.OperationalError:
+        raise BookingError('Booking system busy, please retry', 503)
+    return _booked(result, start, end)
+
+
+def _batch_items(items):
+    """Parse batch items; return ``(windows, errors)`` keyed by item index."""
+    if not isinstance(items, list) or not items:
+        raise BookingError('items must be a non-empty list')
+    if len(items) > MAX_BATCH_ITEMS:
+        raise BookingError(f'At most {MAX_BATCH_ITEMS} items per batch')
+    windows = {}
+    errors = {}
+    for index, item in enumerate(items):
+        try:
+            bike_id = int(item['bike_id'])
+            start, end = _parse_dates(item['start_date'], item['end_date'])
+        except BookingError as e:
+            errors[index] = e.message
+        except (KeyError, TypeError, ValueError):
+            errors[index] = 'Missing required fields'
+        else:
+            windows[index] = (bike_id, item['start_date'], item['end_date'], start, end)
+    return windows, errors
+
+
+def book_many(conn, user_id, items, best_effort=False, payment_method=None, idempotency_key=None):
+    """Book several ``{'bike_id', 'start_date', 'end_date'}`` items in one transaction.
+
+    Every item is checked against existing reservations with one
+    ``find_conflicts`` query and against the other items in the batch,
+    then priced together. Unless ``best_effort`` is set, any rejected item
+    means nothing is booked. Items get the idempotency keys
+    ``<idempotency_key>:<index>``, so a retried batch returns what the
+    first attempt booked.
+
+    No money is taken here, so a ``payment_method`` only records pending
+    payments, and the reservations stay pending until checkout settles them.
+    """
+    windows, errors = _batch_items(items)
+    keys = [f'{idempotency_key}:{index}' for index in range(len(items))] if idempotency_key else None
+
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+    except sqlite3.OperationalError:
+        raise BookingError('Booking system busy, please retry', 503)
+
+    try:
+        if keys:
+            existing = conn.execute(f'''
+                SELECT r.id, r.bike_id, r.start_date, r.end_date, r.total_cost, r.idempotency_key,
+                       p.id AS payment_id
+                FROM reservations r
+                LEFT JOIN payments p ON p.reservation_id = r.id
+                WHERE r.user_id = ? AND r.idempotency_key IN ({', '.join('?' * len(keys))})
+            ''', (user_id, *keys)).fetchall()
+            if existing:
+                conn.rollback()
+                return {
+                    'reservations': [{
+                        'index': int(row['idempotency_key'].rsplit(':', 1)[1]),
+                        'reservation_id': row['id'],
+                        'bike_id': row['bike_id'],
+                        'start_date': row['start_date'],
+                        'end_date': row['end_date'],
+                        'total_cost': row['total_cost'],
+                        'payment_id': row['payment_id'],
+                    } for row in existing],
+                    'errors': [],
+                    'replayed': True,
+                }
+
+        bikes = {row['id']: row for row in conn.execute(f'''
+            SELECT id, price, type, status FROM bikes WHERE id IN ({', '.join('?' * len(windows))})
+        ''', [window[0] for window in windows.values()])} if windows else {}
+        order = sorted(windows)
+        conflicts = find_conflicts(conn, [windows[index][0:1] + windows[index][3:5] for index in order])
+
+        accepted = []
+        booked_days = {}
+        for index, conflict in zip(order, conflicts):
+            bike_id, start_date, end_date, start, end = windows[index]
+            start_day, end_day = day_range(start, end)
+            bike = bikes.get(bike_id)
+            if not bike or bike['status'] == 'Maintenance':
+                errors[index] = 'Bike not found or not available'
+            elif conflict or any(start_day < other_end and end_day > other_start
+                                 for other_start, other_end in booked_days.get(bike_id, ())):
+                errors[index] = 'Bike is already reserved for these dates'
+            else:
+                booked_days.setdefault(bike_id, []).append((start_day, end_day))
+                accepted.append((index, bike, start_date, end_date, start_day, end_day))
+
+        if not accepted or (errors and not best_effort):
+            conn.rollback()
+            return {
+                'reservations': [],
+                'errors': [{'index': index, 'error': message} for index, message in sorted(errors.items())],
+                'replayed': False,
+            }
+
+        costs = pricing.quote_many([(bike['price'], bike['type'], start_day, end_day)
+                                    for _, bike, _, _, start_day, end_day in accepted])
+        # The write lock is held, so every id above this one is from this batch
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM reservations').fetchone()[0]
+        conn.executemany('''
+            INSERT INTO reservations
+            (bike_id, user_id, start_date, end_date, total_cost, status, start_day, end_day, idempotency_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(bike['id'], user_id, start_date, end_date, cost, 'pending',
+               start_day, end_day, keys[index] if keys else None)
+              for (index, bike, start_date, end_date, start_day, end_day), cost in zip(accepted, costs)])
+        reservation_ids = [row[0] for row in conn.execute(
+            'SELECT id FROM reservations WHERE id > ? ORDER BY id', (last_id,))]
+
+        payment_ids = [None] * len(accepted)
+        if payment_method:
+            last_payment = conn.execute('SELECT COALESCE(MAX(id), 0) FROM payments').fetchone()[0]
+            conn.executemany('''
+                INSERT INTO payments
+                (reservation_id, amount, payment_status, payment_method)
+                VALUES (?, ?, ?, ?)
+            ''', [(reservation_id, cost, 'pending', payment_method)
+                  for reservation_id, cost in zip(reservation_ids, costs)])
+            payment_ids = [row[0] for row in conn.execute(
+                'SELECT id FROM payments WHERE id > ? ORDER BY id', (last_payment,))]
+
+        conn.execute('''
+            INSERT INTO user_latest_reservation (user_id, reservation_id) VALUES (?, ?)
+            ON CONFLICT (user_id) DO UPDATE SET reservation_id = excluded.reservation_id
+        ''', (user_id, reservation_ids[-1]))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    reservations = []
+    for (index, bike, start_date, end_date, start_day, end_day), cost, reservation_id, payment_id in zip(
+            accepted, costs, reservation_ids, payment_ids):
+        occupancy.mark(bike['id'], start_day, end_day)
+        scheduler.notify(bike['id'], start_day, end_day)
+        reservations.append({
+            'index': index,
+            'reservation_id': reservation_id,
+            'bike_id': bike['id'],
+            'start_date': start_date,
+            'end_date': end_date,
+            'total_cost': cost,
+            'payment_id': payment_id,
+        })
+    return {
+        'reservations': reservations,
+        'errors': [{'index': index, 'error': message} for index, message in sorted(errors.items())],
+        'replayed': False,
+    }
+
+
+def cancel(conn, user_id, reservation_id):
+    reservation = conn.execute('''
+        SELECT bike_id, start_date
+        FROM reservations
+        WHERE id = ? AND user_id = ?
+    ''', (reservation_id, user_id)).fetchone()
+    if not reservation:
+        raise BookingError('Reservation not found', 404)
+
+    # Cancellation is not allowed on the day of the rental
+    start_date = datetime.strptime(reservation['start_date'], '%Y-%m-%d')
+    if (start_date - datetime.now()).days < 1:
+        raise BookingError('Cannot cancel reservation on same day')
+
+    try:
+        conn.execute('DELETE FROM reservations WHERE id = ?', (reservation_id,))
+        conn.execute('''
+            DELETE FROM user_latest_reservation WHERE user_id = ? AND reservation_id = ?
+        ''', (user_id, reservation_id))
+        conn.execute('''
+            INSERT OR IGNORE INTO user_latest_reservation (user_id, reservation_id)
+            SELECT user_id, MAX(id) FROM reservations WHERE user_id = ? GROUP BY user_id
+        ''', (user_id,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    occupancy.refresh_bike(conn, reservation['bike_id'])
+    scheduler.notify(reservation['bike_id'])
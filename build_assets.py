@@ -0,0 +1,127 @@
+"""Build resized, WebP and content-hashed copies of the static assets.
+
+    python build_assets.py
+
+Every image under static/images gets a re-encoded full-size copy plus
+catalog thumbnails at 1x and 2x, each as JPEG and WebP. Stylesheets are
+rewritten to point at the hashed images and stored with a gzip sibling.
+Outputs go to static/build/ next to a manifest.json that assets.py reads;
+outputs are never overwritten, so pages cached from the previous build
+keep working while a new one rolls out.
+"""
+import argparse
+import gzip
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import re
+import sys
+
+from assets import BUILD_DIR, BUILD_URL, MANIFEST_PATH
+
+IMAGE_DIR = os.path.join('static', 'images')
+CSS_DIR = os.path.join('static', 'CSS')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+# Catalog cards render images at this size
+THUMBNAIL_SIZE = (300, 200)
+MAX_WIDTH = 1600
+CSS_URL = re.compile(r"""url\((['"]?)(/static/[^'")]+)\1\)""")
+
+
+def slugify(name):
+    return re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-') or 'asset'
+
+
+def emit(data, stem, extension, compress=False):
+    """Write ``data`` under a content-hashed name and return its URL."""
+    name = f'{stem}.{hashlib.sha256(data).hexdigest()[:12]}.{extension}'
+    path = os.path.join(BUILD_DIR, name)
+    if not os.path.exists(path):
+        with open(path, 'wb') as f:
+            f.write(data)
+    if compress and not os.path.exists(path + '.gz'):
+        packed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(packed) < len(data):
+            with open(path + '.gz', 'wb') as f:
+                f.write(packed)
+    return BUILD_URL + name
+
+
+def encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def build_image(path, stem, quality):
+    from PIL import Image, ImageOps
+
+    with Image.open(path) as source:
+        image = ImageOps.exif_transpose(source).convert('RGB')
+
+    def variants(img, suffix):
+        return (
+            emit(encode(img, 'JPEG', quality=quality, optimize=True, progressive=True), stem + suffix, 'jpg'),
+            emit(encode(img, 'WEBP', quality=quality, method=6), stem + suffix, 'webp'),
+        )
+
+    full = image.copy()
+    full.thumbnail((MAX_WIDTH, MAX_WIDTH * 4), Image.LANCZOS)
+    full_jpeg, _ = variants(full, '')
+
+    width, height = THUMBNAIL_SIZE
+    thumbnails = {'width': width, 'height': height}
+    for scale, key in ((1, ''), (2, '_2x')):
+        size = (width * scale, height * scale)
+        thumbnail = ImageOps.fit(image, size, Image.LANCZOS)
+        thumbnails['jpeg' + key], thumbnails['webp' + key] = variants(thumbnail, f'-{size[0]}x{size[1]}')
+    return full_jpeg, thumbnails
+
+
+def build(quality=82):
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    manifest = {'files': {}, 'images': {}}
+
+    for name in sorted(os.listdir(IMAGE_DIR)):
+        stem, extension = os.path.splitext(name)
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+        logical = f'/static/images/{name}'
+        manifest['files'][logical], manifest['images'][logical] = build_image(
+            os.path.join(IMAGE_DIR, name), slugify(stem), quality)
+
+    for name in sorted(os.listdir(CSS_DIR)):
+        stem, extension = os.path.splitext(name)
+        if extension.lower() != '.css':
+            continue
+        with open(os.path.join(CSS_DIR, name), encoding='utf-8') as f:
+            css = f.read()
+        css = CSS_URL.sub(lambda m: f"url('{manifest['files'].get(m.group(2), m.group(2))}')", css)
+        manifest['files'][f'/static/CSS/{name}'] = emit(css.encode(), slugify(stem), 'css', compress=True)
+
+    # Swap the manifest in atomically so running servers never read half a file
+    temporary = MANIFEST_PATH + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temporary, MANIFEST_PATH)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quality', type=int, default=82, help='JPEG/WebP quality (1-100)')
+    args = parser.parse_args()
+
+    if importlib.util.find_spec('PIL') is None:
+        print("Building image variants needs Pillow: pip install Pillow")
+        return 1
+    manifest = build(args.quality)
+    print(f"Built {len(manifest['images'])} images and {len(manifest['files']) - len(manifest['images'])} "
+          f"stylesheets into {BUILD_DIR}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import threading
+
+from assets import manifest
+
+
+def log_gap(conn, seen):
+    """Whether entries after version ``seen`` may be missing from the ``changes`` log.
+
+    The lifecycle scheduler trims the log from its oldest end, so a reader
+    that fell further behind than the retained window cannot replay it.
+    Neither can one whose version is past the log's newest entry, e.g.
+    after the database was restored. Either has to reload in full.
+    """
+    oldest, newest = conn.execute('SELECT MIN(version), MAX(version) FROM changes').fetchone()
+    if oldest is None:
+        return seen > 0
+    return seen < oldest - 1 or seen > newest
+
+
+class CatalogCache:
+    """Pre-serialised JSON for the bike catalog, rebuilt only after writes.
+
+    Writes to ``bikes`` from any process are logged to the ``changes``
+    table by triggers. ``sync`` reads the log past ``version`` and drops
+    the snapshot when a bike changed, so each worker sees the others'
+    writes. Versions come from that table, so they are shared by every
+    worker and survive restarts.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def sync(self, conn):
+        seen = self.version or 0
+        if log_gap(conn, seen):
+            # Trimmed entries may have been bike writes: rebuild from the table
+            latest = conn.execute('SELECT COALESCE(MAX(version), 0) FROM changes').fetchone()[0]
+            with self._lock:
+                self.version = latest
+                self._snapshot = None
+            return
+        latest, bikes_changed = conn.execute('''
+            SELECT MAX(version), MAX(source = 'bikes') FROM changes WHERE version > ?
+        ''', (seen,)).fetchone()
+        with self._lock:
+            if latest is not None and latest > (self.version or 0):
+                self.version = latest
+                if bikes_changed:
+                    self._snapshot = None
+            elif self.version is None:
+                self.version = seen
+
+    def get(self, conn):
+        self.sync(conn)
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        version = self.version
+        bikes = [manifest.resolve_bike(dict(bike)) for bike in conn.execute('SELECT * FROM bikes ORDER BY id')]
+        body = json.dumps(bikes, sort_keys=True, separators=(',', ':')).encode()
+        snapshot = {
+            'version': version,
+            'body': body,
+            'etag': hashlib.sha256(body).hexdigest()[:32],
+            'rows': bikes,
+            'bikes': {
+                bike['id']: json.dumps(bike, sort_keys=True, separators=(',', ':')).encode()
+                for bike in bikes
+            },
+            'fragments': {},
+        }
+        with self._lock:
+            if self.version == version:
+                self._snapshot = snapshot
+        return snapshot
+
+    def fragment(self, conn, name, render):
+        """Return ``(version, render(rows))``, cached until the next write."""
+        snapshot = self.get(conn)
+        fragments = snapshot['fragments']
+        if name not in fragments:
+            fragments[name] = render(snapshot['rows'])
+        return snapshot['version'], fragments[name]
+
+    def changes(self, conn, since):
+        """Return the bikes written after version ``since``.
+
+        ``reset`` is true, and ``bikes`` holds the whole catalog, when
+        ``since`` is unknown, older than the retained log, or a bulk write
+        did not say which bikes it touched.
+        """
+        snapshot = self.get(conn)
+        version = snapshot['version']
+        if since == version:
+            return {'version': version, 'reset': False, 'bikes': [], 'deleted': []}
+        changed = {row[0] for row in conn.execute('''
+            SELECT DISTINCT bike_id FROM changes WHERE source = 'bikes' AND version > ? AND version <= ?
+        ''', (since, version))}
+        if since > version or log_gap(conn, since) or None in changed:
+            return {'version': version, 'reset': True, 'bikes': snapshot['rows'], 'deleted': []}
+        by_id = {bike['id']: bike for bike in snapshot['rows']}
+        return {
+            'version': version,
+            'reset': False,
+            'bikes': [by_id[bike_id] for bike_id in sorted(changed) if bike_id in by_id],
+            'deleted': sorted(bike_id for bike_id in changed if bike_id not in by_id),
+        }
+
+
+catalog = CatalogCache()
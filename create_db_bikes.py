@@ -1,3 +1,4 @@
+import re
 import sqlite3
 import sys
 
@@ -6,27 +7,51 @@ from config import CONFIG
 class BikesDB:
     @staticmethod
     def initialize(database_connection: sqlite3.Connection):
+        print("Applying schema migrations...")
+        version = BikesDB.migrate(database_connection)
+        print(f"Schema is at version {version}")
+
+        cursor = database_connection.cursor()
+        if cursor.execute("SELECT COUNT(*) FROM bikes").fetchone()[0] == 0:
+            print("Populating database with sample data...")
+            cursor.executemany(BikesDB.INSERT_Bikes, BikesDB.sample_Bikes)
+            database_connection.commit()
+
+    @staticmethod
+    def migrate(database_connection: sqlite3.Connection):
+        """Apply pending MIGRATIONS, tracking progress in PRAGMA user_version.
+
+        Each migration runs in its own IMMEDIATE transaction, so concurrent
+        starters cannot apply the same step twice. Tables are never dropped.
+        """
         cursor = database_connection.cursor()
-        try:
-            print("Dropping existing tables(if present)...")
-            cursor.execute("DROP TABLE IF EXISTS users")
-            cursor.execute("DROP TABLE IF EXISTS bikes")
-            cursor.execute("DROP TABLE IF EXISTS reservations")
-            cursor.execute("DROP TABLE IF EXISTS payments")
-        except sqlite3.OperationalError as db_error:
-            print(f"unable to drop table. Error: {db_error}")
-        print("Creating tables...")
-        cursor.execute(BikesDB.CREATE_TABLE_USERS)
-        cursor.execute(BikesDB.CREATE_TABLE_BIKES)
-        cursor.execute(BikesDB.CREATE_TABLE_RESERVATIONS)
-        cursor.execute(BikesDB.CREATE_TABLE_PAYMENTS)
-        database_connection.commit()
-
-        print("Populating database with sample data...")
-        cursor.executemany(BikesDB.INSERT_Bikes, BikesDB.sample_Bikes)
-        database_connection.commit()
-    
-    
+        while True:
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                version = cursor.execute("PRAGMA user_version").fetchone()[0]
+                if version >= len(BikesDB.MIGRATIONS):
+                    database_connection.rollback()
+                    return version
+                for statement in BikesDB.MIGRATIONS[version]:
+                    if not BikesDB._column_exists(cursor, statement):
+                        cursor.execute(statement)
+                cursor.execute(f"PRAGMA user_version = {version + 1}")
+                database_connection.commit()
+            except Exception:
+                database_connection.rollback()
+                raise
+
+    @staticmethod
+    def _column_exists(cursor, statement):
+        # Lets ADD COLUMN steps run against databases that already have the column
+        match = BikesDB.ADD_COLUMN.match(statement.strip())
+        if not match:
+            return False
+        table, column = match.groups()
+        return column in [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+
+    ADD_COLUMN = re.compile(r"ALTER TABLE (\w+) ADD COLUMN (\w+)", re.IGNORECASE)
+
     CREATE_TABLE_USERS = """
     CREATE TABLE IF NOT EXISTS users (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -55,6 +80,9 @@ class BikesDB:
         total_cost REAL NOT NULL,
         status TEXT DEFAULT 'pending',
         created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        start_day INTEGER,
+        end_day INTEGER,
+        idempotency_key TEXT,
         FOREIGN KEY (bike_id) REFERENCES bikes (id),
         FOREIGN KEY (user_id) REFERENCES users (id)
     )"""
@@ -70,6 +98,118 @@ class BikesDB:
         FOREIGN KEY (reservation_id) REFERENCES reservations (id)
     )"""
 
+    # start_day/end_day are date ordinals; end_day is exclusive (end_date + 1)
+    BACKFILL_RESERVATION_DAYS = """
+    UPDATE reservations SET
+        start_day = CAST(julianday(start_date) - 1721424.5 AS INTEGER),
+        end_day = CAST(julianday(end_date) - 1721424.5 AS INTEGER) + 1
+    WHERE start_day IS NULL OR end_day IS NULL"""
+
+    CREATE_TABLE_USER_LATEST_RESERVATION = """
+    CREATE TABLE IF NOT EXISTS user_latest_reservation (
+        user_id INTEGER PRIMARY KEY,
+        reservation_id INTEGER NOT NULL,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (reservation_id) REFERENCES reservations (id)
+    )"""
+
+    CREATE_TABLE_SESSIONS = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    ) WITHOUT ROWID"""
+
+    REFRESH_USER_LATEST_RESERVATION = """
+    INSERT OR REPLACE INTO user_latest_reservation (user_id, reservation_id)
+    SELECT user_id, MAX(id) FROM reservations GROUP BY user_id"""
+
+    # Every write to bikes or reservations is logged here by CHANGE_TRIGGERS,
+    # so each worker process can bring its in-memory caches up to date.
+    # A NULL bike_id means "reload everything".
+    CREATE_TABLE_CHANGES = """
+    CREATE TABLE IF NOT EXISTS changes (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        source TEXT NOT NULL,
+        bike_id INTEGER
+    )"""
+
+    CHANGE_TRIGGERS = [
+        """CREATE TRIGGER IF NOT EXISTS trg_bikes_insert AFTER INSERT ON bikes
+        BEGIN INSERT INTO changes (source, bike_id) VALUES ('bikes', NEW.id); END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_bikes_update AFTER UPDATE ON bikes
+        BEGIN INSERT INTO changes (source, bike_id) VALUES ('bikes', NEW.id); END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_bikes_delete AFTER DELETE ON bikes
+        BEGIN INSERT INTO changes (source, bike_id) VALUES ('bikes', OLD.id); END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_reservations_insert AFTER INSERT ON reservations
+        BEGIN INSERT INTO changes (source, bike_id) VALUES ('reservations', NEW.bike_id); END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_reservations_update
+        AFTER UPDATE OF bike_id, start_day, end_day ON reservations
+        BEGIN
+            INSERT INTO changes (source, bike_id) VALUES ('reservations', OLD.bike_id);
+            INSERT INTO changes (source, bike_id) VALUES ('reservations', NEW.bike_id);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_reservations_delete AFTER DELETE ON reservations
+        BEGIN INSERT INTO changes (source, bike_id) VALUES ('reservations', OLD.bike_id); END""",
+    ]
+
+    # Full-text index over the searchable bike columns. It stores no copy of
+    # the text (content='bikes'); SEARCH_TRIGGERS keep it in step with bikes.
+    CREATE_TABLE_BIKES_FTS = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS bikes_fts USING fts5(
+        Brand, model, type,
+        content='bikes', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )"""
+
+    SEARCH_TRIGGERS = [
+        """CREATE TRIGGER IF NOT EXISTS trg_bikes_fts_insert AFTER INSERT ON bikes
+        BEGIN
+            INSERT INTO bikes_fts (rowid, Brand, model, type) VALUES (NEW.id, NEW.Brand, NEW.model, NEW.type);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_bikes_fts_update AFTER UPDATE OF Brand, model, type ON bikes
+        BEGIN
+            INSERT INTO bikes_fts (bikes_fts, rowid, Brand, model, type)
+            VALUES ('delete', OLD.id, OLD.Brand, OLD.model, OLD.type);
+            INSERT INTO bikes_fts (rowid, Brand, model, type) VALUES (NEW.id, NEW.Brand, NEW.model, NEW.type);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_bikes_fts_delete AFTER DELETE ON bikes
+        BEGIN
+            INSERT INTO bikes_fts (bikes_fts, rowid, Brand, model, type)
+            VALUES ('delete', OLD.id, OLD.Brand, OLD.model, OLD.type);
+        END""",
+    ]
+
+    REBUILD_BIKES_FTS = "INSERT INTO bikes_fts (bikes_fts) VALUES ('rebuild')"
+
+    CREATE_INDEXES = [
+        "CREATE INDEX IF NOT EXISTS idx_reservations_bike_days ON reservations (bike_id, end_day, start_day)",
+        "CREATE INDEX IF NOT EXISTS idx_reservations_user_start ON reservations (user_id, start_day, id)",
+        "CREATE INDEX IF NOT EXISTS idx_reservations_user_status ON reservations (user_id, status, start_day)",
+        "CREATE INDEX IF NOT EXISTS idx_reservations_created ON reservations (created_at, id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_reservations_idempotency ON reservations (user_id, idempotency_key) WHERE idempotency_key IS NOT NULL",
+        "CREATE INDEX IF NOT EXISTS idx_payments_reservation ON payments (reservation_id)",
+        "CREATE INDEX IF NOT EXISTS idx_bikes_type_price ON bikes (type, price)",
+        "CREATE INDEX IF NOT EXISTS idx_bikes_status ON bikes (status)",
+        "CREATE INDEX IF NOT EXISTS idx_bikes_brand ON bikes (Brand)",
+    ]
+
+    # Append only: each entry upgrades the schema by one user_version
+    MIGRATIONS = [
+        [CREATE_TABLE_USERS, CREATE_TABLE_BIKES, CREATE_TABLE_RESERVATIONS, CREATE_TABLE_PAYMENTS],
+        [
+            "ALTER TABLE reservations ADD COLUMN start_day INTEGER",
+            "ALTER TABLE reservations ADD COLUMN end_day INTEGER",
+            BACKFILL_RESERVATION_DAYS,
+        ],
+        ["ALTER TABLE reservations ADD COLUMN idempotency_key TEXT"],
+        CREATE_INDEXES,
+        [CREATE_TABLE_USER_LATEST_RESERVATION, REFRESH_USER_LATEST_RESERVATION],
+        [CREATE_TABLE_SESSIONS, "CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)"],
+        [CREATE_TABLE_CHANGES] + CHANGE_TRIGGERS,
+        [CREATE_TABLE_BIKES_FTS] + SEARCH_TRIGGERS + [REBUILD_BIKES_FTS],
+    ]
+
     INSERT_Bikes = 'INSERT INTO bikes (Brand, model, type, price, status, image_url) VALUES (?, ?, ?, ?, ?, ?)'
 
     sample_Bikes = [
@@ -0,0 +1,139 @@
+import queue
+import sqlite3
+import threading
+
+from flask import g
+
+from config import CONFIG
+import metrics
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections configured once when opened."""
+
+    def __init__(self, database, size=8, timeout=5.0, cache_size=-16000, mmap_size=268435456, busy_timeout=5000):
+        self.database = database
+        self.size = size
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+        self.stats = {'checkouts': 0, 'waits': 0, 'opened': 0}
+
+    def connect(self, synchronous='NORMAL'):
+        """Open a connection configured like the pooled ones, outside the pool."""
+        conn = sqlite3.connect(self.database, check_same_thread=False,
+                               factory=metrics.InstrumentedConnection)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={synchronous}')
+        conn.execute(f'PRAGMA cache_size={int(self.cache_size)}')
+        conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+        return conn
+
+    def acquire(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._opened < self.size:
+                    self._opened += 1
+                    self.stats['opened'] += 1
+                    opening = True
+                else:
+                    opening = False
+            if opening:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            else:
+                with self._lock:
+                    self.stats['waits'] += 1
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise sqlite3.OperationalError('Timed out waiting for a database connection')
+        with self._lock:
+            self.stats['checkouts'] += 1
+        return conn
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+            return
+        self._idle.put(conn)
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._opened -= 1
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['open'] = self._opened
+        stats['idle'] = self._idle.qsize()
+        stats['size'] = self.size
+        return stats
+
+
+def _create_pool():
+    db_config = CONFIG["database"]
+    return ConnectionPool(
+        db_config.get("name", "bikes.db"),
+        size=db_config.getint("pool_size", 8),
+        timeout=db_config.getfloat("pool_timeout", 5.0),
+        cache_size=db_config.getint("cache_size", -16000),
+        mmap_size=db_config.getint("mmap_size", 268435456),
+        busy_timeout=db_config.getint("busy_timeout", 5000),
+    )
+
+
+pool = _create_pool()
+
+
+def _pool_metrics():
+    lines = []
+    for name, value in pool.get_stats().items():
+        metric = f'db_pool_{name}_total' if name in ('checkouts', 'waits', 'opened') else f'db_pool_{name}'
+        lines.append(f'# TYPE {metric} {"counter" if metric.endswith("_total") else "gauge"}')
+        lines.append(f'{metric} {value}')
+    return lines
+
+
+metrics.collectors.append(_pool_metrics)
+
+
+def get_db():
+    """Return the connection checked out for the current app context."""
+    if 'db' not in g:
+        g.db = pool.acquire()
+    return g.db
+
+
+def close_db(exception=None):
+    conn = g.pop('db', None)
+    if conn is not None:
+        pool.release(conn)
+
+
+def init_app(app):
+    app.teardown_appcontext(close_db)
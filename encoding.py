@@ -0,0 +1,265 @@
+"""JSON bodies for API responses, and their negotiated compression.
+
+Listings are encoded straight from cursor rows: each page gets a
+``%``-template with the keys already escaped, so no per-row dict is built.
+orjson is used instead when it is installed; it only encodes mappings, so
+there each row becomes a short-lived dict built in C, which is still faster
+than the template.
+"""
+import json
+import math
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from json.encoder import encode_basestring_ascii
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import parse_accept_header
+
+from config import CONFIG
+import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CODINGS = ('gzip', 'deflate')
+
+
+def dumps(data):
+    """Encode ``data`` like ``jsonify`` outside debug mode: sorted keys, trailing newline."""
+    if orjson is not None:
+        # Dates are passed to Flask's default, which writes them as HTTP dates
+        return orjson.dumps(data, default=DefaultJSONProvider.default,
+                            option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+                            | orjson.OPT_PASSTHROUGH_DATETIME)
+    options = {'sort_keys': True, 'separators': (',', ':'), 'default': DefaultJSONProvider.default}
+    try:
+        text = json.dumps(data, allow_nan=False, **options)
+    except ValueError:
+        # NaN and infinities are not JSON; orjson writes them as null
+        text = json.dumps(_finite(data), **options)
+    return (text + '\n').encode()
+
+
+def _finite(data):
+    """``data`` with NaN and infinite floats replaced by None."""
+    if isinstance(data, float):
+        return data if math.isfinite(data) else None
+    if isinstance(data, dict):
+        return {key: _finite(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [_finite(value) for value in data]
+    return data
+
+
+def _value(value):
+    cls = value.__class__
+    if cls is str:
+        return encode_basestring_ascii(value)
+    if value is None:
+        return 'null'
+    if cls is int:
+        return repr(value)
+    if cls is float:
+        return repr(value) if math.isfinite(value) else 'null'
+    return json.dumps(value, default=DefaultJSONProvider.default)
+
+
+def _fields(fields):
+    return ','.join(f'{encode_basestring_ascii(key)}:{_value(value)}' for key, value in fields.items())
+
+
+def encode_rows(columns, rows, expand=None):
+    """Encode ``rows`` as a JSON array of objects keyed by ``columns``.
+
+    Values past ``len(columns)`` are ignored, so a query can carry extra
+    columns such as a cursor. ``expand`` maps a column to a function that
+    returns the fields replacing it, e.g. an image path and its variants;
+    it is called once per distinct value.
+    """
+    width = len(columns)
+    expand = {column: fn for column, fn in (expand or {}).items() if column in columns}
+    cache = {column: {} for column in expand}
+
+    def expanded(column, value):
+        fields = cache[column].get(value)
+        if fields is None:
+            fields = cache[column][value] = expand[column](value)
+        return fields
+
+    if orjson is not None:
+        objects = []
+        for row in rows:
+            obj = dict(zip(columns, row))
+            for column in expand:
+                obj.update(expanded(column, obj.pop(column)))
+            objects.append(obj)
+        return orjson.dumps(objects, default=DefaultJSONProvider.default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE
+                            | orjson.OPT_PASSTHROUGH_DATETIME)
+
+    template = '{' + ','.join(
+        '%s' if column in expand else f'{encode_basestring_ascii(column)}:%s' for column in columns) + '}'
+    if not expand:
+        body = ','.join([template % tuple(map(_value, row[:width])) for row in rows])
+    else:
+        fragments = {column: {} for column in expand}
+
+        def fragment(column):
+            def encode(value):
+                text = fragments[column].get(value)
+                if text is None:
+                    text = fragments[column][value] = _fields(expanded(column, value))
+                return text
+            return encode
+        encoders = [fragment(column) if column in expand else _value for column in columns]
+        body = ','.join([template % tuple([encode(value) for encode, value in zip(encoders, row)])
+                         for row in rows])
+    return f'[{body}]\n'.encode()
+
+
+class Rows:
+    """A page of query results kept as rows, with the columns they are keyed by."""
+
+    __slots__ = ('columns', 'rows', 'expand')
+
+    def __init__(self, columns, rows, expand=None):
+        self.columns = list(columns)
+        self.rows = rows
+        self.expand = expand
+
+    def __len__(self):
+        return len(self.rows)
+
+    def encode(self):
+        return encode_rows(self.columns, self.rows, self.expand)
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with compact responses encoded by ``dumps``."""
+
+    def response(self, *args, **kwargs):
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
+
+
+class Compressor:
+    """gzip or deflate for JSON bodies of at least ``min_size`` bytes.
+
+    A body sent with a strong ETag is the same bytes every time, so its
+    compressed form is kept in a small LRU keyed by ETag and coding; the
+    catalog is compressed once per change rather than once per request.
+    """
+
+    def __init__(self, min_size=1024, level=1, cache_size=32, enabled=True):
+        self.min_size = min_size
+        self.level = level
+        self.cache_size = cache_size
+        self.enabled = enabled
+        self.stats = Counter()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def applies(self, body):
+        return self.enabled and len(body) >= self.min_size
+
+    def negotiate(self, accept_encoding):
+        """Return the accepted coding with the highest quality, gzip on ties, or None."""
+        if not accept_encoding:
+            return None
+        accept = parse_accept_header(accept_encoding)
+        coding = max(CODINGS, key=accept.quality)
+        return coding if accept.quality(coding) > 0 else None
+
+    def _compress(self, body, coding):
+        if coding == 'gzip':
+            stream = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        else:
+            stream = zlib.compressobj(self.level)
+        return stream.compress(body) + stream.flush()
+
+    def compress(self, body, coding, etag=None):
+        key = (etag, coding)
+        data = None
+        if etag is not None:
+            with self._lock:
+                data = self._cache.get(key)
+                if data is not None:
+                    self._cache.move_to_end(key)
+        if data is None:
+            data = self._compress(body, coding)
+            if etag is not None:
+                with self._lock:
+                    self._cache[key] = data
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+        with self._lock:
+            self.stats[coding, 'responses'] += 1
+            self.stats[coding, 'in'] += len(body)
+            self.stats[coding, 'out'] += len(data)
+        return data
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats)
+
+
+def _create_compressor():
+    return Compressor(
+        min_size=CONFIG.getint("compression", "min_size", fallback=1024),
+        level=CONFIG.getint("compression", "level", fallback=1),
+        cache_size=CONFIG.getint("compression", "cache_size", fallback=32),
+        enabled=CONFIG.getboolean("compression", "enabled", fallback=True),
+    )
+
+
+compressor = _create_compressor()
+
+
+def _compression_metrics():
+    stats = compressor.get_stats()
+    lines = ['# TYPE api_compressed_responses_total counter']
+    for coding in CODINGS:
+        lines.append(f'api_compressed_responses_total{{coding="{coding}"}} {stats.get((coding, "responses"), 0)}')
+    lines.append('# TYPE api_compression_bytes_total counter')
+    for coding in CODINGS:
+        for stage in ('in', 'out'):
+            lines.append(f'api_compression_bytes_total{{coding="{coding}",stage="{stage}"}} '
+                         f'{stats.get((coding, stage), 0)}')
+    return lines
+
+
+metrics.collectors.append(_compression_metrics)
+
+
+def _compress_response(response):
+    if (response.direct_passthrough or response.is_streamed or response.status_code in (204, 304)
+            or response.mimetype != 'application/json' or 'Content-Encoding' in response.headers):
+        return response
+    body = response.get_data()
+    if not compressor.applies(body):
+        return response
+    response.vary.add('Accept-Encoding')
+    coding = compressor.negotiate(request.headers.get('Accept-Encoding'))
+    if coding is None:
+        return response
+    etag, weak = response.get_etag()
+    response.set_data(compressor.compress(body, coding, None if weak else etag))
+    response.headers['Content-Encoding'] = coding
+    if etag is not None:
+        # The compressed bytes differ, so the tag may only match weakly
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.json = JSONProvider(app)
+
+
+def init_blueprint(blueprint):
+    blueprint.after_request(_compress_response)
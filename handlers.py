@@ -0,0 +1,323 @@
+"""The /api handlers, shared by the Flask blueprint and the ASGI app.
+
+A handler takes a ``call`` and the route's arguments and returns a
+``Reply``. The call is the front end's view of one request:
+
+    call.args           query arguments, a werkzeug MultiDict
+    call.headers        request headers, looked up case-insensitively
+    call.json           the parsed JSON body, or None
+    call.session        the server-side session
+    call.client         the client's address
+    call.db()           a primary connection for this request
+    call.read_db()      a replica connection when one is fresh enough
+
+api.py and asgi.py only translate requests into calls and replies into
+responses. Handlers block on SQLite and password hashing, so the ASGI app
+runs them on its database executor.
+"""
+import functools
+import sqlite3
+
+from werkzeug.http import parse_etags, quote_etag
+
+from availability import day_number
+from booking import BookingError, book, book_many, cancel
+from catalog import catalog
+from export import authorized, csv_stream, ndjson_stream, parse_after
+from listing import BIKE_PARAMS, latest_reservation, list_bikes, list_reservations, reservation_payment
+from occupancy import occupancy
+from passwords import HashingBusy, LoginThrottled, hasher
+from pricing import quote_items
+from replicas import mark_write
+from search import search_bikes
+
+routes = []
+
+
+def route(method, rule, session=False):
+    """Register a handler for a werkzeug-style ``rule``.
+
+    ``session=True`` tells the ASGI app to load the session before the
+    handler runs; Flask loads it for every request.
+    """
+    def decorator(handler):
+        routes.append((method, rule, handler, session))
+        return handler
+    return decorator
+
+
+class Reply:
+    """What a handler answers: JSON ``data``, a ready ``body``, or a ``stream``.
+
+    ``stream`` is called with a read connection and yields text chunks.
+    """
+
+    __slots__ = ('data', 'status', 'headers', 'body', 'stream', 'content_type')
+
+    def __init__(self, data=None, status=200, headers=None, body=None, stream=None,
+                 content_type='application/json'):
+        self.data = data
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+        self.stream = stream
+        self.content_type = content_type
+
+
+def error(message, status, headers=None):
+    return Reply({'error': message}, status, headers)
+
+
+def retry_later(message, status, retry_after):
+    return error(message, status, {'Retry-After': str(retry_after)})
+
+
+def handle(handler, call, **kwargs):
+    """Run ``handler``; unexpected exceptions become a 500 with their message."""
+    try:
+        return handler(call, **kwargs)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+def page_reply(rows, next_cursor):
+    headers = {'X-Next-Cursor': next_cursor} if next_cursor is not None else None
+    return Reply(body=rows.encode(), headers=headers)
+
+
+@route('GET', '/api/bikes')
+def get_bikes(call):
+    # Other parameters, such as cache busters, still get the cached catalog
+    if any(name in call.args for name in BIKE_PARAMS):
+        try:
+            return page_reply(*list_bikes(call.read_db(), call.args))
+        except ValueError as e:
+            return error(str(e), 400)
+
+    # get() syncs with the changes log first, so another worker's writes
+    # are never answered with 304
+    snapshot = catalog.get(call.db())
+    # Let browsers keep the body but revalidate on every use
+    headers = {'ETag': quote_etag(snapshot['etag']), 'Cache-Control': 'no-cache'}
+    # Weak matching: a compressed catalog is sent with a weak tag
+    if parse_etags(call.headers.get('If-None-Match')).contains_weak(snapshot['etag']):
+        return Reply(status=304, headers=headers, body=b'')
+    return Reply(headers=headers, body=snapshot['body'])
+
+
+@route('GET', '/api/bikes/available')
+def get_available_bikes(call):
+    start = call.args.get('start')
+    end = call.args.get('end')
+    if not start or not end:
+        return error('Missing start or end date', 400)
+
+    try:
+        start_day = day_number(start)
+        end_day = day_number(end) + 1
+        max_price = call.args.get('max_price', type=float)
+    except ValueError:
+        return error('Invalid date format', 400)
+
+    if start_day >= end_day:
+        return error('Invalid date range', 400)
+
+    conn = call.db()
+    occupancy.ensure_current(conn)
+    return Reply(occupancy.available(conn, start_day, end_day,
+                                     bike_type=call.args.get('type'),
+                                     max_price=max_price))
+
+
+@route('GET', '/api/bikes/search')
+def search(call):
+    try:
+        return Reply(search_bikes(call.read_db(), call.args))
+    except ValueError as e:
+        return error(str(e), 400)
+
+
+@route('GET', '/api/bikes/changes')
+def get_bike_changes(call):
+    since = call.args.get('since', '')
+    if not since.isdigit():
+        return error('since must be a catalog version', 400)
+    return Reply(catalog.changes(call.db(), int(since)))
+
+
+@route('POST', '/api/quotes')
+def create_quotes(call):
+    data = call.json
+    if not data or 'items' not in data:
+        return error('Missing items', 400)
+
+    try:
+        return Reply({'quotes': quote_items(call.db(), data['items'])})
+    except ValueError as e:
+        return error(str(e), 400)
+
+
+@route('GET', '/api/bikes/<int:bike_id>')
+def get_bike(call, bike_id):
+    bike = catalog.get(call.db())['bikes'].get(bike_id)
+    if bike is None:
+        return error('Bike not found', 404)
+    return Reply(body=bike)
+
+
+@route('POST', '/api/reservations', session=True)
+def create_reservation(call):
+    if 'user_id' not in call.session:
+        return error('User not logged in', 401)
+
+    data = call.json
+    required_fields = ['bike_id', 'start_date', 'end_date']
+    if not data or not all(field in data for field in required_fields):
+        return error('Missing required fields', 400)
+
+    try:
+        result = book(call.db(), call.session['user_id'], data['bike_id'],
+                      data['start_date'], data['end_date'],
+                      idempotency_key=call.headers.get('Idempotency-Key'))
+    except BookingError as e:
+        return error(e.message, e.status)
+    mark_write(call.session)
+    return Reply({
+        'message': 'Reservation created successfully',
+        'reservation_id': result['reservation_id'],
+        'total_cost': result['total_cost']
+    })
+
+
+BATCH_MODES = ('all_or_nothing', 'best_effort')
+
+
+@route('POST', '/api/reservations/batch', session=True)
+def create_reservation_batch(call):
+    if 'user_id' not in call.session:
+        return error('User not logged in', 401)
+
+    data = call.json
+    if not data or 'items' not in data:
+        return error('Missing items', 400)
+    mode = data.get('mode', 'all_or_nothing')
+    if mode not in BATCH_MODES:
+        return error(f"mode must be one of {', '.join(BATCH_MODES)}", 400)
+
+    try:
+        result = book_many(call.db(), call.session['user_id'], data['items'],
+                           best_effort=mode == 'best_effort',
+                           payment_method=data.get('payment_method'),
+                           idempotency_key=call.headers.get('Idempotency-Key'))
+    except BookingError as e:
+        return error(e.message, e.status)
+    if result['reservations']:
+        mark_write(call.session)
+    result['total_cost'] = round(sum(item['total_cost'] for item in result['reservations']), 2)
+    return Reply(result, 200 if result['reservations'] else 409)
+
+
+@route('POST', '/api/user/register')
+def register_user(call):
+    data = call.json
+    if not data or 'username' not in data or 'password' not in data:
+        return error('Missing username or password', 400)
+
+    try:
+        conn = call.db()
+        conn.execute('INSERT INTO users (username, password) VALUES (?, ?)',
+                     (data['username'], hasher.hash(data['password'])))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        return error('Username already exists', 409)
+    except HashingBusy as e:
+        return retry_later(str(e), 503, 1)
+    return Reply({'message': 'User registered successfully'})
+
+
+@route('POST', '/api/user/login', session=True)
+def login_user(call):
+    data = call.json
+    if not data or 'username' not in data or 'password' not in data:
+        return error('Missing username or password', 400)
+
+    try:
+        user = hasher.authenticate(call.db(), data['username'], data['password'], client=call.client)
+    except LoginThrottled as e:
+        return retry_later(str(e), 429, e.retry_after)
+    except HashingBusy as e:
+        return retry_later(str(e), 503, 1)
+    if not user:
+        return error('Invalid username or password', 401)
+    call.session['user_id'] = user['id']
+    return Reply({
+        'message': 'Login successful',
+        'user_id': user['id']
+    })
+
+
+@route('GET', '/api/reservations/latest', session=True)
+def get_latest_reservation(call):
+    if 'user_id' not in call.session:
+        return error('Unauthorized', 401)
+
+    reservation = latest_reservation(call.read_db(), call.session['user_id'])
+    if not reservation:
+        return error('No reservation found', 404)
+    return Reply(reservation)
+
+
+@route('GET', '/api/reservations/<int:user_id>', session=True)
+def get_user_reservations(call, user_id):
+    if call.session.get('user_id') != user_id:
+        return error('Unauthorized', 401)
+
+    try:
+        return page_reply(*list_reservations(call.read_db(), user_id, call.args))
+    except ValueError as e:
+        return error(str(e), 400)
+
+
+@route('DELETE', '/api/reservations/<int:reservation_id>', session=True)
+def cancel_reservation(call, reservation_id):
+    if 'user_id' not in call.session:
+        return error('Unauthorized', 401)
+
+    try:
+        cancel(call.db(), call.session['user_id'], reservation_id)
+    except BookingError as e:
+        return error(e.message, e.status)
+    mark_write(call.session)
+    return Reply({'message': 'Reservation cancelled successfully'})
+
+
+@route('GET', '/api/reservations/<int:reservation_id>/payment', session=True)
+def get_reservation_payment(call, reservation_id):
+    if 'user_id' not in call.session:
+        return error('Unauthorized', 401)
+
+    try:
+        return Reply(reservation_payment(call.read_db(), call.session['user_id'], reservation_id))
+    except LookupError as e:
+        return error(str(e), 404)
+
+
+@route('GET', '/api/export/reservations')
+def export_reservations(call):
+    if not authorized(call.headers.get('Authorization')):
+        return error('Unauthorized', 401)
+
+    export_format = call.args.get('format', 'ndjson')
+    if export_format == 'ndjson':
+        stream, content_type = ndjson_stream, 'application/x-ndjson'
+    elif export_format == 'csv':
+        stream, content_type = csv_stream, 'text/csv'
+    else:
+        return error('Unsupported format', 400)
+    try:
+        after = parse_after(call.args)
+    except ValueError as e:
+        return error(str(e), 400)
+
+    since = call.args.get('since', '')
+    return Reply(stream=functools.partial(stream, after=after, since=since), content_type=content_type)
@@ -0,0 +1,161 @@
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from config import CONFIG
+from database import pool
+import metrics
+
+log = logging.getLogger('bikes.ledger')
+
+
+class PaymentLedger:
+    """Records payments through one writer thread using group commit.
+
+    ``submit(fn, *args)`` queues ``fn(conn, *args)`` and returns a future.
+    The writer takes up to ``max_batch`` queued entries, waiting at most
+    ``max_delay`` seconds for the batch to fill, runs each one in its own
+    savepoint of a single IMMEDIATE transaction and commits once. Futures
+    resolve only after that commit, so a result means the entry is on disk;
+    an entry that raises rolls back to its savepoint without failing the
+    rest of the batch.
+    """
+
+    def __init__(self, pool, max_batch=64, max_delay=0.002, ack_timeout=10.0, synchronous='FULL'):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.ack_timeout = ack_timeout
+        self.synchronous = synchronous
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.stats = {'batches': 0, 'entries': 0, 'failed': 0}
+
+    def submit(self, fn, *args):
+        future = Future()
+        self._queue.put((future, fn, args))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='ledger', daemon=True)
+                    self._thread.start()
+        return future
+
+    def _take_batch(self):
+        """Block for the first entry, then gather more until full or out of time.
+
+        Returns the batch and whether a stop was requested while gathering.
+        """
+        entry = self._queue.get()
+        if entry is None:
+            return [], True
+        batch = [entry]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                entry = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if entry is None:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _commit(self, conn, batch):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+        except sqlite3.Error as e:
+            for future, _, _ in batch:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+            return
+
+        done = []
+        for future, fn, args in batch:
+            if not future.set_running_or_notify_cancel():
+                continue
+            conn.execute('SAVEPOINT ledger_entry')
+            try:
+                result = fn(conn, *args)
+            except Exception as e:
+                conn.execute('ROLLBACK TO ledger_entry')
+                conn.execute('RELEASE ledger_entry')
+                future.set_exception(e)
+                continue
+            conn.execute('RELEASE ledger_entry')
+            done.append((future, result))
+
+        try:
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            for future, _ in done:
+                future.set_exception(e)
+            self.stats['failed'] += len(done)
+            return
+        for future, result in done:
+            future.set_result(result)
+        self.stats['batches'] += 1
+        self.stats['entries'] += len(done)
+
+    def _run(self):
+        conn = self.pool.connect(synchronous=self.synchronous)
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._take_batch()
+                if not batch:
+                    continue
+                try:
+                    self._commit(conn, batch)
+                except Exception as e:
+                    log.exception('Payment ledger batch failed')
+                    if conn.in_transaction:
+                        conn.rollback()
+                    for future, _, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+        finally:
+            conn.close()
+
+    def close(self):
+        """Flush everything queued so far and stop the writer."""
+        with self._lock:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+
+def _create_ledger():
+    return PaymentLedger(
+        pool,
+        max_batch=CONFIG.getint("ledger", "max_batch", fallback=64),
+        max_delay=CONFIG.getfloat("ledger", "max_delay_ms", fallback=2) / 1000,
+        ack_timeout=CONFIG.getfloat("ledger", "ack_timeout", fallback=10.0),
+        synchronous=CONFIG.get("ledger", "synchronous", fallback="FULL"),
+    )
+
+
+ledger = _create_ledger()
+
+
+def _ledger_metrics():
+    lines = []
+    for name, value in ledger.get_stats().items():
+        metric = f'payment_ledger_{name}' if name == 'queued' else f'payment_ledger_{name}_total'
+        lines.append(f'# TYPE {metric} {"counter" if metric.endswith("_total") else "gauge"}')
+        lines.append(f'{metric} {value}')
+    return lines
+
+
+metrics.collectors.append(_ledger_metrics)
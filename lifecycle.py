@@ -0,0 +1,208 @@
+import heapq
+import logging
+import threading
+from datetime import date, datetime, time
+
+from catalog import catalog
+from config import CONFIG
+from database import pool
+from occupancy import occupancy
+
+log = logging.getLogger('bikes.lifecycle')
+
+# Recomputes each listed bike's status from the reservations covering the given day
+APPLY_STATUS = '''
+    UPDATE bikes SET status = target.status
+    FROM (
+        SELECT b.id, CASE WHEN EXISTS (
+            SELECT 1 FROM reservations r
+            WHERE r.bike_id = b.id AND r.end_day > ? AND r.start_day <= ?
+        ) THEN 'Rented' ELSE 'Available' END AS status
+        FROM bikes b
+        WHERE b.id IN ({ids}) AND b.status != 'Maintenance'
+    ) AS target
+    WHERE bikes.id = target.id AND bikes.status != target.status
+    RETURNING bikes.id, bikes.status
+'''
+
+
+class LifecycleScheduler:
+    """Moves bikes between Available and Rented as reservations start and end.
+
+    Reservation start and end days sit in a heap of ``(day, bike_id)``
+    events. When an event falls due, the bike's status is recomputed from
+    the reservations covering that day rather than flipped, so overlaps and
+    cancellations cannot leave it wrong. Due bikes are written in batches
+    of ``batch_size`` per transaction.
+
+    Only events within ``lookahead_days`` are held in memory. Reservations
+    created by other processes are picked up by polling for new ids every
+    ``poll_interval`` seconds. On the first run, and whenever the lookahead
+    window is used up, every bike is reconciled with one set-based pass,
+    which also catches up after downtime. ``clock`` returns the current
+    local datetime and can be replaced for testing; ``run_pending`` does
+    one round of work without the background thread.
+
+    Each run also trims the ``changes`` log to its newest
+    ``changelog_size`` entries.
+    """
+
+    def __init__(self, pool, clock=datetime.now, poll_interval=60, lookahead_days=7, batch_size=500,
+                 changelog_size=10000):
+        self.pool = pool
+        self.clock = clock
+        self.poll_interval = poll_interval
+        self.lookahead_days = lookahead_days
+        self.batch_size = batch_size
+        self.changelog_size = changelog_size
+        self._events = []
+        self._loaded_until = None
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def today(self):
+        return self.clock().date().toordinal()
+
+    def notify(self, bike_id, *days):
+        """Queue status checks for ``bike_id`` on ``days``; none means now.
+
+        Ignored unless the thread is running; the process that runs it
+        finds other processes' reservations by polling.
+        """
+        if self._thread is None:
+            return
+        with self._lock:
+            for day in days or (self.today(),):
+                heapq.heappush(self._events, (day, bike_id))
+        self._wakeup.set()
+
+    def _push_reservations(self, rows):
+        with self._lock:
+            for bike_id, start_day, end_day in rows:
+                for day in (start_day, end_day):
+                    if day <= self._loaded_until:
+                        heapq.heappush(self._events, (day, bike_id))
+
+    def _catch_up(self, conn, today):
+        self._loaded_until = today + self.lookahead_days
+        self._last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM reservations').fetchone()[0]
+        rows = conn.execute('''
+            SELECT bike_id, start_day, end_day FROM reservations
+            WHERE id <= ? AND end_day > ? AND start_day <= ?
+        ''', (self._last_id, today, self._loaded_until)).fetchall()
+        with self._lock:
+            self._events = [event for event in self._events if event[0] > self._loaded_until]
+            heapq.heapify(self._events)
+        self._push_reservations(rows)
+
+        changed = {}
+        after = 0
+        while True:
+            ids = [row[0] for row in conn.execute(
+                'SELECT id FROM bikes WHERE id > ? ORDER BY id LIMIT ?', (after, self.batch_size))]
+            if not ids:
+                return changed
+            changed.update(self._apply(conn, ids, today))
+            after = ids[-1]
+
+    def _poll_new(self, conn):
+        rows = conn.execute('''
+            SELECT id, bike_id, start_day, end_day FROM reservations WHERE id > ? ORDER BY id
+        ''', (self._last_id,)).fetchall()
+        if rows:
+            self._last_id = rows[-1][0]
+            self._push_reservations(row[1:] for row in rows)
+
+    def _apply(self, conn, bike_ids, today):
+        changed = {}
+        for i in range(0, len(bike_ids), self.batch_size):
+            batch = bike_ids[i:i + self.batch_size]
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute(APPLY_STATUS.format(ids=', '.join('?' * len(batch))),
+                                    (today, today, *batch)).fetchall()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            changed.update((bike_id, status) for bike_id, status in rows)
+        return changed
+
+    def run_pending(self, conn):
+        """Apply every due event and return ``{bike_id: new_status}``."""
+        today = self.today()
+        if self._loaded_until is None or today >= self._loaded_until:
+            changed = self._catch_up(conn, today)
+        else:
+            self._poll_new(conn)
+            changed = {}
+        due = set()
+        with self._lock:
+            while self._events and self._events[0][0] <= today:
+                due.add(heapq.heappop(self._events)[1])
+        changed.update(self._apply(conn, sorted(due), today))
+        if changed:
+            occupancy.set_status(changed)
+            catalog.sync(conn)
+            log.info('Updated status of %d bikes', len(changed))
+        self._trim_changes(conn)
+        return changed
+
+    def _trim_changes(self, conn):
+        oldest, newest = conn.execute('SELECT MIN(version), MAX(version) FROM changes').fetchone()
+        if oldest is not None and newest - oldest >= self.changelog_size:
+            conn.execute('DELETE FROM changes WHERE version <= ?', (newest - self.changelog_size,))
+            conn.commit()
+
+    def seconds_until_next(self):
+        """Seconds until the next event is due, capped at ``poll_interval``."""
+        now = self.clock()
+        today = now.date().toordinal()
+        with self._lock:
+            next_day = self._events[0][0] if self._events else today + 1
+        if next_day <= today:
+            return 0
+        due_at = datetime.combine(date.fromordinal(next_day), time.min)
+        return min(self.poll_interval, (due_at - now).total_seconds())
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                conn = self.pool.acquire()
+                try:
+                    self.run_pending(conn)
+                finally:
+                    self.pool.release(conn)
+            except Exception:
+                log.exception('Reservation lifecycle run failed')
+            self._wakeup.wait(self.seconds_until_next())
+            self._wakeup.clear()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='lifecycle', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+            self._stopping.clear()
+
+
+def _create_scheduler():
+    return LifecycleScheduler(
+        pool,
+        poll_interval=CONFIG.getfloat("lifecycle", "poll_interval", fallback=60),
+        lookahead_days=CONFIG.getint("lifecycle", "lookahead_days", fallback=7),
+        batch_size=CONFIG.getint("lifecycle", "batch_size", fallback=500),
+        changelog_size=CONFIG.getint("lifecycle", "changelog_size", fallback=10000),
+    )
+
+
+scheduler = _create_scheduler()
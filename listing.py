@@ -0,0 +1,202 @@
+from assets import manifest
+from availability import day_number
+from encoding import Rows
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# Query parameters that make /api/bikes a listing rather than the cached catalog
+BIKE_PARAMS = ('fields', 'limit', 'after', 'type', 'status', 'brand', 'min_price', 'max_price')
+
+BIKE_FIELDS = {
+    'id': 'id',
+    'Brand': 'Brand',
+    'model': 'model',
+    'type': 'type',
+    'price': 'price',
+    'status': 'status',
+    'image_url': 'image_url',
+}
+
+RESERVATION_FIELDS = {
+    'id': 'r.id',
+    'bike_id': 'r.bike_id',
+    'user_id': 'r.user_id',
+    'start_date': 'r.start_date',
+    'end_date': 'r.end_date',
+    'total_cost': 'r.total_cost',
+    'status': 'r.status',
+    'created_at': 'r.created_at',
+    'start_day': 'r.start_day',
+    'end_day': 'r.end_day',
+    'Brand': 'b.Brand',
+    'model': 'b.model',
+}
+
+
+def parse_fields(args, allowed):
+    """Return the projected column names; ``id`` is always included."""
+    fields = args.get('fields')
+    if not fields:
+        return list(allowed)
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    if 'id' not in requested:
+        requested.insert(0, 'id')
+    return list(dict.fromkeys(requested))
+
+
+def parse_limit(args):
+    limit = args.get('limit')
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    if not limit.isdigit() or int(limit) < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(int(limit), MAX_PAGE_SIZE)
+
+
+def parse_page_limit(args):
+    """``parse_limit`` once the client pages with ``limit`` or ``after``; None returns every row."""
+    if 'limit' not in args and 'after' not in args:
+        return None
+    return parse_limit(args)
+
+
+def parse_float(args, name):
+    value = args.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a number')
+
+
+def list_bikes(conn, args):
+    """Return one keyset page of bikes ordered by id as ``Rows``, plus the next cursor."""
+    fields = parse_fields(args, BIKE_FIELDS)
+    limit = parse_page_limit(args)
+    where = []
+    params = []
+
+    after = args.get('after')
+    if after is not None:
+        if not after.isdigit():
+            raise ValueError('Invalid cursor')
+        where.append('id > ?')
+        params.append(int(after))
+    for name, column in (('type', 'type'), ('status', 'status'), ('brand', 'Brand')):
+        value = args.get(name)
+        if value is not None:
+            where.append(f'{column} = ?')
+            params.append(value)
+    min_price = parse_float(args, 'min_price')
+    if min_price is not None:
+        where.append('price >= ?')
+        params.append(min_price)
+    max_price = parse_float(args, 'max_price')
+    if max_price is not None:
+        where.append('price <= ?')
+        params.append(max_price)
+
+    sql = f"SELECT {', '.join(BIKE_FIELDS[field] for field in fields)} FROM bikes"
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    sql += ' ORDER BY id LIMIT ?'
+    # A negative LIMIT is no limit
+    params.append(limit + 1 if limit is not None else -1)
+
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = str(rows[-1]['id'])
+    return Rows(fields, rows, {'image_url': manifest.image_fields}), next_cursor
+
+
+def list_reservations(conn, user_id, args):
+    """Return one keyset page of a user's reservations as ``Rows``, newest start first.
+
+    The cursor is ``<start_day>.<id>`` of the last row on the previous page.
+    Without ``limit`` or ``after`` every matching reservation is returned,
+    as before pagination existed.
+    """
+    fields = parse_fields(args, RESERVATION_FIELDS)
+    limit = parse_page_limit(args)
+    where = ['r.user_id = ?']
+    params = [user_id]
+
+    after = args.get('after')
+    if after is not None:
+        try:
+            cursor_day, cursor_id = (int(part) for part in after.split('.'))
+        except ValueError:
+            raise ValueError('Invalid cursor')
+        where.append('(r.start_day < ? OR (r.start_day = ? AND r.id < ?))')
+        params.extend((cursor_day, cursor_day, cursor_id))
+    if args.get('from'):
+        where.append('r.end_day > ?')
+        params.append(day_number(args['from']))
+    if args.get('to'):
+        where.append('r.start_day <= ?')
+        params.append(day_number(args['to']))
+    if args.get('status'):
+        where.append('r.status = ?')
+        params.append(args['status'])
+
+    columns = ', '.join(f'{RESERVATION_FIELDS[field]} AS {field}' for field in fields)
+    sql = f'''
+        SELECT {columns}, r.start_day AS _cursor_day
+        FROM reservations r
+        JOIN bikes b ON r.bike_id = b.id
+        WHERE {' AND '.join(where)}
+        ORDER BY r.start_day DESC, r.id DESC
+        LIMIT ?
+    '''
+    params.append(limit + 1 if limit is not None else -1)
+
+    rows = conn.execute(sql, params).fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['_cursor_day']}.{rows[-1]['id']}"
+    # _cursor_day is past the projected fields, so it is not encoded
+    return Rows(fields, rows), next_cursor
+
+
+def latest_reservation(conn, user_id):
+    """Return the user's most recently booked reservation with bike and payment.
+
+    Reads the user_latest_reservation projection kept up to date by the
+    booking and cancel paths, so every join is a key lookup.
+    """
+    reservation = conn.execute('''
+        SELECT
+            r.*,
+            b.Brand as bike_brand,
+            b.model as bike_model,
+            p.payment_status,
+            p.payment_method
+        FROM user_latest_reservation l
+        JOIN reservations r ON r.id = l.reservation_id
+        JOIN bikes b ON r.bike_id = b.id
+        LEFT JOIN payments p ON p.reservation_id = r.id
+        WHERE l.user_id = ?
+    ''', (user_id,)).fetchone()
+    return dict(reservation) if reservation else None
+
+
+def reservation_payment(conn, user_id, reservation_id):
+    """Return the payment for one of the user's reservations.
+
+    Raises LookupError when the reservation or its payment does not exist.
+    """
+    reservation = conn.execute('SELECT user_id FROM reservations WHERE id = ?', (reservation_id,)).fetchone()
+    if not reservation or reservation['user_id'] != user_id:
+        raise LookupError('Reservation not found')
+    payment = conn.execute('SELECT * FROM payments WHERE reservation_id = ?', (reservation_id,)).fetchone()
+    if not payment:
+        raise LookupError('Payment not found')
+    return dict(payment)
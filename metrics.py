@@ -0,0 +1,216 @@
+import logging
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, g, request
+
+from config import CONFIG
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_SECONDS = CONFIG.getfloat("metrics", "slow_query_ms", fallback=100) / 1000
+
+slow_query_log = logging.getLogger('bikes.sql')
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value, rows=None):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {'buckets': [0] * len(BUCKETS), 'sum': 0.0, 'count': 0, 'rows': 0}
+            index = bisect_left(BUCKETS, value)
+            if index < len(BUCKETS):
+                series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+            if rows is not None:
+                series['rows'] += rows
+
+    def render(self, rows_name=None):
+        with self._lock:
+            series = {labels: dict(data, buckets=list(data['buckets'])) for labels, data in self._series.items()}
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, data in sorted(series.items()):
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, count in zip(BUCKETS, data['buckets']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {data["count"]}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {data["sum"]:.6f}')
+            lines.append(f'{self.name}_count{{{label_text}}} {data["count"]}')
+        if rows_name:
+            lines.append(f'# TYPE {rows_name} counter')
+            for labels, data in sorted(series.items()):
+                label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+                lines.append(f'{rows_name}{{{label_text}}} {data["rows"]}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_duration = Histogram('http_request_duration_seconds',
+                             'Request latency by route.', ('method', 'route', 'status'))
+query_duration = Histogram('sql_query_duration_seconds',
+                           'SQL statement latency including fetches.', ('query',))
+collectors = []
+
+_WHITESPACE = re.compile(r'\s+')
+_VALUE_LISTS = re.compile(r'\(\?(?:, ?\?)*\)(?:, ?\(\?(?:, ?\?)*\))+')
+_IN_LISTS = re.compile(r'\bIN \(\?(?:, ?\?)*\)', re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """Collapse whitespace, repeated VALUES tuples and IN lists so labels stay bounded."""
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _IN_LISTS.sub('IN (?+)', sql)
+    return _VALUE_LISTS.sub('(?, ...)', sql)[:200]
+
+
+def _call_site():
+    frame = sys._getframe(2)
+    while frame and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    return f'{os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno} in {frame.f_code.co_name}'
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Times each statement from execute until its rows are consumed."""
+
+    _sql = None
+
+    def _start(self, sql):
+        self._finish()
+        self._sql = sql
+        self._site = _call_site()
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _finish(self):
+        if self._sql is None:
+            return
+        sql, self._sql = self._sql, None
+        rows = self._rows if self._rows else max(self.rowcount, 0)
+        query_duration.observe((normalize_sql(sql),), self._elapsed, rows)
+        if self._elapsed >= SLOW_QUERY_SECONDS:
+            slow_query_log.warning('slow query %.1f ms, %d rows at %s: %s',
+                                   self._elapsed * 1000, rows, self._site, normalize_sql(sql))
+
+    def _timed(self, method, *args):
+        started = time.perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            self._elapsed += time.perf_counter() - started
+
+    def execute(self, sql, parameters=()):
+        self._start(sql)
+        self._timed(sqlite3.Cursor.execute, sql, parameters)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._start(sql)
+        self._timed(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        row = self._timed(sqlite3.Cursor.fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(sqlite3.Cursor.fetchmany, self.arraysize if size is None else size)
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(sqlite3.Cursor.fetchall)
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose statements all go through InstrumentedCursor."""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            query_duration.observe(('COMMIT',), time.perf_counter() - started)
+
+
+def render():
+    lines = request_duration.render()
+    lines += query_duration.render(rows_name='sql_rows_total')
+    for collector in collectors:
+        lines += collector()
+    return '\n'.join(lines) + '\n'
+
+
+def _start_timer():
+    g._request_started = time.perf_counter()
+
+
+def _record_request(response):
+    started = g.pop('_request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        request_duration.observe((request.method, route, str(response.status_code)),
+                                 time.perf_counter() - started)
+    return response
+
+
+def init_app(app):
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule('/metrics', 'metrics',
+                     lambda: Response(render(), mimetype='text/plain; version=0.0.4'))
@@ -0,0 +1,142 @@
+import threading
+from datetime import date
+
+from assets import manifest
+from availability import find_conflicts
+from catalog import log_gap
+from config import CONFIG
+
+
+class OccupancyIndex:
+    """In-memory per-bike day bitmaps over a rolling horizon.
+
+    Bit ``n`` of a bike's bitmap is set when the bike is booked on day
+    ``origin + n``. Python ints are used as arbitrary-length bitsets.
+    Writes made by other processes are picked up from the ``changes`` log.
+    """
+
+    def __init__(self, horizon_days=365):
+        self.horizon_days = horizon_days
+        self.origin = None
+        self.version = 0
+        self.bikes = {}
+        self.bitmaps = {}
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.origin is not None
+
+    def load(self, conn, today=None):
+        origin = (today or date.today()).toordinal()
+        horizon_end = origin + self.horizon_days
+        # Read first: anything logged after this is replayed by sync()
+        version = conn.execute('SELECT COALESCE(MAX(version), 0) FROM changes').fetchone()[0]
+        bikes = {row['id']: dict(row) for row in conn.execute('SELECT * FROM bikes')}
+        bitmaps = dict.fromkeys(bikes, 0)
+        rows = conn.execute('''
+            SELECT bike_id, start_day, end_day FROM reservations
+            WHERE end_day > ? AND start_day < ?
+        ''', (origin, horizon_end))
+        for bike_id, start_day, end_day in rows:
+            bitmaps[bike_id] = bitmaps.get(bike_id, 0) | self._mask(origin, start_day, end_day)
+        with self._lock:
+            self.origin = origin
+            self.version = version
+            self.bikes = bikes
+            self.bitmaps = bitmaps
+
+    def ensure_current(self, conn, today=None):
+        """Load on first use, rebuild once the horizon has rolled forward,
+        and otherwise apply writes logged since the last call."""
+        today_day = (today or date.today()).toordinal()
+        if self.origin != today_day:
+            self.load(conn, today)
+        else:
+            self.sync(conn)
+
+    def sync(self, conn):
+        if log_gap(conn, self.version):
+            self.load(conn, date.fromordinal(self.origin))
+            return
+        rows = conn.execute('SELECT version, bike_id FROM changes WHERE version > ? ORDER BY version',
+                            (self.version,)).fetchall()
+        if not rows:
+            return
+        bike_ids = {bike_id for _, bike_id in rows}
+        if None in bike_ids:
+            self.load(conn, date.fromordinal(self.origin))
+            return
+        for bike_id in bike_ids:
+            self.refresh_bike(conn, bike_id)
+        with self._lock:
+            self.version = max(self.version, rows[-1][0])
+
+    def _mask(self, origin, start_day, end_day):
+        start = max(start_day, origin) - origin
+        end = min(end_day, origin + self.horizon_days) - origin
+        if end <= start:
+            return 0
+        return ((1 << (end - start)) - 1) << start
+
+    def mark(self, bike_id, start_day, end_day, status=None):
+        with self._lock:
+            if self.origin is None:
+                return
+            self.bitmaps[bike_id] = self.bitmaps.get(bike_id, 0) | self._mask(self.origin, start_day, end_day)
+            if status and bike_id in self.bikes:
+                self.bikes[bike_id]['status'] = status
+
+    def set_status(self, statuses):
+        """Apply ``{bike_id: status}`` written by the lifecycle scheduler."""
+        with self._lock:
+            for bike_id, status in statuses.items():
+                if bike_id in self.bikes:
+                    self.bikes[bike_id]['status'] = status
+
+    def refresh_bike(self, conn, bike_id):
+        """Recompute one bike's bitmap and details, e.g. after a cancellation."""
+        if self.origin is None:
+            return
+        origin = self.origin
+        bike = conn.execute('SELECT * FROM bikes WHERE id = ?', (bike_id,)).fetchone()
+        bitmap = 0
+        rows = conn.execute('''
+            SELECT start_day, end_day FROM reservations
+            WHERE bike_id = ? AND end_day > ? AND start_day < ?
+        ''', (bike_id, origin, origin + self.horizon_days))
+        for start_day, end_day in rows:
+            bitmap |= self._mask(origin, start_day, end_day)
+        with self._lock:
+            if self.origin != origin:
+                return
+            if bike is None:
+                self.bikes.pop(bike_id, None)
+                self.bitmaps.pop(bike_id, None)
+            else:
+                self.bikes[bike_id] = dict(bike)
+                self.bitmaps[bike_id] = bitmap
+
+    def available(self, conn, start_day, end_day, bike_type=None, max_price=None):
+        """Return bikes free for every day in [start_day, end_day)."""
+        with self._lock:
+            origin = self.origin
+            candidates = [
+                (bike, self.bitmaps.get(bike_id, 0))
+                for bike_id, bike in self.bikes.items()
+                if bike['status'] != 'Maintenance'
+                and (bike_type is None or bike['type'] == bike_type)
+                and (max_price is None or bike['price'] <= max_price)
+            ]
+        if start_day >= origin and end_day <= origin + self.horizon_days:
+            window = self._mask(origin, start_day, end_day)
+            return [manifest.resolve_bike(dict(bike)) for bike, bitmap in candidates if not bitmap & window]
+
+        # Outside the horizon: fall back to one batched SQL check
+        start_date = date.fromordinal(start_day).isoformat()
+        end_date = date.fromordinal(end_day - 1).isoformat()
+        conflicts = find_conflicts(conn, [(bike['id'], start_date, end_date) for bike, _ in candidates])
+        return [manifest.resolve_bike(dict(bike)) for (bike, _), busy in zip(candidates, conflicts) if not busy]
+
+
+occupancy = OccupancyIndex(CONFIG.getint("availability", "horizon_days", fallback=365))
@@ -0,0 +1,170 @@
+import hashlib
+import hmac
+import math
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config import CONFIG
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class LoginThrottled(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _pool_context():
+    # The app has threads (scheduler, ledger, replicas) by the time the pool
+    # starts, and forking a threaded process can copy held locks. Only the
+    # hashing module is preloaded, so the server never imports the app.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['werkzeug.security'])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+class PasswordHasher:
+    """Runs password hashing on a bounded process pool.
+
+    At most ``max_pending`` hashes may be running or queued; callers wait up
+    to ``queue_timeout`` seconds for a slot, and ``hash_timeout`` for the
+    result, and get ``HashingBusy`` after that. With ``workers = 0`` hashing
+    runs inline on the calling thread.
+
+    After ``failed_limit`` failed logins for one username from one client
+    within ``failed_ttl`` seconds, further attempts raise ``LoginThrottled``
+    without hashing until the window ends.
+    """
+
+    def __init__(self, method, workers=2, max_pending=16, queue_timeout=2.0, hash_timeout=10.0,
+                 failed_limit=5, failed_ttl=300, failed_cache_size=10000):
+        self.method = method
+        self.workers = workers
+        self.queue_timeout = queue_timeout
+        self.hash_timeout = hash_timeout
+        self.failed_limit = failed_limit
+        self.failed_ttl = failed_ttl
+        self.failed_cache_size = failed_cache_size
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._failed = OrderedDict()
+        self._failed_lock = threading.Lock()
+        self._secret = os.urandom(32)
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise HashingBusy('Too many concurrent password operations')
+        try:
+            if not self.workers:
+                return fn(*args)
+            if self._executor is None:
+                with self._executor_lock:
+                    if self._executor is None:
+                        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=_pool_context())
+            future = self._executor.submit(fn, *args)
+            try:
+                return future.result(timeout=self.hash_timeout)
+            except TimeoutError:
+                future.cancel()
+                raise HashingBusy('Password operation timed out')
+        finally:
+            self._slots.release()
+
+    def close(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split('$', 1)[0] != self.method
+
+    def _failure_key(self, username, client):
+        # Keyed HMAC, so the table never holds usernames or addresses
+        message = '\0'.join((username, client or '')).encode()
+        return hmac.new(self._secret, message, hashlib.sha256).digest()
+
+    def _retry_after(self, key):
+        """Seconds until ``key`` may try again, or 0 while it is under the limit."""
+        with self._failed_lock:
+            entry = self._failed.get(key)
+            if entry is None:
+                return 0
+            failures, expires = entry
+            remaining = expires - time.monotonic()
+            if remaining <= 0:
+                del self._failed[key]
+                return 0
+            return remaining if failures >= self.failed_limit else 0
+
+    def _remember_failure(self, key):
+        now = time.monotonic()
+        with self._failed_lock:
+            failures, expires = self._failed.pop(key, (0, 0.0))
+            if expires <= now:
+                # The window starts at the first failure
+                failures, expires = 0, now + self.failed_ttl
+            self._failed[key] = (failures + 1, expires)
+            while len(self._failed) > self.failed_cache_size:
+                self._failed.popitem(last=False)
+
+    def _forget_failures(self, key):
+        with self._failed_lock:
+            self._failed.pop(key, None)
+
+    def authenticate(self, conn, username, password, client=None):
+        """Return the user row when the password matches, otherwise None.
+
+        Hashes made with outdated parameters are upgraded after a successful
+        check. Raises ``LoginThrottled``, without hashing, while ``username``
+        has too many recent failures from ``client``.
+        """
+        key = self._failure_key(username, client)
+        retry_after = self._retry_after(key)
+        if retry_after:
+            raise LoginThrottled('Too many failed logins, please retry later', math.ceil(retry_after))
+        user = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+        if user is None:
+            # Spend the same effort as a real check so usernames can't be probed
+            self.hash(password)
+            self._remember_failure(key)
+            return None
+        if not self._run(check_password_hash, user['password'], password):
+            self._remember_failure(key)
+            return None
+        self._forget_failures(key)
+        if self.needs_rehash(user['password']):
+            conn.execute('UPDATE users SET password = ? WHERE id = ?', (self.hash(password), user['id']))
+            conn.commit()
+        return user
+
+
+def _create_hasher():
+    return PasswordHasher(
+        CONFIG.get("passwords", "method", fallback="scrypt:32768:8:1"),
+        workers=CONFIG.getint("passwords", "workers", fallback=2),
+        max_pending=CONFIG.getint("passwords", "max_pending", fallback=16),
+        queue_timeout=CONFIG.getfloat("passwords", "queue_timeout", fallback=2.0),
+        hash_timeout=CONFIG.getfloat("passwords", "hash_timeout", fallback=10.0),
+        failed_limit=CONFIG.getint("passwords", "failed_login_limit", fallback=5),
+        failed_ttl=CONFIG.getfloat("passwords", "failed_login_ttl", fallback=300),
+        failed_cache_size=CONFIG.getint("passwords", "failed_login_cache_size", fallback=10000),
+    )
+
+
+hasher = _create_hasher()
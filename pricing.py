@@ -0,0 +1,186 @@
+import functools
+from bisect import bisect_right
+from datetime import date
+
+from availability import day_number
+from catalog import catalog
+from config import CONFIG
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class PricingEngine:
+    """Prices rentals from a bike's daily rate and per-day rules.
+
+    Each day's multiplier combines the weekend and seasonal rules. For a
+    batch of quotes the multipliers are turned into running sums, one per
+    group of overlapping date ranges, so every quote is an O(1) difference
+    of two prefix sums times its rate and far-apart rentals never pay for
+    the days between them. The per-quote step runs as array operations
+    when numpy is installed.
+
+    ``check`` bounds what callers may ask to price: rentals of at most
+    ``max_days`` days, starting today or later and ending within
+    ``horizon_days`` of today.
+    """
+
+    def __init__(self, weekend_multiplier=1.0, seasons=(), length_discounts=(), type_rates=None,
+                 max_days=90, horizon_days=730):
+        self.weekend_multiplier = weekend_multiplier
+        # (first "MMDD", last "MMDD", multiplier); first > last wraps the new year
+        self.seasons = list(seasons)
+        # (minimum days, discount fraction), applied by the longest rental length reached
+        self.length_discounts = sorted(length_discounts)
+        self._discount_days = [days for days, _ in self.length_discounts]
+        self.type_rates = dict(type_rates or {})
+        self.max_days = max_days
+        self.horizon_days = horizon_days
+
+    @functools.lru_cache(maxsize=4096)
+    def day_multiplier(self, day):
+        value = date.fromordinal(day)
+        multiplier = self.weekend_multiplier if value.weekday() >= 5 else 1.0
+        month_day = value.strftime('%m%d')
+        for first, last, factor in self.seasons:
+            if (first <= month_day <= last) if first <= last else (month_day >= first or month_day <= last):
+                multiplier *= factor
+        return multiplier
+
+    def discount(self, days):
+        index = bisect_right(self._discount_days, days)
+        return self.length_discounts[index - 1][1] if index else 0.0
+
+    def check(self, start_day, end_day, today=None):
+        """Raise ValueError unless ``[start_day, end_day)`` is a rental that may be priced."""
+        today = date.today().toordinal() if today is None else today
+        if end_day - start_day > self.max_days:
+            raise ValueError(f'Rentals are limited to {self.max_days} days')
+        if start_day < today or end_day > today + self.horizon_days:
+            raise ValueError(f'Rentals must be within the next {self.horizon_days} days')
+
+    def _prefix_sums(self, items):
+        """Running sums of day multipliers and each item's ``(start, end)`` offsets into them.
+
+        Items are swept in start order; each group of overlapping ranges
+        gets its own run, starting from 0.0.
+        """
+        prefix = []
+        starts = [0] * len(items)
+        ends = [0] * len(items)
+        origin = covered = base = None
+        for index in sorted(range(len(items)), key=lambda index: items[index][2]):
+            start_day, end_day = items[index][2:4]
+            if covered is None or start_day > covered:
+                origin = covered = start_day
+                base = len(prefix)
+                prefix.append(0.0)
+            if end_day > covered:
+                total = prefix[-1]
+                for day in range(covered, end_day):
+                    total += self.day_multiplier(day)
+                    prefix.append(total)
+                covered = end_day
+            starts[index] = base + start_day - origin
+            ends[index] = base + end_day - origin
+        return prefix, starts, ends
+
+    def quote_many(self, items):
+        """Return the total cost for each ``(daily_price, bike_type, start_day, end_day)``.
+
+        Day numbers are date ordinals and ``end_day`` is exclusive.
+        """
+        if not items:
+            return []
+        prefix, starts, ends = self._prefix_sums(items)
+        rates = [price * self.type_rates.get(bike_type, 1.0) * (1 - self.discount(end_day - start_day))
+                 for price, bike_type, start_day, end_day in items]
+
+        if numpy is not None:
+            prefix = numpy.asarray(prefix)
+            starts = numpy.asarray(starts, dtype=numpy.int64)
+            ends = numpy.asarray(ends, dtype=numpy.int64)
+            totals = numpy.round(numpy.asarray(rates) * (prefix[ends] - prefix[starts]), 2)
+            return totals.tolist()
+        return [round(rate * (prefix[end] - prefix[start]), 2) for rate, start, end in zip(rates, starts, ends)]
+
+    def quote(self, daily_price, bike_type, start_day, end_day):
+        return self.quote_many([(daily_price, bike_type, start_day, end_day)])[0]
+
+
+MAX_QUOTES = 1000
+
+
+def quote_items(conn, items):
+    """Price ``[{'bike_id', 'start_date', 'end_date'}, ...]`` in one batch.
+
+    Rates come from the cached catalog. Entries that cannot be priced get
+    an ``error`` instead of a ``total_cost``; a rental outside the engine's
+    limits fails the whole request with ValueError.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError('quotes must be a non-empty list')
+    if len(items) > MAX_QUOTES:
+        raise ValueError(f'At most {MAX_QUOTES} quotes per request')
+
+    bikes = {bike['id']: bike for bike in catalog.get(conn)['rows']}
+    today = date.today().toordinal()
+    results = []
+    batch = []
+    for index, item in enumerate(items):
+        try:
+            result = {'bike_id': int(item['bike_id']), 'start_date': item['start_date'], 'end_date': item['end_date']}
+            start_day = day_number(item['start_date'])
+            end_day = day_number(item['end_date']) + 1
+        except (KeyError, TypeError, ValueError):
+            results.append({'error': 'Invalid quote request'})
+            continue
+        bike = bikes.get(result['bike_id'])
+        if bike is None:
+            result['error'] = 'Bike not found'
+        elif start_day >= end_day:
+            result['error'] = 'Invalid date range'
+        else:
+            try:
+                pricing.check(start_day, end_day, today)
+            except ValueError as e:
+                raise ValueError(f'Quote {index}: {e}')
+            result['days'] = end_day - start_day
+            batch.append((result, (bike['price'], bike['type'], start_day, end_day)))
+        results.append(result)
+
+    for (result, _), total in zip(batch, pricing.quote_many([item for _, item in batch])):
+        result['total_cost'] = total
+    return results
+
+
+def _pairs(name, convert):
+    """Parse a ``key=value, key=value`` option from [pricing]."""
+    value = CONFIG.get("pricing", name, fallback="")
+    pairs = []
+    for item in value.split(','):
+        if item.strip():
+            key, _, amount = item.rpartition('=')
+            pairs.append((convert(key.strip()), float(amount)))
+    return pairs
+
+
+def _season(key):
+    first, last = key.split(':')
+    return first.replace('-', ''), last.replace('-', '')
+
+
+def _create_engine():
+    return PricingEngine(
+        weekend_multiplier=CONFIG.getfloat("pricing", "weekend_multiplier", fallback=1.0),
+        seasons=[(*_season(key), factor) for key, factor in _pairs("seasons", str)],
+        length_discounts=_pairs("length_discounts", int),
+        type_rates=_pairs("type_rates", str),
+        max_days=CONFIG.getint("pricing", "max_rental_days", fallback=90),
+        horizon_days=CONFIG.getint("pricing", "booking_horizon_days", fallback=730),
+    )
+
+
+pricing = _create_engine()
@@ -0,0 +1,206 @@
+import itertools
+import logging
+import os
+import threading
+import time
+
+from flask import g, session
+
+from config import CONFIG
+from database import ConnectionPool, get_db, pool
+import metrics
+
+log = logging.getLogger('bikes.replicas')
+
+
+class Replica:
+    def __init__(self, path, pool_size):
+        self.path = path
+        self.pool = ConnectionPool(path, size=pool_size)
+        # Its mtime is the wall-clock time the copy is known to be current
+        # as of, so every worker sees what the refreshing process stamped
+        self.stamp_path = path + '-snapshot'
+        self.refreshes = 0
+
+    @property
+    def snapshot_at(self):
+        try:
+            return os.stat(self.stamp_path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    def stamp(self, snapshot_at):
+        with open(self.stamp_path, 'a'):
+            pass
+        os.utime(self.stamp_path, (snapshot_at, snapshot_at))
+
+
+class ReplicaSet:
+    """Local copies of the primary database for read-only routes.
+
+    A background thread copies the primary into each replica file with
+    SQLite's online backup API every ``refresh_interval`` seconds, skipping
+    the copy when ``PRAGMA data_version`` shows nothing was committed since
+    the last one. The copy runs ``backup_pages`` pages per step, so the
+    process's request threads get a turn between steps. Replica files are
+    in WAL mode, so a copy never blocks readers: they finish on the snapshot
+    they started with.
+
+    Only a process created with ``refresh=True`` runs the thread; serve.py
+    keeps it to one worker. The time of each copy is stamped next to the
+    replica file, where every process's ``choose`` reads it.
+
+    ``choose`` only hands out a replica whose copy is at most
+    ``max_staleness`` seconds old and was taken after ``wrote_at``, the
+    time of the caller's own last write; otherwise reads go to the primary.
+    """
+
+    def __init__(self, primary, paths, refresh_interval=1.0, max_staleness=5.0, pool_size=4,
+                 backup_pages=256, refresh=True):
+        self.primary = primary
+        self.replicas = [Replica(path, pool_size) for path in paths]
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.backup_pages = backup_pages
+        self.refresh_enabled = refresh
+        self.stats = {'replica_reads': 0, 'primary_reads': 0}
+        self._next = itertools.count()
+        self._source = None
+        self._data_version = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    @property
+    def enabled(self):
+        return bool(self.replicas)
+
+    def refresh(self):
+        """Copy the primary into every replica if it changed since the last copy."""
+        if self._source is None:
+            self._source = self.primary.connect()
+        # Taken first: every commit before this is either in the copy or was
+        # already in the previous one
+        checked_at = time.time()
+        data_version = self._source.execute('PRAGMA data_version').fetchone()[0]
+        unchanged = data_version == self._data_version
+        for replica in self.replicas:
+            if not (unchanged and replica.snapshot_at is not None):
+                target = replica.pool.acquire()
+                try:
+                    self._source.backup(target, pages=self.backup_pages)
+                    target.execute('PRAGMA wal_checkpoint(PASSIVE)')
+                finally:
+                    replica.pool.release(target)
+                replica.refreshes += 1
+            replica.stamp(checked_at)
+        self._data_version = data_version
+
+    def choose(self, wrote_at=None):
+        """Return a fresh enough replica pool, or None to read from the primary."""
+        now = time.time()
+        fresh = [replica for replica in self.replicas
+                 if replica.snapshot_at is not None and now - replica.snapshot_at <= self.max_staleness
+                 and (wrote_at is None or wrote_at < replica.snapshot_at)]
+        if not fresh:
+            self.stats['primary_reads'] += 1
+            return None
+        self.stats['replica_reads'] += 1
+        return fresh[next(self._next) % len(fresh)].pool
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.refresh()
+            except Exception:
+                log.exception('Replica refresh failed')
+            self._stopping.wait(self.refresh_interval)
+
+    def start(self):
+        if self.replicas and self.refresh_enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='replicas', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+            self._stopping.clear()
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+        for replica in self.replicas:
+            replica.pool.close_all()
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        now = time.time()
+        stats['replicas'] = [{
+            'path': replica.path,
+            'age_seconds': round(now - replica.snapshot_at, 3) if replica.snapshot_at is not None else None,
+            'refreshes': replica.refreshes,
+        } for replica in self.replicas]
+        return stats
+
+
+def _create_replica_set():
+    paths = CONFIG.get("replicas", "paths", fallback="")
+    return ReplicaSet(
+        pool,
+        [path.strip() for path in paths.split(',') if path.strip()],
+        refresh_interval=CONFIG.getfloat("replicas", "refresh_interval", fallback=1.0),
+        max_staleness=CONFIG.getfloat("replicas", "max_staleness", fallback=5.0),
+        pool_size=CONFIG.getint("replicas", "pool_size", fallback=4),
+        backup_pages=CONFIG.getint("replicas", "backup_pages", fallback=256),
+        refresh=CONFIG.getboolean("replicas", "refresh", fallback=True),
+    )
+
+
+replica_set = _create_replica_set()
+
+
+def _replica_metrics():
+    if not replica_set.enabled:
+        return []
+    stats = replica_set.get_stats()
+    lines = []
+    for name in ('replica_reads', 'primary_reads'):
+        lines.append(f'# TYPE db_{name}_total counter')
+        lines.append(f'db_{name}_total {stats[name]}')
+    lines.append('# TYPE db_replica_age_seconds gauge')
+    for replica in stats['replicas']:
+        if replica['age_seconds'] is not None:
+            lines.append(f'db_replica_age_seconds{{path="{replica["path"]}"}} {replica["age_seconds"]}')
+    lines.append('# TYPE db_replica_refreshes_total counter')
+    for replica in stats['replicas']:
+        lines.append(f'db_replica_refreshes_total{{path="{replica["path"]}"}} {replica["refreshes"]}')
+    return lines
+
+
+metrics.collectors.append(_replica_metrics)
+
+
+def mark_write(user_session=session):
+    """Send this session's reads to the primary until replicas catch up."""
+    if replica_set.enabled:
+        user_session['wrote_at'] = time.time()
+
+
+def get_read_db():
+    """Connection for a read-only request: a fresh replica, else the primary."""
+    if 'read_db' not in g:
+        replica_pool = replica_set.choose(session.get('wrote_at')) if replica_set.enabled else None
+        if replica_pool is None:
+            return get_db()
+        g.read_db = (replica_pool, replica_pool.acquire())
+    return g.read_db[1]
+
+
+def close_read_db(exception=None):
+    read_db = g.pop('read_db', None)
+    if read_db is not None:
+        read_db[0].release(read_db[1])
+
+
+def init_app(app):
+    app.teardown_appcontext(close_read_db)
@@ -0,0 +1,119 @@
+import re
+from collections import Counter
+
+from assets import manifest
+from listing import parse_float, parse_limit
+
+HIT_FIELDS = ('id', 'Brand', 'model', 'type', 'price', 'status', 'image_url')
+
+# Weights for bm25() in bikes_fts column order: Brand, model, type
+RANK = 'bm25(bikes_fts, 4.0, 2.0, 1.0)'
+
+_TERMS = re.compile(r'\w+', re.UNICODE)
+
+
+def match_expression(q):
+    """Turn free text into an FTS5 query: every word must match as a prefix.
+
+    Words are quoted, so FTS5 operators and punctuation in ``q`` are inert.
+    """
+    return ' '.join(f'"{term}"*' for term in _TERMS.findall(q))
+
+
+def facet_counts(bikes):
+    """Type and brand counts over ``bikes``, keyed in the order search_bikes reports them."""
+    facets = {'type': Counter(), 'brand': Counter()}
+    for bike in bikes:
+        facets['type'][bike['type']] += 1
+        facets['brand'][bike['Brand']] += 1
+    return {name: dict(sorted(counts.items())) for name, counts in facets.items()}
+
+
+def search_bikes(conn, args):
+    """Return ranked, keyset-paginated hits with facet counts for the whole match.
+
+    One statement computes the matches once and reads the page, the type
+    and brand counts and the total from them. The cursor is
+    ``<rank>:<id>`` of the last hit on the previous page.
+    """
+    limit = parse_limit(args)
+    expression = match_expression(args.get('q', ''))
+    where = []
+    params = []
+    if expression:
+        # CROSS JOIN keeps the index lookup outermost; otherwise a filter on
+        # an indexed bikes column can make the planner run MATCH once per row
+        source = 'bikes_fts CROSS JOIN bikes b ON b.id = bikes_fts.rowid'
+        rank = RANK
+        where.append('bikes_fts MATCH ?')
+        params.append(expression)
+    else:
+        source = 'bikes b'
+        rank = '0.0'
+    for name, column in (('type', 'b.type'), ('brand', 'b.Brand')):
+        value = args.get(name)
+        if value:
+            where.append(f'{column} = ?')
+            params.append(value)
+    for name, operator in (('price_min', '>='), ('price_max', '<=')):
+        value = parse_float(args, name)
+        if value is not None:
+            where.append(f'b.price {operator} ?')
+            params.append(value)
+
+    # Matches are computed once and shared by the page and the counts. With
+    # no conditions at all, inlining lets each count read a bikes index instead
+    materialized = 'MATERIALIZED' if where else 'NOT MATERIALIZED'
+
+    page_where = ''
+    after = args.get('after')
+    if after is not None:
+        try:
+            cursor_rank, cursor_id = after.rsplit(':', 1)
+            page_params = [float(cursor_rank), int(cursor_id)]
+        except ValueError:
+            raise ValueError('Invalid cursor')
+        page_where = 'WHERE (rank, id) > (?, ?)'
+    else:
+        page_params = []
+
+    columns = ', '.join(f'b.{field}' for field in HIT_FIELDS)
+    sql = f'''
+        WITH hits AS {materialized} (
+            SELECT {columns}, {rank} AS rank
+            FROM {source}
+            {'WHERE ' + ' AND '.join(where) if where else ''}
+        )
+        SELECT * FROM (
+            SELECT 'hit' AS kind, {', '.join(HIT_FIELDS)}, rank FROM hits
+            {page_where}
+            ORDER BY rank, id LIMIT ?
+        )
+        UNION ALL
+        SELECT 'type', NULL, NULL, NULL, type, NULL, NULL, NULL, COUNT(*) FROM hits GROUP BY type
+        UNION ALL
+        SELECT 'brand', NULL, Brand, NULL, NULL, NULL, NULL, NULL, COUNT(*) FROM hits GROUP BY Brand
+        UNION ALL
+        SELECT 'total', NULL, NULL, NULL, NULL, NULL, NULL, NULL, COUNT(*) FROM hits
+    '''
+    hits = []
+    facets = {'type': {}, 'brand': {}}
+    total = 0
+    for row in conn.execute(sql, params + page_params + [limit + 1]):
+        kind = row[0]
+        if kind == 'hit':
+            hit = manifest.resolve_bike(dict(zip(HIT_FIELDS, row[1:8])))
+            hit['rank'] = row[8]
+            hits.append(hit)
+        elif kind == 'type':
+            facets['type'][row[4]] = row[8]
+        elif kind == 'brand':
+            facets['brand'][row[2]] = row[8]
+        else:
+            total = row[8]
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = f"{hits[-1]['rank']!r}:{hits[-1]['id']}"
+    return {'hits': hits, 'total': total, 'facets': facets, 'next_cursor': next_cursor}
@@ -0,0 +1,467 @@
+"""Pre-forking production launcher.
+
+    python serve.py
+
+Binds the [frontend] address for the whole site and, when [launcher]
+api_workers is set, the [server] address for the /api routes alone, then
+forks worker processes that import the app, warm their connection pool,
+catalog and templates, and only then start accepting on the inherited
+sockets. Workers share nothing but the database file.
+
+    kill -HUP <pid>     reload: start a new generation of workers and
+                        retire the old one once the new one is ready
+    kill -TERM <pid>    shut down, letting in-flight requests finish
+
+More than one worker needs [session] backend=sqlite, so a login is seen
+by every worker. Workers share the launcher's secret key, generated once
+at startup when [session] secret_key is empty.
+
+Each worker reports its health to the launcher, which restarts workers
+that exit or stop reporting and writes a summary to [launcher]
+status_file. A worker's own report is also served at /healthz.
+
+Workers serve with waitress when it is installed (see requirements.txt),
+using [launcher] threads request threads each. Without it they fall back
+to werkzeug's threaded development server, which starts a thread for
+every connection with no upper bound and has no protection against slow
+clients; that is fine on a workstation but not behind a public address.
+"""
+import json
+import logging
+import os
+import secrets
+import selectors
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+
+from config import CONFIG
+
+try:
+    import waitress.server
+except ImportError:
+    waitress = None
+
+log = logging.getLogger('bikes.launcher')
+
+API_PATHS = ('/api/', '/metrics', '/healthz')
+BACKLOG = 2048
+
+
+class WorkerApp:
+    """WSGI wrapper that counts requests and answers /healthz.
+
+    Workers in the ``api`` role only serve the JSON API and metrics.
+    """
+
+    def __init__(self, app, role, generation):
+        self.app = app
+        self.role = role
+        self.generation = generation
+        self.started = time.time()
+        self.requests = 0
+        self.in_flight = 0
+        self._lock = threading.Condition()
+
+    def health(self):
+        from database import pool
+        return {
+            'pid': os.getpid(),
+            'role': self.role,
+            'generation': self.generation,
+            'uptime': round(time.time() - self.started, 1),
+            'requests': self.requests,
+            'in_flight': self.in_flight,
+            'pool': pool.get_stats(),
+        }
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path == '/healthz':
+            return self._json(start_response, '200 OK', self.health())
+        if self.role == 'api' and not path.startswith(API_PATHS):
+            return self._json(start_response, '404 NOT FOUND', {'error': 'Not found'})
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+        try:
+            response = self.app(environ, start_response)
+        except BaseException:
+            self._finished()
+            raise
+        # Streamed bodies are still being sent after the app returns
+        return ClosingIterator(response, self._finished)
+
+    def _finished(self):
+        with self._lock:
+            self.in_flight -= 1
+            if not self.in_flight:
+                self._lock.notify_all()
+
+    def drain(self, timeout):
+        """Wait up to ``timeout`` seconds for in-flight requests; return whether they finished."""
+        with self._lock:
+            return self._lock.wait_for(lambda: not self.in_flight, timeout)
+
+    @staticmethod
+    def _json(start_response, status, data):
+        body = (json.dumps(data, sort_keys=True) + '\n').encode()
+        start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))])
+        return [body]
+
+
+def warm(app):
+    """Open every pooled connection and build the caches before serving."""
+    from app import render_bike_cards
+    from assets import manifest
+    from catalog import catalog
+    from database import pool
+    from search import facet_counts
+
+    connections = [pool.acquire() for _ in range(pool.size)]
+    try:
+        with app.test_request_context():
+            catalog.fragment(connections[0], 'bike_cards', render_bike_cards)
+            catalog.fragment(connections[0], 'facets', facet_counts)
+    finally:
+        for conn in connections:
+            pool.release(conn)
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    manifest.data
+
+
+def waitress_server(worker, listener, threads, graceful_timeout):
+    """Return ``(serve, shutdown)`` for waitress on the inherited ``listener``.
+
+    ``serve`` blocks until another thread calls ``shutdown``, then returns
+    whether the in-flight requests finished within ``graceful_timeout``.
+    """
+    server = waitress.server.create_server(worker, sockets=[listener], threads=threads, backlog=BACKLOG)
+    drained = []
+    stopping = threading.Lock()
+
+    def shutdown():
+        # A second SIGTERM, e.g. one sent to the whole process group, changes nothing
+        if not stopping.acquire(blocking=False):
+            return
+        deadline = time.monotonic() + graceful_timeout
+        # Only this worker stops accepting; the others keep their copy of the socket
+        server.trigger.pull_trigger(server.del_channel)
+        drained.append(worker.drain(graceful_timeout))
+        # Let finished responses leave their output buffers before the connections close
+        while (any(getattr(channel, 'total_outbufs_len', 0) for channel in list(server._map.values()))
+               and time.monotonic() < deadline):
+            time.sleep(0.05)
+        # With every channel closed the map is empty, which ends server.run()
+        server.trigger.pull_trigger(lambda: waitress.wasyncore.close_all(server._map))
+
+    def serve():
+        server.run()
+        server.task_dispatcher.shutdown()
+        listener.close()
+        return drained[0] if drained else worker.drain(0)
+
+    return serve, shutdown
+
+
+def werkzeug_server(worker, listener, graceful_timeout):
+    """Return ``(serve, shutdown)`` for werkzeug's development server on ``listener``."""
+    from werkzeug.serving import make_server
+
+    host, port = listener.getsockname()[:2]
+    server = make_server(host, port, worker, threaded=True, fd=listener.fileno())
+
+    def serve():
+        server.serve_forever()
+        # Request threads are daemons, so returning now would cut them off; past
+        # the timeout the launcher kills this process anyway
+        drained = worker.drain(graceful_timeout)
+        server.server_close()
+        return drained
+
+    # shutdown() waits for serve_forever, so it cannot run on the serving thread
+    return serve, server.shutdown
+
+
+def run_worker(role, index, generation, listener, report_fd, heartbeat_interval, graceful_timeout):
+    # Undo the launcher's signal setup inherited through fork
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    # One lifecycle scheduler and one replica refresher per deployment is enough
+    if role != 'frontend' or index != 0:
+        CONFIG["lifecycle"]["enabled"] = "false"
+        CONFIG["replicas"]["refresh"] = "false"
+
+    from app import app
+    from database import pool
+    from ledger import ledger
+    from lifecycle import scheduler
+    from passwords import hasher
+    from replicas import replica_set
+
+    worker = WorkerApp(app, role, generation)
+    warm(app)
+    if waitress:
+        threads = CONFIG.getint("launcher", "threads", fallback=0) or pool.size
+        serve, shutdown = waitress_server(worker, listener, threads, graceful_timeout)
+    else:
+        log.warning('waitress is not installed; serving with the werkzeug development server')
+        serve, shutdown = werkzeug_server(worker, listener, graceful_timeout)
+
+    def report():
+        while True:
+            try:
+                os.write(report_fd, (json.dumps(worker.health()) + '\n').encode())
+            except OSError:
+                return
+            time.sleep(heartbeat_interval)
+
+    threading.Thread(target=report, name='heartbeat', daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=shutdown).start())
+    if not serve():
+        log.warning('Exiting with %d requests still in flight', worker.in_flight)
+    ledger.close()
+    scheduler.stop()
+    replica_set.stop()
+    hasher.close()
+    pool.close_all()
+
+
+class Worker:
+    def __init__(self, role, index, generation, pid, report_fd):
+        self.role = role
+        self.index = index
+        self.generation = generation
+        self.pid = pid
+        self.report_fd = report_fd
+        self.started = time.monotonic()
+        self.last_report = None
+        self.health = None
+        self.stopping_since = None
+        self._buffer = b''
+
+    @property
+    def ready(self):
+        return self.last_report is not None
+
+    def read_reports(self):
+        """Consume heartbeat lines; return False once the pipe is closed."""
+        data = os.read(self.report_fd, 65536)
+        if not data:
+            return False
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b'\n')
+        for line in lines:
+            self.health = json.loads(line)
+            self.last_report = time.monotonic()
+        return True
+
+    def state(self, now, heartbeat_timeout):
+        if self.stopping_since is not None:
+            return 'stopping'
+        if not self.ready:
+            return 'starting'
+        if now - self.last_report > heartbeat_timeout:
+            return 'unresponsive'
+        return 'ready'
+
+
+class Launcher:
+    def __init__(self, groups, graceful_timeout=30, heartbeat_interval=2, heartbeat_timeout=30,
+                 status_file=None):
+        # groups: [(role, worker count, listening socket)]
+        self.groups = groups
+        self.graceful_timeout = graceful_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.status_file = status_file
+        self.generation = 0
+        self.workers = {}
+        self.selector = selectors.DefaultSelector()
+        self.signals = []
+        self.stopping = False
+
+    def spawn(self, role, index, listener):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            code = 0
+            try:
+                run_worker(role, index, self.generation, listener, write_fd, self.heartbeat_interval,
+                           self.graceful_timeout)
+            except Exception:
+                log.exception('Worker %s/%d failed', role, index)
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(write_fd)
+        worker = Worker(role, index, self.generation, pid, read_fd)
+        self.workers[pid] = worker
+        self.selector.register(read_fd, selectors.EVENT_READ, worker)
+        log.info('Started %s worker %d (pid %d, generation %d)', role, index, pid, self.generation)
+        return worker
+
+    def spawn_generation(self):
+        self.generation += 1
+        for role, count, listener in self.groups:
+            for index in range(count):
+                self.spawn(role, index, listener)
+
+    def stop_worker(self, worker, sig=signal.SIGTERM):
+        if worker.stopping_since is None:
+            worker.stopping_since = time.monotonic()
+        try:
+            os.kill(worker.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def close_reports(self, worker):
+        if worker.report_fd is not None:
+            self.selector.unregister(worker.report_fd)
+            os.close(worker.report_fd)
+            worker.report_fd = None
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            self.close_reports(worker)
+            if worker.stopping_since is None and not self.stopping and worker.generation == self.generation:
+                log.warning('%s worker %d (pid %d) exited with status %d; restarting',
+                            worker.role, worker.index, pid, os.waitstatus_to_exitcode(status))
+                listener = next(sock for role, _, sock in self.groups if role == worker.role)
+                self.spawn(worker.role, worker.index, listener)
+
+    def supervise(self):
+        now = time.monotonic()
+        current = [w for w in self.workers.values() if w.generation == self.generation]
+        old = [w for w in self.workers.values() if w.generation != self.generation]
+        # Retire the previous generation once its replacement is serving
+        if old and (all(w.ready for w in current) or
+                    any(now - w.started > self.graceful_timeout for w in current)):
+            for worker in old:
+                if worker.stopping_since is None:
+                    self.stop_worker(worker)
+        for worker in list(self.workers.values()):
+            if worker.stopping_since is not None:
+                if now - worker.stopping_since > self.graceful_timeout:
+                    self.stop_worker(worker, signal.SIGKILL)
+            elif worker.state(now, self.heartbeat_timeout) == 'unresponsive':
+                log.warning('%s worker %d (pid %d) stopped reporting; killing it',
+                            worker.role, worker.index, worker.pid)
+                os.kill(worker.pid, signal.SIGKILL)
+            elif not worker.ready and now - worker.started > self.heartbeat_timeout + self.graceful_timeout:
+                log.warning('%s worker %d (pid %d) never became ready; killing it',
+                            worker.role, worker.index, worker.pid)
+                os.kill(worker.pid, signal.SIGKILL)
+
+    def write_status(self):
+        if not self.status_file:
+            return
+        now = time.monotonic()
+        status = {
+            'pid': os.getpid(),
+            'generation': self.generation,
+            'updated': time.time(),
+            'workers': [
+                {
+                    'pid': worker.pid,
+                    'role': worker.role,
+                    'index': worker.index,
+                    'generation': worker.generation,
+                    'state': worker.state(now, self.heartbeat_timeout),
+                    'last_report_age': round(now - worker.last_report, 1) if worker.ready else None,
+                    'health': worker.health,
+                }
+                for worker in sorted(self.workers.values(), key=lambda w: (w.role, w.index, w.generation))
+            ],
+        }
+        temporary = self.status_file + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(status, f, indent=2)
+        os.replace(temporary, self.status_file)
+
+    def run(self):
+        wakeup_read, wakeup_write = socket.socketpair()
+        wakeup_read.setblocking(False)
+        wakeup_write.setblocking(False)
+        signal.set_wakeup_fd(wakeup_write.fileno())
+        for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(sig, lambda signum, _: self.signals.append(signum))
+        self.selector.register(wakeup_read, selectors.EVENT_READ, None)
+
+        self.spawn_generation()
+        while self.workers or not self.stopping:
+            for key, _ in self.selector.select(timeout=self.heartbeat_interval):
+                if key.data is None:
+                    wakeup_read.recv(4096)
+                elif not key.data.read_reports():
+                    self.close_reports(key.data)
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP and not self.stopping:
+                    log.info('Reloading: starting generation %d', self.generation + 1)
+                    self.spawn_generation()
+                elif signum in (signal.SIGTERM, signal.SIGINT) and not self.stopping:
+                    log.info('Shutting down %d workers', len(self.workers))
+                    self.stopping = True
+                    for worker in self.workers.values():
+                        self.stop_worker(worker)
+            self.reap()
+            self.supervise()
+            self.write_status()
+        return 0
+
+
+def listen(host, port):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    return socket.create_server((host, port), family=family, backlog=BACKLOG)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(name)s: %(message)s')
+    frontend_workers = CONFIG.getint("launcher", "frontend_workers", fallback=0) or os.cpu_count() or 1
+    api_workers = CONFIG.getint("launcher", "api_workers", fallback=0)
+
+    if frontend_workers + api_workers > 1:
+        if CONFIG.get("session", "backend", fallback="memory") == "memory":
+            log.error('[session] backend=memory keeps sessions per worker, so logins would not carry '
+                      'across workers; set backend=sqlite or run a single worker')
+            return 1
+        if not CONFIG.get("session", "secret_key", fallback=""):
+            # Generated before forking, so every worker gets the same key
+            CONFIG["session"]["secret_key"] = secrets.token_hex(32)
+            log.warning('[session] secret_key is empty; using a random key until the launcher restarts')
+
+    groups = [('frontend', frontend_workers,
+               listen(CONFIG["frontend"]["listen_ip"], CONFIG.getint("frontend", "port")))]
+    if api_workers:
+        groups.append(('api', api_workers, listen(CONFIG["server"]["listen_ip"], CONFIG.getint("server", "port"))))
+
+    launcher = Launcher(
+        groups,
+        graceful_timeout=CONFIG.getfloat("launcher", "graceful_timeout", fallback=30),
+        heartbeat_interval=CONFIG.getfloat("launcher", "heartbeat_interval", fallback=2),
+        heartbeat_timeout=CONFIG.getfloat("launcher", "heartbeat_timeout", fallback=30),
+        status_file=CONFIG.get("launcher", "status_file", fallback="") or None,
+    )
+    return launcher.run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
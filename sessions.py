@@ -0,0 +1,228 @@
+import json
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask.sessions import SessionInterface, SessionMixin
+
+from config import CONFIG
+
+
+class MemorySessionStore:
+    """Sessions in a dict, for a single process.
+
+    Entries are kept in expiry order, so expired ones are evicted from the
+    front on every write; past ``max_entries`` the soonest to expire go.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry
+
+    def save(self, sid, data, expires_at):
+        now = time.time()
+        with self._lock:
+            self._sessions[sid] = (expires_at, dict(data))
+            self._sessions.move_to_end(sid)
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if oldest[0] >= now and len(self._sessions) <= self.max_entries:
+                    break
+                self._sessions.popitem(last=False)
+
+    def delete(self, sid):
+        with self._lock:
+            self._sessions.pop(sid, None)
+
+
+class SQLiteSessionStore:
+    """Sessions in the ``sessions`` table, shared by every worker process.
+
+    Expired rows are ignored on read and purged at most once per
+    ``purge_interval`` seconds by whichever request saves next.
+    """
+
+    def __init__(self, pool, purge_interval=300):
+        self.pool = pool
+        self.purge_interval = purge_interval
+        self._next_purge = 0
+
+    def get(self, sid):
+        conn = self.pool.acquire()
+        try:
+            row = conn.execute('SELECT expires_at, data FROM sessions WHERE id = ? AND expires_at >= ?',
+                               (sid, time.time())).fetchone()
+        finally:
+            self.pool.release(conn)
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def save(self, sid, data, expires_at):
+        now = time.time()
+        conn = self.pool.acquire()
+        try:
+            conn.execute('''
+                INSERT INTO sessions (id, data, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at
+            ''', (sid, json.dumps(data, separators=(',', ':')), expires_at))
+            if now >= self._next_purge:
+                self._next_purge = now + self.purge_interval
+                conn.execute('DELETE FROM sessions WHERE expires_at < ?', (now,))
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+
+    def delete(self, sid):
+        conn = self.pool.acquire()
+        try:
+            conn.execute('DELETE FROM sessions WHERE id = ?', (sid,))
+            conn.commit()
+        finally:
+            self.pool.release(conn)
+
+
+class ServerSession(SessionMixin):
+    """Session whose data is fetched from the store on first use.
+
+    Requests that never read the session never hit the store. Setting one
+    of ``IDENTITY_KEYS`` moves the data to a fresh id, so an id planted or
+    seen before login is worthless after it.
+    """
+
+    IDENTITY_KEYS = ('user_id',)
+
+    def __init__(self, store, sid=None):
+        self.store = store
+        self.sid = sid
+        self.expires_at = None
+        self.modified = False
+        self.accessed = False
+        self._data = None
+        self._retired = []
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self.accessed = True
+            entry = self.store.get(self.sid) if self.sid else None
+            if entry is None:
+                self.sid = None
+                self._data = {}
+            else:
+                self.expires_at, self._data = entry
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        if key in self.IDENTITY_KEYS:
+            self.regenerate()
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def regenerate(self):
+        """Keep the data under a new id; the old entry is deleted on save."""
+        self.data
+        if self.sid:
+            self._retired.append(self.sid)
+            self.sid = None
+        self.modified = True
+
+    def clear(self):
+        """Drop the data and its stored entry, e.g. on logout."""
+        self.regenerate()
+        self._data.clear()
+
+    def save(self, ttl):
+        """Write the session if needed; return the id to set, '' to clear, or None."""
+        if not self.loaded:
+            return None
+        retired, self._retired = self._retired, []
+        for sid in retired:
+            self.store.delete(sid)
+        if not self._data:
+            if (self.sid or retired) and self.modified:
+                if self.sid:
+                    self.store.delete(self.sid)
+                return ''
+            return None
+        now = time.time()
+        # Unchanged sessions are only rewritten once half their lifetime is used
+        if self.modified or self.sid is None or self.expires_at - now < ttl / 2:
+            self.sid = self.sid or secrets.token_urlsafe(32)
+            self.expires_at = now + ttl
+            self.store.save(self.sid, self._data, self.expires_at)
+            return self.sid
+        return None
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps session data server-side; the cookie only carries a random id."""
+
+    def __init__(self, store, ttl):
+        self.store = store
+        self.ttl = ttl
+
+    def open_session(self, app, request):
+        return ServerSession(self.store, request.cookies.get(self.get_cookie_name(app)))
+
+    def save_session(self, app, session, response):
+        if session.accessed:
+            response.vary.add('Cookie')
+        sid = session.save(self.ttl)
+        if sid is None:
+            return
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not sid:
+            response.delete_cookie(name, domain=domain, path=path)
+            return
+        response.set_cookie(name, sid, max_age=int(self.ttl), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app),
+                            samesite=self.get_cookie_samesite(app))
+
+
+def _create_store():
+    backend = CONFIG.get("session", "backend", fallback="memory")
+    if backend == "sqlite":
+        from database import pool
+        return SQLiteSessionStore(pool)
+    if backend == "memory":
+        return MemorySessionStore(CONFIG.getint("session", "max_entries", fallback=100000))
+    raise ValueError(f"Unknown session backend: {backend}")
+
+
+def init_app(app):
+    # Sessions are no longer signed; the key is kept for anything else that signs
+    app.secret_key = CONFIG.get("session", "secret_key", fallback="") or secrets.token_hex(32)
+    app.session_interface = ServerSessionInterface(_create_store(),
+                                                   CONFIG.getfloat("session", "ttl", fallback=86400))
@@ -0,0 +1,110 @@
+"""Shared fixtures: the app on a throwaway database, with background work off.
+
+The app's singletons (pool, caches, hasher, ...) read CONFIG when they are
+first imported, so it is adjusted here before any test imports them.
+"""
+import itertools
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# config.py reads bikes.ini from the working directory
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+from config import CONFIG
+
+_fd, DATABASE = tempfile.mkstemp(suffix='.db')
+os.close(_fd)
+CONFIG["database"]["name"] = DATABASE
+CONFIG["lifecycle"]["enabled"] = "false"
+CONFIG["admission"]["enabled"] = "false"
+CONFIG["replicas"]["paths"] = ""
+CONFIG["export"]["token"] = "export-token"
+# Test rentals are spread far ahead, past the default booking horizon
+CONFIG["pricing"]["booking_horizon_days"] = "36500"
+# Real cost parameters make every login take a noticeable fraction of a second
+CONFIG["passwords"]["method"] = "pbkdf2:sha256:1000"
+
+_names = itertools.count(1)
+# Far enough ahead that nothing here collides with "today" rules
+_days = itertools.count(400, 10)
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    from database import pool
+    from ledger import ledger
+    from passwords import hasher
+
+    flask_app.config['TESTING'] = True
+    yield flask_app
+    ledger.close()
+    hasher.close()
+    pool.close_all()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(DATABASE + suffix):
+            os.remove(DATABASE + suffix)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def conn(app):
+    from database import pool
+
+    connection = pool.acquire()
+    yield connection
+    pool.release(connection)
+
+
+def unique(prefix):
+    return f'{prefix}{next(_names)}'
+
+
+def window(days=2):
+    """A fresh ``(start_date, end_date)`` pair in the future, as ISO strings."""
+    start = date.today() + timedelta(days=next(_days))
+    return start.isoformat(), (start + timedelta(days=days)).isoformat()
+
+
+@pytest.fixture
+def make_bike(conn):
+    def make(price=100.0, bike_type='Cruiser', status='Available', brand=None):
+        cursor = conn.execute(
+            'INSERT INTO bikes (Brand, model, type, price, status, image_url) VALUES (?, ?, ?, ?, ?, ?)',
+            (brand or unique('Brand'), unique('Model'), bike_type, price, status, '/static/images/download.jpg'))
+        conn.commit()
+        return cursor.lastrowid
+    return make
+
+
+@pytest.fixture
+def bike(make_bike):
+    return make_bike()
+
+
+@pytest.fixture
+def user(app, conn):
+    from passwords import hasher
+
+    username, password = unique('user'), 'secret'
+    cursor = conn.execute('INSERT INTO users (username, password) VALUES (?, ?)',
+                          (username, hasher.hash(password)))
+    conn.commit()
+    return {'id': cursor.lastrowid, 'username': username, 'password': password}
+
+
+@pytest.fixture
+def logged_in(client, user):
+    with client.session_transaction() as session:
+        session['user_id'] = user['id']
+    return client
@@ -0,0 +1,106 @@
+import threading
+
+import pytest
+from flask import Blueprint, Flask
+
+import admission as admission_module
+from admission import AdmissionController, Rejected, RouteGate, TokenBuckets
+
+
+def test_buckets_allow_a_burst_then_wait_for_refill():
+    buckets = TokenBuckets(rate=1, burst=2)
+    assert buckets.take('a') == 0
+    assert buckets.take('a') == 0
+    assert 0 < buckets.take('a') <= 1
+    assert buckets.take('b') == 0
+
+
+def test_zero_rate_is_unlimited():
+    buckets = TokenBuckets(rate=0, burst=0)
+    assert all(buckets.take('a') == 0 for _ in range(100))
+
+
+def test_only_recent_keys_are_tracked():
+    buckets = TokenBuckets(rate=0.001, burst=1, max_keys=2)
+    buckets.take('a')
+    buckets.take('b')
+    buckets.take('c')
+    # 'a' was dropped, so it starts over with a full bucket
+    assert buckets.take('a') == 0
+    assert buckets.take('c') > 0
+
+
+def test_gate_sheds_when_full_slow_or_timed_out():
+    gate = RouteGate(limit=1, max_queue=1, max_wait=0.02, target_wait=0.003)
+    assert gate.enter() is None
+    assert gate.enter(block=False) == 'queue_full'
+    assert gate.enter() == 'timeout'
+    assert gate.enter() == 'latency'
+    gate.leave()
+    assert gate.active == 0
+
+
+def test_gate_hands_a_freed_slot_to_the_waiter():
+    gate = RouteGate(limit=1, max_queue=4, max_wait=5, target_wait=5)
+    gate.enter()
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(gate.enter()))
+    waiter.start()
+    while not gate.waiting:
+        pass
+    gate.leave()
+    waiter.join()
+    assert results == [None]
+    assert gate.active == 1
+
+
+def test_controller_answers_429_then_503():
+    controller = AdmissionController(session_rate=0.001, session_burst=1, ip_rate=0, concurrency=1,
+                                     max_queue=0, max_wait=0.01)
+    controller.admit('api.x', 'sid', '10.0.0.1')
+    with pytest.raises(Rejected) as excinfo:
+        controller.admit('api.x', 'sid', '10.0.0.1')
+    assert (excinfo.value.status, excinfo.value.reason) == (429, 'session_rate')
+    assert excinfo.value.retry_after >= 1
+    with pytest.raises(Rejected) as excinfo:
+        controller.admit('api.x', 'other', '10.0.0.1', block=False)
+    assert (excinfo.value.status, excinfo.value.retry_after) == (503, 1)
+    controller.release('api.x')
+    controller.admit('api.y', 'third', None)
+    assert controller.get_stats()[0] == {'admitted': 2, 'session_rate': 1, 'queue_full': 1}
+
+
+def test_route_limits_override_the_default():
+    controller = AdmissionController(concurrency=5, route_limits={'api.export': 1})
+    assert controller.gate('api.export').limit == 1
+    assert controller.gate('api.other').limit == 5
+
+
+def test_blueprint_hooks_reject_with_retry_after(monkeypatch):
+    monkeypatch.setattr(admission_module, 'admission',
+                        AdmissionController(session_rate=0, ip_rate=0.001, ip_burst=2))
+    blueprint = Blueprint('api', __name__)
+    blueprint.add_url_rule('/api/ping', 'ping', lambda: {'ok': True})
+    admission_module.init_blueprint(blueprint)
+    app = Flask(__name__)
+    app.register_blueprint(blueprint)
+    client = app.test_client()
+
+    assert [client.get('/api/ping').status_code for _ in range(2)] == [200, 200]
+    response = client.get('/api/ping')
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    # Every admitted request gave its slot back
+    assert admission_module.admission.gate('api.ping').active == 0
+
+
+def test_asgi_rejects_without_queueing(monkeypatch, bike):
+    import asgi
+    from test_asgi import call
+
+    controller = AdmissionController(session_rate=0, ip_rate=0, route_limits={'api.get_bike': 0})
+    monkeypatch.setattr(asgi, 'admission', controller)
+    status, headers, _ = call(f'/api/bikes/{bike}')
+    assert status == 503
+    assert headers['retry-after'] == '1'
+    assert controller.get_stats()[0] == {'queue_full': 1}
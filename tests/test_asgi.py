@@ -0,0 +1,99 @@
+import asyncio
+import json
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+import pytest
+
+from booking import book
+from conftest import unique, window
+
+
+def call(path, method='GET', query=None, body=None, headers=None):
+    """Run one request through the ASGI app; return ``(status, headers, body)``."""
+    from asgi import application
+
+    scope = {
+        'type': 'http',
+        'method': method,
+        'path': path,
+        'query_string': urlencode(query or {}).encode(),
+        'headers': [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        'client': ('127.0.0.1', 50000),
+    }
+    request = [{'type': 'http.request', 'body': json.dumps(body).encode() if body is not None else b''}]
+    sent = []
+
+    async def receive():
+        return request.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    start = sent[0]
+    return (start['status'],
+            {name.decode(): value.decode() for name, value in start['headers']},
+            b''.join(message.get('body', b'') for message in sent[1:]))
+
+
+@pytest.fixture
+def fleet(make_bike):
+    brand = unique('Async')
+    return brand, [make_bike(brand=brand) for _ in range(3)]
+
+
+@pytest.mark.parametrize('path, query', [
+    ('/api/bikes', {'limit': 2}),
+    ('/api/bikes', {'fields': 'price,secret'}),
+    ('/api/bikes', {'min_price': ''}),
+    ('/api/bikes/999999', None),
+])
+def test_answers_match_the_flask_api(client, fleet, path, query):
+    brand, _ = fleet
+    query = dict(query or {}, brand=brand) if path == '/api/bikes' else query
+    expected = client.get(path, query_string=query)
+    status, _, body = call(path, query=query)
+    assert status == expected.status_code
+    assert json.loads(body) == expected.get_json()
+
+
+def test_path_arguments_are_passed_as_ints(fleet):
+    _, ids = fleet
+    status, _, body = call(f'/api/bikes/{ids[0]}')
+    assert status == 200
+    assert json.loads(body)['id'] == ids[0]
+
+
+def test_unknown_routes_and_methods(fleet):
+    assert call('/api/nothing')[0] == 404
+    assert call('/api/bikes', method='DELETE')[0] == 405
+
+
+def test_login_cookie_reaches_session_routes(conn, bike, user):
+    reservation_id = book(conn, user['id'], bike, *window())['reservation_id']
+    status, headers, _ = call('/api/user/login', method='POST',
+                              body={'username': user['username'], 'password': user['password']})
+    assert status == 200
+    cookie = SimpleCookie(headers['set-cookie'])
+    session = '; '.join(f'{name}={morsel.value}' for name, morsel in cookie.items())
+
+    status, _, body = call('/api/reservations/latest', headers={'Cookie': session})
+    assert status == 200
+    assert json.loads(body)['id'] == reservation_id
+    assert call('/api/reservations/latest')[0] == 401
+
+
+def test_export_streams(conn, bike, user):
+    reservation_id = book(conn, user['id'], bike, *window())['reservation_id']
+    status, headers, body = call('/api/export/reservations', query={'after': reservation_id - 1},
+                                 headers={'Authorization': 'Bearer export-token'})
+    assert status == 200
+    assert headers['content-type'].startswith('application/x-ndjson')
+    assert [json.loads(line)['reservation_id'] for line in body.splitlines()] == [reservation_id]
+
+
+def test_metrics_has_its_own_route():
+    status, headers, body = call('/metrics')
+    assert status == 200
+    assert headers['content-type'].startswith('text/plain')
@@ -0,0 +1,88 @@
+import gzip
+import json
+
+import pytest
+
+import assets
+from assets import IMMUTABLE, AssetManifest
+
+VARIANTS = {
+    'width': 300, 'height': 200,
+    'jpeg': '/static/build/bike-300x200.aaa.jpg', 'jpeg_2x': '/static/build/bike-600x400.bbb.jpg',
+    'webp': '/static/build/bike-300x200.ccc.webp', 'webp_2x': '/static/build/bike-600x400.ddd.webp',
+}
+
+
+@pytest.fixture
+def built(tmp_path):
+    path = tmp_path / 'manifest.json'
+    path.write_text(json.dumps({
+        'files': {'/static/images/bike.jpg': '/static/build/bike.eee.jpg'},
+        'images': {'/static/images/bike.jpg': VARIANTS},
+    }))
+    return AssetManifest(str(path))
+
+
+def test_urls_map_to_hashed_files(built):
+    assert built.url('/static/images/bike.jpg') == '/static/build/bike.eee.jpg'
+    assert built.url('/static/CSS/unbuilt.css') == '/static/CSS/unbuilt.css'
+
+
+def test_bikes_get_thumbnail_srcsets(built):
+    bike = built.resolve_bike({'id': 1, 'image_url': '/static/images/bike.jpg'})
+    assert bike['image_url'] == VARIANTS['jpeg']
+    assert bike['image_srcset'] == f"{VARIANTS['jpeg']} 1x, {VARIANTS['jpeg_2x']} 2x"
+    assert bike['image_webp_srcset'].endswith(f"{VARIANTS['webp_2x']} 2x")
+    assert built.resolve_bike({'image_url': 'https://example.com/x.jpg'}) == {'image_url': 'https://example.com/x.jpg'}
+
+
+def test_missing_manifest_serves_raw_files(tmp_path):
+    manifest = AssetManifest(str(tmp_path / 'absent.json'))
+    assert manifest.url('/static/CSS/bikestyle.css') == '/static/CSS/bikestyle.css'
+    assert manifest.image('/static/images/bike.jpg') is None
+
+
+def test_build_outputs_are_immutable_and_gzipped(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(assets, 'BUILD_DIR', str(tmp_path))
+    css = b'body { color: black; }\n' * 50
+    (tmp_path / 'site.123.css').write_bytes(css)
+    (tmp_path / 'site.123.css.gz').write_bytes(gzip.compress(css))
+
+    response = client.get('/static/build/site.123.css', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Cache-Control'] == IMMUTABLE
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.mimetype == 'text/css'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    response.close()
+
+    response = client.get('/static/build/site.123.css', headers={'Accept-Encoding': 'gzip;q=0, identity'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == css
+    response.close()
+
+
+def test_build_writes_hashed_variants_and_manifest(tmp_path, monkeypatch):
+    Image = pytest.importorskip('PIL.Image')
+    import build_assets
+
+    images, styles, out = tmp_path / 'images', tmp_path / 'CSS', tmp_path / 'build'
+    images.mkdir()
+    styles.mkdir()
+    Image.new('RGB', (800, 600), 'red').save(images / 'Red Bike.jpg')
+    (styles / 'site.css').write_text("body { background: url('/static/images/Red Bike.jpg'); }" + ' ' * 500)
+    monkeypatch.setattr(build_assets, 'IMAGE_DIR', str(images))
+    monkeypatch.setattr(build_assets, 'CSS_DIR', str(styles))
+    monkeypatch.setattr(build_assets, 'BUILD_DIR', str(out))
+    monkeypatch.setattr(build_assets, 'MANIFEST_PATH', str(out / 'manifest.json'))
+
+    manifest = build_assets.build()
+    variants = manifest['images']['/static/images/Red Bike.jpg']
+    assert variants['jpeg'].startswith('/static/build/red-bike-300x200.')
+    assert variants['webp_2x'].endswith('.webp')
+    with Image.open(out / variants['jpeg_2x'].rsplit('/', 1)[1]) as thumbnail:
+        assert thumbnail.size == (600, 400)
+    css_url = manifest['files']['/static/CSS/site.css']
+    css = (out / css_url.rsplit('/', 1)[1]).read_text()
+    assert manifest['files']['/static/images/Red Bike.jpg'] in css
+    assert (out / (css_url.rsplit('/', 1)[1] + '.gz')).exists()
+    assert json.loads((out / 'manifest.json').read_text()) == manifest
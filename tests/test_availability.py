@@ -0,0 +1,69 @@
+from datetime import date, datetime, timedelta
+
+from availability import MAX_WINDOWS_PER_QUERY, day_number, day_range, find_conflicts, is_available
+
+
+def reserve(conn, bike_id, start_date, end_date, user_id=1):
+    start_day, end_day = day_range(start_date, end_date)
+    conn.execute('''
+        INSERT INTO reservations (bike_id, user_id, start_date, end_date, total_cost, status, start_day, end_day)
+        VALUES (?, ?, ?, ?, 1.0, 'confirmed', ?, ?)
+    ''', (bike_id, user_id, start_date, end_date, start_day, end_day))
+    conn.commit()
+
+
+def test_day_number_accepts_strings_dates_and_datetimes():
+    day = date(2030, 5, 17)
+    assert day_number('2030-05-17') == day.toordinal()
+    assert day_number(day) == day.toordinal()
+    assert day_number(datetime(2030, 5, 17, 23, 59)) == day.toordinal()
+
+
+def test_day_range_is_half_open_over_inclusive_dates():
+    start_day, end_day = day_range('2030-05-17', '2030-05-19')
+    assert end_day - start_day == 3
+
+
+def test_overlaps_conflict_and_adjacent_rentals_do_not(conn, bike):
+    reserve(conn, bike, '2030-06-10', '2030-06-12')
+    assert not is_available(conn, bike, '2030-06-12', '2030-06-14')
+    assert not is_available(conn, bike, '2030-06-08', '2030-06-10')
+    assert not is_available(conn, bike, '2030-06-11', '2030-06-11')
+    assert is_available(conn, bike, '2030-06-13', '2030-06-15')
+    assert is_available(conn, bike, '2030-06-05', '2030-06-09')
+
+
+def test_other_bikes_do_not_conflict(conn, make_bike):
+    booked, free = make_bike(), make_bike()
+    reserve(conn, booked, '2030-07-01', '2030-07-03')
+    assert is_available(conn, free, '2030-07-01', '2030-07-03')
+
+
+def test_find_conflicts_keeps_window_order(conn, make_bike):
+    first, second = make_bike(), make_bike()
+    reserve(conn, first, '2030-08-01', '2030-08-05')
+    windows = [
+        (first, '2030-08-04', '2030-08-06'),
+        (second, '2030-08-04', '2030-08-06'),
+        (first, '2030-08-06', '2030-08-07'),
+        (first, '2030-07-30', '2030-08-01'),
+    ]
+    assert find_conflicts(conn, windows) == [True, False, False, True]
+
+
+def test_find_conflicts_spans_several_queries(conn, bike):
+    reserve(conn, bike, '2031-01-01', '2031-01-01')
+    start = date(2030, 1, 1)
+    windows = [(bike, (start + timedelta(days=n)).isoformat(), (start + timedelta(days=n)).isoformat())
+               for n in range(MAX_WINDOWS_PER_QUERY * 2 + 10)]
+    conflicts = find_conflicts(conn, windows)
+    assert len(conflicts) == len(windows)
+    assert [index for index, conflict in enumerate(conflicts) if conflict] == [365]
+
+
+def test_conflict_lookup_uses_the_day_index(conn):
+    plan = ' '.join(row[3] for row in conn.execute('''
+        EXPLAIN QUERY PLAN
+        SELECT 1 FROM reservations WHERE bike_id = ? AND start_day < ? AND end_day > ? LIMIT 1
+    ''', (1, 2, 3)))
+    assert 'USING INDEX' in plan or 'USING COVERING INDEX' in plan
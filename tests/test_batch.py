@@ -0,0 +1,102 @@
+import pytest
+
+from booking import MAX_BATCH_ITEMS, BookingError, book, book_many
+from conftest import window
+from listing import latest_reservation
+
+
+def item(bike_id, dates):
+    return {'bike_id': bike_id, 'start_date': dates[0], 'end_date': dates[1]}
+
+
+def count(conn, user_id):
+    return conn.execute('SELECT COUNT(*) FROM reservations WHERE user_id = ?', (user_id,)).fetchone()[0]
+
+
+def test_group_is_booked_with_pending_payments(conn, make_bike, user):
+    bikes = [make_bike(price=50.0) for _ in range(3)]
+    dates = window()
+    result = book_many(conn, user['id'], [item(bike, dates) for bike in bikes], payment_method='invoice')
+    assert [r['bike_id'] for r in result['reservations']] == bikes
+    payment_ids = [r['payment_id'] for r in result['reservations']]
+    assert all(payment_ids)
+    # Nothing was charged, so neither the payments nor the reservations are settled
+    rows = conn.execute(f'''
+        SELECT p.payment_status, p.payment_method, r.status FROM payments p
+        JOIN reservations r ON r.id = p.reservation_id
+        WHERE p.id IN ({', '.join('?' * len(payment_ids))})
+    ''', payment_ids).fetchall()
+    assert {tuple(row) for row in rows} == {('pending', 'invoice', 'pending')}
+    assert result['errors'] == []
+    assert latest_reservation(conn, user['id'])['id'] == result['reservations'][-1]['reservation_id']
+
+
+def test_all_or_nothing_books_nothing_on_any_conflict(conn, make_bike, user):
+    free, taken = make_bike(), make_bike()
+    dates = window()
+    book(conn, user['id'], taken, *dates)
+    before = count(conn, user['id'])
+    result = book_many(conn, user['id'], [item(free, dates), item(taken, dates)])
+    assert result['reservations'] == []
+    assert result['errors'] == [{'index': 1, 'error': 'Bike is already reserved for these dates'}]
+    assert count(conn, user['id']) == before
+
+
+def test_best_effort_books_what_it_can(conn, make_bike, user):
+    free = make_bike()
+    dates = window(days=3)
+    overlapping = (dates[1], dates[1])
+    items = [item(free, dates), item(free, overlapping), item(999999, dates), {'bike_id': free}]
+    result = book_many(conn, user['id'], items, best_effort=True)
+    assert [r['index'] for r in result['reservations']] == [0]
+    assert result['errors'] == [
+        {'index': 1, 'error': 'Bike is already reserved for these dates'},
+        {'index': 2, 'error': 'Bike not found or not available'},
+        {'index': 3, 'error': 'Missing required fields'},
+    ]
+
+
+def test_retried_batch_returns_the_first_result(conn, make_bike, user):
+    bikes = [make_bike(), make_bike()]
+    items = [item(bike, window()) for bike in bikes]
+    first = book_many(conn, user['id'], items, idempotency_key='group-1')
+    again = book_many(conn, user['id'], items, idempotency_key='group-1')
+    assert again['replayed'] is True
+    assert sorted(r['reservation_id'] for r in again['reservations']) == \
+        [r['reservation_id'] for r in first['reservations']]
+
+
+@pytest.mark.parametrize('items', [[], 'bikes', [{}] * (MAX_BATCH_ITEMS + 1)])
+def test_batch_shape_is_checked(conn, user, items):
+    with pytest.raises(BookingError):
+        book_many(conn, user['id'], items)
+
+
+def test_batch_endpoint_modes(logged_in, make_bike):
+    free, taken = make_bike(), make_bike()
+    dates = window()
+    assert logged_in.post('/api/reservations', json=item(taken, dates)).status_code == 200
+    items = [item(free, dates), item(taken, dates)]
+
+    response = logged_in.post('/api/reservations/batch', json={'items': items})
+    assert response.status_code == 409
+    assert response.get_json()['total_cost'] == 0
+
+    response = logged_in.post('/api/reservations/batch', json={'items': items, 'mode': 'best_effort'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [r['bike_id'] for r in body['reservations']] == [free]
+    assert body['total_cost'] == body['reservations'][0]['total_cost']
+
+
+@pytest.mark.parametrize('body, status', [
+    ({'items': [], 'mode': 'some'}, 400),
+    ({}, 400),
+    ({'items': []}, 400),
+])
+def test_batch_endpoint_rejects_bad_requests(logged_in, body, status):
+    assert logged_in.post('/api/reservations/batch', json=body).status_code == status
+
+
+def test_batch_endpoint_needs_a_login(app):
+    assert app.test_client().post('/api/reservations/batch', json={'items': []}).status_code == 401
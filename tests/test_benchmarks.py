@@ -0,0 +1,49 @@
+import sqlite3
+
+from benchmarks.load import Recorder, seed
+
+
+class Canned:
+    def __init__(self, *replies):
+        self.replies = list(replies)
+
+    def request(self, method, path, **kwargs):
+        return self.replies.pop(0)
+
+
+def paid(status, location):
+    return location is not None and location.endswith('/thank_you')
+
+
+def test_outcomes_follow_the_redirect_target():
+    recorder = Recorder()
+    session = Canned((302, b'', '/thank_you'), (302, b'', '/bikes'), (302, b'', '/thank_you'))
+    for _ in range(3):
+        recorder.timed('payment', session, 'POST', '/payment', succeeded=paid)
+    report = recorder.report({'payment': 1.0})['payment']
+    assert report['requests'] == 3
+    assert report['statuses'] == {'302': 3}
+    assert (report['succeeded'], report['failed']) == (2, 1)
+    assert report['throughput_rps'] == 3.0
+
+
+def test_endpoints_without_a_judge_report_statuses_only():
+    recorder = Recorder()
+    recorder.timed('catalog', Canned((200, b'[]', None)), 'GET', '/api/bikes')
+    report = recorder.report({})['catalog']
+    assert 'succeeded' not in report
+    assert report['throughput_rps'] is None
+    assert report['p50_ms'] <= report['p99_ms']
+
+
+def test_seed_builds_the_requested_history(tmp_path):
+    path = str(tmp_path / 'load.db')
+    fleet = seed(path, bikes=12, reservations=50, users=3, password='secret')
+    conn = sqlite3.connect(path)
+    try:
+        # The sample bikes from BikesDB.initialize are part of the fleet
+        assert conn.execute('SELECT COUNT(*) FROM bikes').fetchone()[0] == fleet >= 12
+        assert conn.execute('SELECT COUNT(*) FROM reservations').fetchone()[0] == 50
+        assert conn.execute('SELECT COUNT(*) FROM reservations WHERE end_day <= start_day').fetchone()[0] == 0
+    finally:
+        conn.close()
@@ -0,0 +1,68 @@
+import re
+
+import pytest
+
+
+def current_version(client):
+    return client.get('/api/bikes/changes', query_string={'since': 0}).get_json()['version']
+
+
+def changes(client, since):
+    response = client.get('/api/bikes/changes', query_string={'since': since})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_page_needs_a_login(client):
+    response = client.get('/bikes')
+    assert response.status_code == 302
+    assert '/login' in response.headers['Location']
+
+
+def test_cards_are_rendered_on_the_server(logged_in, conn, bike):
+    page = logged_in.get('/bikes').get_data(as_text=True)
+    assert f'data-bike-id="{bike}"' in page
+    version = int(re.search(r'let catalogVersion = (\d+);', page).group(1))
+    assert version == current_version(logged_in)
+
+
+def test_cards_are_rebuilt_after_a_write(logged_in, conn, bike):
+    logged_in.get('/bikes')
+    model = 'Repainted'
+    conn.execute('UPDATE bikes SET model = ? WHERE id = ?', (model, bike))
+    conn.commit()
+    assert f'Model: {model}' in logged_in.get('/bikes').get_data(as_text=True)
+
+
+def test_no_changes_since_the_current_version(client, bike):
+    version = current_version(client)
+    assert changes(client, version) == {'version': version, 'reset': False, 'bikes': [], 'deleted': []}
+
+
+def test_changes_list_updated_and_deleted_bikes(client, conn, make_bike):
+    updated, deleted = make_bike(), make_bike()
+    version = current_version(client)
+    conn.execute('UPDATE bikes SET price = 1.5 WHERE id = ?', (updated,))
+    conn.execute('DELETE FROM bikes WHERE id = ?', (deleted,))
+    conn.commit()
+    result = changes(client, version)
+    assert result['reset'] is False
+    assert [bike['id'] for bike in result['bikes']] == [updated]
+    assert result['bikes'][0]['price'] == 1.5
+    assert result['deleted'] == [deleted]
+    assert result['version'] > version
+
+
+def test_bulk_writes_and_unknown_versions_reset(client, conn, bike):
+    version = current_version(client)
+    assert changes(client, version + 1000)['reset'] is True
+    conn.execute("INSERT INTO changes (source, bike_id) VALUES ('bikes', NULL)")
+    conn.commit()
+    result = changes(client, version)
+    assert result['reset'] is True
+    assert bike in {row['id'] for row in result['bikes']}
+
+
+@pytest.mark.parametrize('since', ['', 'abc', '-1'])
+def test_since_must_be_a_version(client, since):
+    assert client.get('/api/bikes/changes', query_string={'since': since}).status_code == 400
@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from booking import BookingError, book, checkout
+from conftest import window
+
+
+def count(conn, table, reservation_id):
+    column = 'id' if table == 'reservations' else 'reservation_id'
+    return conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {column} = ?', (reservation_id,)).fetchone()[0]
+
+
+def test_book_with_payment_writes_both_rows(conn, bike, user):
+    result = book(conn, user['id'], bike, *window(), payment_method='credit_card')
+    assert result['replayed'] is False
+    assert result['total_cost'] > 0
+    assert count(conn, 'payments', result['reservation_id']) == 1
+    status = conn.execute('SELECT status FROM reservations WHERE id = ?', (result['reservation_id'],)).fetchone()[0]
+    assert status == 'confirmed'
+
+
+def test_overlapping_booking_is_refused(conn, bike, user):
+    start_date, end_date = window(days=4)
+    book(conn, user['id'], bike, start_date, end_date)
+    with pytest.raises(BookingError) as excinfo:
+        book(conn, user['id'], bike, end_date, end_date)
+    assert excinfo.value.status == 400
+    assert not conn.in_transaction
+
+
+def test_maintenance_bike_is_not_found(conn, make_bike, user):
+    with pytest.raises(BookingError) as excinfo:
+        book(conn, user['id'], make_bike(status='Maintenance'), *window())
+    assert excinfo.value.status == 404
+
+
+@pytest.mark.parametrize('start_date, end_date', [('2030-01-05', '2030-01-01'), ('soon', '2030-01-01')])
+def test_bad_dates_are_refused(conn, bike, user, start_date, end_date):
+    with pytest.raises(BookingError):
+        book(conn, user['id'], bike, start_date, end_date)
+
+
+def test_idempotency_key_replays_the_first_booking(conn, bike, user):
+    dates = window()
+    first = book(conn, user['id'], bike, *dates, payment_method='credit_card', idempotency_key='retry-1')
+    again = book(conn, user['id'], bike, *dates, payment_method='credit_card', idempotency_key='retry-1')
+    assert again['replayed'] is True
+    assert again['reservation_id'] == first['reservation_id']
+    assert again['payment_id'] == first['payment_id']
+    assert count(conn, 'payments', first['reservation_id']) == 1
+
+
+def test_concurrent_bookings_of_one_window_let_one_through(app, bike, user):
+    from database import pool
+
+    dates = window()
+
+    def attempt(_):
+        connection = pool.acquire()
+        try:
+            return book(connection, user['id'], bike, *dates)['reservation_id']
+        except BookingError:
+            return None
+        finally:
+            pool.release(connection)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(attempt, range(8)))
+    assert len([result for result in results if result is not None]) == 1
+
+
+def test_checkout_commits_through_the_ledger(conn, bike, user):
+    dates = window()
+    result = checkout(user['id'], bike, *dates, payment_method='credit_card', idempotency_key='checkout-1')
+    assert count(conn, 'reservations', result['reservation_id']) == 1
+    assert count(conn, 'payments', result['reservation_id']) == 1
+    again = checkout(user['id'], bike, *dates, payment_method='credit_card', idempotency_key='checkout-1')
+    assert again['replayed'] is True
+    assert again['reservation_id'] == result['reservation_id']
+
+
+def test_api_replays_on_the_same_idempotency_key(logged_in, bike):
+    start_date, end_date = window()
+    body = {'bike_id': bike, 'start_date': start_date, 'end_date': end_date}
+    headers = {'Idempotency-Key': 'api-retry-1'}
+    first = logged_in.post('/api/reservations', json=body, headers=headers)
+    second = logged_in.post('/api/reservations', json=body, headers=headers)
+    assert first.status_code == second.status_code == 200
+    assert first.get_json()['reservation_id'] == second.get_json()['reservation_id']
+    assert logged_in.post('/api/reservations', json=body).status_code == 400
+
+
+def test_api_needs_a_login_and_fields(app, logged_in, bike):
+    assert app.test_client().post('/api/reservations', json={}).status_code == 401
+    assert logged_in.post('/api/reservations', json={'bike_id': bike}).status_code == 400
+
+
+def test_payment_page_books_and_pays(logged_in, conn, bike, user):
+    start_date, end_date = window()
+    page = logged_in.get('/payment', query_string={'bike_id': bike, 'start_date': start_date, 'end_date': end_date})
+    assert page.status_code == 200
+    response = logged_in.post('/payment')
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/thank_you')
+    reservation_id = conn.execute('SELECT MAX(id) FROM reservations WHERE user_id = ?', (user['id'],)).fetchone()[0]
+    assert count(conn, 'payments', reservation_id) == 1
+
+
+def test_cancel_removes_the_reservation(logged_in, conn, bike, user):
+    reservation_id = book(conn, user['id'], bike, *window())['reservation_id']
+    assert logged_in.delete(f'/api/reservations/{reservation_id}').status_code == 200
+    assert count(conn, 'reservations', reservation_id) == 0
+    assert logged_in.delete(f'/api/reservations/{reservation_id}').status_code == 404
@@ -0,0 +1,63 @@
+import json
+import sqlite3
+
+import pytest
+
+from bulk_load import load, read_records
+from create_db_bikes import BikesDB
+
+
+@pytest.fixture
+def db(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / 'bulk.db'))
+    conn.execute('PRAGMA synchronous=FULL')
+    yield conn
+    conn.close()
+
+
+def write_csv(path, rows):
+    path.write_text('Brand,model,type,price\n' + ''.join(f'{",".join(map(str, row))}\n' for row in rows))
+    return str(path)
+
+
+def test_migrate_is_repeatable(db):
+    assert BikesDB.migrate(db) == len(BikesDB.MIGRATIONS)
+    assert BikesDB.migrate(db) == len(BikesDB.MIGRATIONS)
+    assert db.execute('PRAGMA user_version').fetchone()[0] == len(BikesDB.MIGRATIONS)
+
+
+def test_bikes_load_keeps_wal_indexes_and_search(db, tmp_path):
+    path = write_csv(tmp_path / 'fleet.csv', [('Zephyr', f'Z{n}', 'Cruiser', 50 + n) for n in range(25)])
+    assert load(db, 'bikes', read_records(path)) == 25
+    assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert db.execute('PRAGMA synchronous').fetchone()[0] == 2
+    triggers = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    assert 'trg_bikes_fts_insert' in triggers
+    hits = db.execute("SELECT COUNT(*) FROM bikes_fts WHERE bikes_fts MATCH 'Zephyr'").fetchone()[0]
+    assert hits == 25
+    # One "reload everything" entry instead of one per row
+    assert db.execute("SELECT COUNT(*), MAX(bike_id IS NULL) FROM changes WHERE source = 'bikes'").fetchone() == (1, 1)
+
+
+def test_reservations_load_fills_days_and_latest(db, tmp_path):
+    BikesDB.migrate(db)
+    path = tmp_path / 'history.ndjson'
+    path.write_text(''.join(json.dumps({
+        'bike_id': 1, 'user_id': 7, 'start_date': f'2024-03-0{n}', 'end_date': f'2024-03-0{n + 1}',
+        'total_cost': 10,
+    }) + '\n' for n in range(1, 4)))
+    assert load(db, 'reservations', read_records(str(path))) == 3
+    start_day, end_day = db.execute('SELECT start_day, end_day FROM reservations ORDER BY id LIMIT 1').fetchone()
+    assert end_day - start_day == 2
+    latest = db.execute('SELECT reservation_id FROM user_latest_reservation WHERE user_id = 7').fetchone()[0]
+    assert latest == db.execute('SELECT MAX(id) FROM reservations').fetchone()[0]
+    assert 'idx_reservations_bike_days' in {row[1] for row in db.execute('PRAGMA index_list(reservations)')}
+
+
+def test_bad_record_loads_nothing(db, tmp_path):
+    path = write_csv(tmp_path / 'broken.csv', [('Good', 'G1', 'Cruiser', 10), ('Bad', 'B1', 'Cruiser', 'cheap')])
+    with pytest.raises(ValueError):
+        load(db, 'bikes', read_records(path))
+    assert db.execute('SELECT COUNT(*) FROM bikes').fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'trg_bikes_fts_insert'").fetchone()[0] == 1
+    assert db.execute('PRAGMA synchronous').fetchone()[0] == 2
@@ -0,0 +1,50 @@
+def test_catalog_has_an_etag_and_must_revalidate(client, bike):
+    response = client.get('/api/bikes')
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert response.get_etag()[0]
+    assert bike in {row['id'] for row in response.get_json()}
+
+
+def test_matching_etag_gets_304(client, bike):
+    etag = client.get('/api/bikes').headers['ETag']
+    response = client.get('/api/bikes', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+
+def test_weak_etag_of_a_compressed_catalog_still_matches(client, make_bike):
+    # Enough bikes to pass the compression threshold
+    for _ in range(20):
+        make_bike()
+    response = client.get('/api/bikes', headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+    assert client.get('/api/bikes', headers={'If-None-Match': etag}).status_code == 304
+
+
+def test_write_from_another_connection_changes_the_etag(client, conn, bike):
+    etag = client.get('/api/bikes').headers['ETag']
+    conn.execute('UPDATE bikes SET price = price + 1 WHERE id = ?', (bike,))
+    conn.commit()
+    response = client.get('/api/bikes', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+
+def test_single_bike_comes_from_the_snapshot(client, bike):
+    response = client.get(f'/api/bikes/{bike}')
+    assert response.status_code == 200
+    assert response.get_json()['id'] == bike
+    assert client.get('/api/bikes/999999').status_code == 404
+
+
+def test_snapshot_is_reused_until_a_write(conn, bike):
+    from catalog import catalog
+
+    first = catalog.get(conn)
+    assert catalog.get(conn) is first
+    conn.execute("UPDATE bikes SET status = 'Rented' WHERE id = ?", (bike,))
+    conn.commit()
+    assert catalog.get(conn) is not first
@@ -0,0 +1,64 @@
+import sqlite3
+
+import pytest
+
+from conftest import DATABASE
+
+
+def test_connections_are_reused(app):
+    from database import ConnectionPool
+
+    pool = ConnectionPool(DATABASE, size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert pool.get_stats()['opened'] == 1
+    pool.release(conn)
+    pool.close_all()
+
+
+def test_connections_are_configured(app):
+    from database import ConnectionPool
+
+    pool = ConnectionPool(DATABASE, size=1, busy_timeout=1234)
+    conn = pool.acquire()
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert conn.execute('PRAGMA busy_timeout').fetchone()[0] == 1234
+    assert conn.row_factory is sqlite3.Row
+    pool.release(conn)
+    pool.close_all()
+
+
+def test_exhausted_pool_times_out(app):
+    from database import ConnectionPool
+
+    pool = ConnectionPool(DATABASE, size=1, timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(sqlite3.OperationalError):
+        pool.acquire()
+    assert pool.get_stats()['waits'] == 1
+    pool.release(conn)
+    pool.close_all()
+
+
+def test_release_rolls_back_open_transaction(app):
+    from database import ConnectionPool
+
+    pool = ConnectionPool(DATABASE, size=1)
+    conn = pool.acquire()
+    conn.execute("INSERT INTO users (username, password) VALUES ('rolled-back', 'x')")
+    pool.release(conn)
+    conn = pool.acquire()
+    assert not conn.in_transaction
+    assert conn.execute("SELECT 1 FROM users WHERE username = 'rolled-back'").fetchone() is None
+    pool.release(conn)
+    pool.close_all()
+
+
+def test_get_db_is_one_connection_per_app_context(app):
+    from database import get_db, pool
+
+    idle = pool.get_stats()['idle']
+    with app.app_context():
+        assert get_db() is get_db()
+    assert pool.get_stats()['idle'] >= idle
@@ -0,0 +1,117 @@
+import gzip
+import json
+import zlib
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import encoding
+from encoding import Compressor, Rows, dumps, encode_rows
+
+COLUMNS = ['id', 'name', 'price', 'note', 'image']
+ROWS = [
+    (1, 'Ducati "Monster"', 99.5, None, '/a.jpg', 'cursor-1'),
+    (2, 'Café\nRacer', 120, 'ünïcode', '/b.jpg', 'cursor-2'),
+    (3, 'Plain', 0.1, 'x', '/a.jpg', 'cursor-3'),
+]
+
+
+@pytest.fixture(params=['stdlib', 'orjson'])
+def encoder(request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(encoding, 'orjson', None)
+    return request.param
+
+
+def test_dumps_matches_compact_jsonify(encoder):
+    data = {'b': [1, 2.5, None], 'a': 'ü', 'when': date(2030, 1, 2), 'amount': Decimal('1.10')}
+    body = dumps(data)
+    assert body.endswith(b'\n')
+    assert json.loads(body) == {'a': 'ü', 'amount': '1.10', 'b': [1, 2.5, None], 'when': 'Wed, 02 Jan 2030 00:00:00 GMT'}
+    assert list(json.loads(body)) == sorted(data)
+    assert json.loads(encode_rows(['when'], [(date(2030, 1, 2),)])) == [{'when': 'Wed, 02 Jan 2030 00:00:00 GMT'}]
+
+
+def test_rows_encode_like_dicts_and_skip_extra_columns(encoder):
+    body = encode_rows(COLUMNS, ROWS)
+    assert json.loads(body) == [dict(zip(COLUMNS, row)) for row in ROWS]
+    assert encode_rows(COLUMNS, []) == b'[]\n'
+
+
+def test_expanded_columns_are_computed_once_per_value(encoder):
+    calls = []
+
+    def variants(path):
+        calls.append(path)
+        return {'image': path, 'image_2x': path.replace('.jpg', '@2x.jpg')}
+
+    rows = Rows(COLUMNS, ROWS, expand={'image': variants, 'missing': variants})
+    decoded = json.loads(rows.encode())
+    assert len(rows) == 3
+    assert decoded[0]['image_2x'] == '/a@2x.jpg'
+    assert decoded[1] == {'id': 2, 'name': 'Café\nRacer', 'price': 120, 'note': 'ünïcode',
+                          'image': '/b.jpg', 'image_2x': '/b@2x.jpg'}
+    assert sorted(calls) == ['/a.jpg', '/b.jpg']
+
+
+def test_non_finite_floats_are_null_on_both_paths(monkeypatch):
+    rows = [(1, float('nan'), float('inf')), (2, -float('inf'), 1.5)]
+    data = {'prices': [float('nan'), 2.0], 'total': float('inf')}
+    encoded = {}
+    for name in ('stdlib', 'orjson'):
+        if name == 'orjson':
+            if encoding.orjson is None:
+                continue
+            monkeypatch.undo()
+        else:
+            monkeypatch.setattr(encoding, 'orjson', None)
+        encoded[name] = encode_rows(['id', 'low', 'high'], rows), dumps(data)
+    body, document = encoded['stdlib']
+    assert json.loads(body) == [{'id': 1, 'low': None, 'high': None}, {'id': 2, 'low': None, 'high': 1.5}]
+    assert json.loads(document) == {'prices': [None, 2.0], 'total': None}
+    if 'orjson' in encoded:
+        assert [json.loads(part) for part in encoded['orjson']] == [json.loads(body), json.loads(document)]
+
+
+@pytest.mark.parametrize('accept, coding', [
+    ('gzip, deflate', 'gzip'),
+    ('deflate;q=1.0, gzip;q=0.5', 'deflate'),
+    ('br', None),
+    ('gzip;q=0', None),
+    ('', None),
+    (None, None),
+])
+def test_negotiation(accept, coding):
+    assert Compressor().negotiate(accept) == coding
+
+
+def test_compressed_bodies_round_trip_and_are_cached_by_etag():
+    compressor = Compressor(min_size=10)
+    body = b'{"bikes":' + b'[1,2,3],' * 200 + b'0}'
+    assert not compressor.applies(b'{}')
+    assert compressor.applies(body)
+    packed = compressor.compress(body, 'gzip', etag='abc')
+    assert gzip.decompress(packed) == body
+    assert compressor.compress(body, 'gzip', etag='abc') is packed
+    assert zlib.decompress(compressor.compress(body, 'deflate')) == body
+    assert compressor.get_stats()['gzip', 'responses'] == 2
+
+
+def test_large_api_bodies_are_compressed(client, make_bike):
+    for _ in range(20):
+        make_bike()
+    plain = client.get('/api/bikes/search', query_string={'limit': 20})
+    assert 'Content-Encoding' not in plain.headers
+    assert 'Accept-Encoding' in plain.headers['Vary']
+    packed = client.get('/api/bikes/search', query_string={'limit': 20}, headers={'Accept-Encoding': 'deflate'})
+    assert packed.headers['Content-Encoding'] == 'deflate'
+    assert json.loads(zlib.decompress(packed.data)) == plain.get_json()
+
+
+def test_small_bodies_are_sent_as_they_are(client, bike):
+    response = client.get(f'/api/bikes/{bike}', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json()['id'] == bike
@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+
+import pytest
+
+from booking import book
+from conftest import window
+
+AUTH = {'Authorization': 'Bearer export-token'}
+
+
+@pytest.fixture
+def booked(conn, bike, user):
+    ids = []
+    for payment_method in (None, 'credit_card', None):
+        ids.append(book(conn, user['id'], bike, *window(), payment_method=payment_method)['reservation_id'])
+    return ids
+
+
+def export(client, **args):
+    response = client.get('/api/export/reservations', query_string=args, headers=AUTH)
+    assert response.status_code == 200
+    return response
+
+
+@pytest.mark.parametrize('headers', [
+    {},
+    {'Authorization': 'Bearer wrong'},
+    {'Authorization': 'Bearer tökén'},
+])
+def test_export_needs_the_token(client, headers):
+    response = client.get('/api/export/reservations', headers=headers)
+    assert response.status_code == 401
+
+
+def test_ndjson_has_one_reservation_per_line(client, booked):
+    response = export(client, after=booked[0] - 1)
+    assert response.mimetype == 'application/x-ndjson'
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row['reservation_id'] for row in rows] == booked
+    assert rows[1]['payment_method'] == 'credit_card'
+    assert rows[0]['payment_id'] is None
+
+
+def test_csv_starts_with_a_header(client, booked):
+    response = export(client, format='csv', after=booked[0] - 1)
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert [int(row['reservation_id']) for row in rows] == booked
+
+
+def test_export_resumes_after_a_reservation_id(client, booked):
+    response = export(client, after=booked[1])
+    ids = [json.loads(line)['reservation_id'] for line in response.get_data(as_text=True).splitlines()]
+    assert ids == booked[2:]
+
+
+@pytest.mark.parametrize('args', [{'after': '2024-01-01'}, {'format': 'xml'}])
+def test_bad_export_arguments_are_400(client, args):
+    response = client.get('/api/export/reservations', query_string=args, headers=AUTH)
+    assert response.status_code == 400
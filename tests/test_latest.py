@@ -0,0 +1,60 @@
+import pytest
+
+from booking import book, cancel
+from conftest import window
+from listing import latest_reservation
+
+
+@pytest.fixture
+def two_bookings(conn, bike, user):
+    first = book(conn, user['id'], bike, *window())['reservation_id']
+    second = book(conn, user['id'], bike, *window(), payment_method='credit_card')['reservation_id']
+    return first, second
+
+
+def test_latest_is_the_newest_booking(conn, user, two_bookings):
+    latest = latest_reservation(conn, user['id'])
+    assert latest['id'] == two_bookings[1]
+    assert latest['payment_method'] == 'credit_card'
+    assert latest['bike_brand']
+
+
+def test_cancelling_the_latest_falls_back_to_the_previous(conn, user, two_bookings):
+    first, second = two_bookings
+    cancel(conn, user['id'], second)
+    assert latest_reservation(conn, user['id'])['id'] == first
+    cancel(conn, user['id'], first)
+    assert latest_reservation(conn, user['id']) is None
+
+
+def test_cancelling_an_older_booking_keeps_the_latest(conn, user, two_bookings):
+    cancel(conn, user['id'], two_bookings[0])
+    assert latest_reservation(conn, user['id'])['id'] == two_bookings[1]
+
+
+def test_latest_endpoint(logged_in, two_bookings):
+    response = logged_in.get('/api/reservations/latest')
+    assert response.status_code == 200
+    assert response.get_json()['id'] == two_bookings[1]
+
+
+def test_latest_endpoint_without_bookings(logged_in, app):
+    assert logged_in.get('/api/reservations/latest').status_code == 404
+    assert app.test_client().get('/api/reservations/latest').status_code == 401
+
+
+def test_payment_endpoint(logged_in, conn, bike, two_bookings):
+    first, second = two_bookings
+    response = logged_in.get(f'/api/reservations/{second}/payment')
+    assert response.status_code == 200
+    assert response.get_json()['reservation_id'] == second
+    assert logged_in.get(f'/api/reservations/{first}/payment').get_json() == {'error': 'Payment not found'}
+    other = book(conn, 999999, bike, *window(), payment_method='credit_card')['reservation_id']
+    assert logged_in.get(f'/api/reservations/{other}/payment').status_code == 404
+
+
+def test_thank_you_shows_the_latest_booking(logged_in, conn, bike, two_bookings):
+    model = conn.execute('SELECT model FROM bikes WHERE id = ?', (bike,)).fetchone()[0]
+    response = logged_in.get('/thank_you')
+    assert response.status_code == 200
+    assert model in response.get_data(as_text=True)
@@ -0,0 +1,77 @@
+import threading
+import time
+
+import pytest
+
+from ledger import PaymentLedger
+
+
+@pytest.fixture
+def entries(conn):
+    conn.execute('CREATE TABLE IF NOT EXISTS ledger_entries (id INTEGER PRIMARY KEY, value TEXT NOT NULL)')
+    conn.execute('DELETE FROM ledger_entries')
+    conn.commit()
+    yield lambda: [row[0] for row in conn.execute('SELECT value FROM ledger_entries ORDER BY id')]
+
+
+@pytest.fixture
+def ledger(app):
+    from database import pool
+
+    ledger = PaymentLedger(pool, max_batch=8, max_delay=0.05)
+    yield ledger
+    ledger.close()
+
+
+def record(conn, value):
+    conn.execute('INSERT INTO ledger_entries (value) VALUES (?)', (value,))
+    if value == 'bad':
+        raise ValueError('rejected')
+    return value.upper()
+
+
+def test_entries_are_committed_in_batches(ledger, entries):
+    futures = [ledger.submit(record, f'v{n}') for n in range(20)]
+    assert [future.result(timeout=5) for future in futures] == [f'V{n}' for n in range(20)]
+    assert entries() == [f'v{n}' for n in range(20)]
+    stats = ledger.get_stats()
+    assert stats['entries'] == 20
+    assert 3 <= stats['batches'] < 20
+
+
+def test_a_failing_entry_only_undoes_itself(ledger, entries):
+    futures = [ledger.submit(record, value) for value in ('a', 'bad', 'b')]
+    assert futures[0].result(timeout=5) == 'A'
+    with pytest.raises(ValueError):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == 'B'
+    assert entries() == ['a', 'b']
+
+
+def test_close_flushes_the_queue_and_submit_restarts(ledger, entries):
+    futures = [ledger.submit(record, f'q{n}') for n in range(5)]
+    ledger.close()
+    assert all(future.done() for future in futures)
+    assert entries() == [f'q{n}' for n in range(5)]
+    assert ledger.submit(record, 'again').result(timeout=5) == 'AGAIN'
+
+
+def test_cancelled_entries_are_skipped(ledger, entries):
+    release = threading.Event()
+    blocker = ledger.submit(lambda conn: release.wait(5))
+    blocker_started = time.monotonic()
+    while not blocker.running() and time.monotonic() - blocker_started < 5:
+        time.sleep(0.001)
+    # The writer is busy with the blocker, so this one is still queued
+    dropped = ledger.submit(record, 'dropped')
+    assert dropped.cancel()
+    kept = ledger.submit(record, 'kept')
+    release.set()
+    assert kept.result(timeout=5) == 'KEPT'
+    assert entries() == ['kept']
+
+
+def test_ledger_stats_are_exported(client):
+    text = client.get('/metrics').get_data(as_text=True)
+    assert 'payment_ledger_entries_total ' in text
+    assert 'payment_ledger_queued ' in text
@@ -0,0 +1,133 @@
+import sqlite3
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from availability import day_range
+from booking import book
+from catalog import CatalogCache, log_gap
+from conftest import window
+from lifecycle import LifecycleScheduler
+from occupancy import OccupancyIndex
+
+
+class Clock:
+    def __init__(self, day):
+        self.now = datetime.combine(date.fromisoformat(day), datetime.min.time())
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, days):
+        self.now += timedelta(days=days)
+
+
+@pytest.fixture
+def scheduler(app, conn):
+    from database import pool
+
+    def make(day, **kwargs):
+        clock = Clock(day)
+        return LifecycleScheduler(pool, clock=clock, **kwargs), clock
+
+    yield make
+    # Put every bike back to its status for the real today
+    LifecycleScheduler(pool).run_pending(conn)
+
+
+def status(conn, bike_id):
+    return conn.execute('SELECT status FROM bikes WHERE id = ?', (bike_id,)).fetchone()[0]
+
+
+def test_booking_leaves_the_status_to_the_scheduler(conn, bike, user):
+    book(conn, user['id'], bike, *window())
+    assert status(conn, bike) == 'Available'
+
+
+def test_bikes_are_rented_for_the_reservation_days(conn, bike, user, scheduler):
+    start_date, end_date = window(days=2)
+    book(conn, user['id'], bike, start_date, end_date)
+    lifecycle, clock = scheduler(start_date)
+    assert lifecycle.run_pending(conn).get(bike) == 'Rented'
+    clock.advance(2)
+    assert lifecycle.run_pending(conn) == {}
+    assert status(conn, bike) == 'Rented'
+    clock.advance(1)
+    assert lifecycle.run_pending(conn) == {bike: 'Available'}
+
+
+def test_reservations_made_after_catch_up_are_polled(conn, bike, user, scheduler):
+    start_date, end_date = window()
+    lifecycle, clock = scheduler((date.fromisoformat(start_date) - timedelta(days=1)).isoformat())
+    lifecycle.run_pending(conn)
+    book(conn, user['id'], bike, start_date, end_date)
+    assert bike not in lifecycle.run_pending(conn)
+    clock.advance(1)
+    assert lifecycle.run_pending(conn) == {bike: 'Rented'}
+
+
+def test_maintenance_bikes_are_left_alone(conn, make_bike, user, scheduler):
+    bike = make_bike(status='Maintenance')
+    start_date, end_date = window()
+    start_day, end_day = day_range(start_date, end_date)
+    conn.execute('''
+        INSERT INTO reservations (bike_id, user_id, start_date, end_date, total_cost, status, start_day, end_day)
+        VALUES (?, ?, ?, ?, 1.0, 'confirmed', ?, ?)
+    ''', (bike, user['id'], start_date, end_date, start_day, end_day))
+    conn.commit()
+    lifecycle, _ = scheduler(start_date)
+    assert bike not in lifecycle.run_pending(conn)
+    assert status(conn, bike) == 'Maintenance'
+
+
+def test_changes_log_is_trimmed_to_its_size(conn, make_bike, scheduler):
+    for _ in range(6):
+        make_bike()
+    lifecycle, _ = scheduler(date.today().isoformat(), changelog_size=5)
+    lifecycle.run_pending(conn)
+    oldest, newest = conn.execute('SELECT MIN(version), MAX(version) FROM changes').fetchone()
+    assert newest - oldest < 5
+
+
+@pytest.fixture
+def log():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE changes (version INTEGER PRIMARY KEY AUTOINCREMENT, source TEXT, bike_id INTEGER)')
+    yield conn
+    conn.close()
+
+
+def test_log_gap(log):
+    assert not log_gap(log, 0)
+    assert log_gap(log, 3)
+    log.executemany('INSERT INTO changes (version, source) VALUES (?, ?)', [(n, 'bikes') for n in range(10, 15)])
+    assert not log_gap(log, 9)
+    assert not log_gap(log, 14)
+    assert log_gap(log, 8)
+    assert log_gap(log, 15)
+
+
+def test_caches_reload_when_the_log_was_trimmed_past_them(conn, bike, user):
+    cache = CatalogCache()
+    cache.get(conn)
+    index = OccupancyIndex(horizon_days=60)
+    index.load(conn)
+
+    start = date.today() + timedelta(days=10)
+    start_date, end_date = start.isoformat(), (start + timedelta(days=1)).isoformat()
+    start_day, end_day = day_range(start_date, end_date)
+    conn.execute("UPDATE bikes SET model = 'Trimmed' WHERE id = ?", (bike,))
+    reservation_id = conn.execute('''
+        INSERT INTO reservations (bike_id, user_id, start_date, end_date, total_cost, status, start_day, end_day)
+        VALUES (?, ?, ?, ?, 1.0, 'confirmed', ?, ?)
+    ''', (bike, user['id'], start_date, end_date, start_day, end_day)).lastrowid
+    conn.execute('DELETE FROM changes WHERE version < (SELECT MAX(version) FROM changes)')
+    conn.commit()
+    try:
+        models = {row['id']: row['model'] for row in cache.get(conn)['rows']}
+        assert models[bike] == 'Trimmed'
+        index.ensure_current(conn)
+        assert bike not in {row['id'] for row in index.available(conn, start_day, end_day)}
+    finally:
+        conn.execute('DELETE FROM reservations WHERE id = ?', (reservation_id,))
+        conn.commit()
@@ -0,0 +1,90 @@
+import pytest
+
+from availability import day_range
+from conftest import unique, window
+
+
+@pytest.fixture
+def fleet(make_bike):
+    brand = unique('Fleet')
+    return brand, [make_bike(price=10.0 * n, brand=brand) for n in range(1, 8)]
+
+
+@pytest.fixture
+def history(conn, bike, user):
+    ids = []
+    for _ in range(5):
+        start_date, end_date = window()
+        start_day, end_day = day_range(start_date, end_date)
+        ids.append(conn.execute('''
+            INSERT INTO reservations (bike_id, user_id, start_date, end_date, total_cost, status, start_day, end_day)
+            VALUES (?, ?, ?, ?, 1.0, 'confirmed', ?, ?)
+        ''', (bike, user['id'], start_date, end_date, start_day, end_day)).lastrowid)
+    conn.commit()
+    return ids
+
+
+def pages(client, path, **args):
+    seen = []
+    while True:
+        response = client.get(path, query_string=args)
+        assert response.status_code == 200
+        seen.append([row['id'] for row in response.get_json()])
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            return seen
+        args['after'] = cursor
+
+
+def test_bike_pages_follow_the_cursor(client, fleet):
+    brand, ids = fleet
+    seen = pages(client, '/api/bikes', brand=brand, limit=3)
+    assert [len(page) for page in seen] == [3, 3, 1]
+    assert sum(seen, []) == ids
+
+
+def test_filters_alone_return_every_match(client, fleet):
+    brand, ids = fleet
+    response = client.get('/api/bikes', query_string={'brand': brand, 'min_price': 25, 'max_price': 55})
+    assert response.headers.get('X-Next-Cursor') is None
+    assert [row['id'] for row in response.get_json()] == ids[2:5]
+
+
+def test_unrelated_parameters_still_get_the_catalog(client, fleet):
+    response = client.get('/api/bikes', query_string={'_': '12345'})
+    assert response.headers.get('ETag')
+
+
+def test_fields_are_projected_with_the_id(client, fleet):
+    brand, ids = fleet
+    rows = client.get('/api/bikes', query_string={'brand': brand, 'fields': 'price'}).get_json()
+    assert rows[0] == {'id': ids[0], 'price': 10.0}
+
+
+@pytest.mark.parametrize('args', [
+    {'fields': 'price,secret'},
+    {'limit': '0'},
+    {'limit': 'ten'},
+    {'after': 'abc'},
+    {'min_price': 'cheap'},
+])
+def test_bad_listing_arguments_are_400(client, args):
+    response = client.get('/api/bikes', query_string=args)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_reservations_page_newest_first(logged_in, user, history):
+    seen = pages(logged_in, f"/api/reservations/{user['id']}", limit=2)
+    assert [len(page) for page in seen] == [2, 2, 1]
+    assert sum(seen, []) == history[::-1]
+
+
+def test_reservations_without_limit_are_not_paged(logged_in, user, history):
+    response = logged_in.get(f"/api/reservations/{user['id']}")
+    assert response.headers.get('X-Next-Cursor') is None
+    assert len(response.get_json()) == len(history)
+
+
+def test_other_users_reservations_are_refused(logged_in, user):
+    assert logged_in.get(f"/api/reservations/{user['id'] + 1000}").status_code == 401
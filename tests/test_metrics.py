@@ -0,0 +1,53 @@
+import sqlite3
+
+import pytest
+
+from metrics import BUCKETS, Histogram, InstrumentedConnection, normalize_sql, query_duration
+
+
+@pytest.mark.parametrize('sql, label', [
+    ('SELECT *\n    FROM bikes\n   WHERE id = ?', 'SELECT * FROM bikes WHERE id = ?'),
+    ('SELECT id FROM bikes WHERE id IN (?, ?, ?)', 'SELECT id FROM bikes WHERE id IN (?+)'),
+    ('select id from bikes where id in (?,?)', 'select id from bikes where id IN (?+)'),
+    ('INSERT INTO t VALUES (?, ?), (?, ?), (?, ?)', 'INSERT INTO t VALUES (?, ...)'),
+])
+def test_labels_fold_parameter_lists(sql, label):
+    assert normalize_sql(sql) == label
+
+
+def test_labels_are_bounded():
+    assert len(normalize_sql('SELECT ' + ', '.join(f'c{n}' for n in range(200)))) == 200
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('demo_seconds', 'Demo.', ('route',))
+    for value in (0.0001, 0.003, 0.003, 99.0):
+        histogram.observe(('/x',), value, rows=2)
+    lines = histogram.render(rows_name='demo_rows_total')
+    assert f'demo_seconds_bucket{{route="/x",le="{BUCKETS[0]}"}} 1' in lines
+    assert 'demo_seconds_bucket{route="/x",le="0.005"} 3' in lines
+    assert f'demo_seconds_bucket{{route="/x",le="{BUCKETS[-1]}"}} 3' in lines
+    assert 'demo_seconds_bucket{route="/x",le="+Inf"} 4' in lines
+    assert 'demo_rows_total{route="/x"} 8' in lines
+
+
+def test_statements_are_timed_until_their_rows_are_read():
+    conn = sqlite3.connect(':memory:', factory=InstrumentedConnection)
+    conn.execute('CREATE TABLE numbers (n INTEGER)')
+    conn.executemany('INSERT INTO numbers VALUES (?)', [(n,) for n in range(5)])
+    label = ('SELECT n FROM numbers WHERE n IN (?+)',)
+    before = query_duration._series.get(label, {'count': 0, 'rows': 0})
+    before = before['count'], before['rows']
+    assert len(conn.execute('SELECT n FROM numbers WHERE n IN (?, ?, ?)', (1, 2, 3)).fetchall()) == 3
+    after = query_duration._series[label]
+    assert (after['count'], after['rows']) == (before[0] + 1, before[1] + 3)
+    conn.close()
+
+
+def test_metrics_endpoint_reports_routes_and_queries(client, bike):
+    client.get(f'/api/bikes/{bike}')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/bikes/<int:bike_id>",status="200"}' in text
+    assert 'sql_rows_total{' in text
@@ -0,0 +1,96 @@
+from datetime import date, timedelta
+
+import pytest
+
+from availability import day_range
+from occupancy import OccupancyIndex
+
+
+def days_ahead(n, length=2):
+    start = date.today() + timedelta(days=n)
+    return start.isoformat(), (start + timedelta(days=length)).isoformat()
+
+
+def reserve(conn, bike_id, start_date, end_date):
+    start_day, end_day = day_range(start_date, end_date)
+    cursor = conn.execute('''
+        INSERT INTO reservations (bike_id, user_id, start_date, end_date, total_cost, status, start_day, end_day)
+        VALUES (?, 1, ?, ?, 1.0, 'confirmed', ?, ?)
+    ''', (bike_id, start_date, end_date, start_day, end_day))
+    conn.commit()
+    return cursor.lastrowid
+
+
+def available_ids(client, start, end, **args):
+    response = client.get('/api/bikes/available', query_string={'start': start, 'end': end, **args})
+    assert response.status_code == 200
+    return {bike['id'] for bike in response.get_json()}
+
+
+@pytest.fixture
+def index(conn):
+    index = OccupancyIndex(horizon_days=120)
+    index.load(conn)
+    return index
+
+
+def test_booked_days_are_unavailable(conn, bike, index):
+    start, end = days_ahead(20)
+    index.mark(bike, *day_range(start, end))
+    start_day, end_day = day_range(start, end)
+    free = lambda first, last: bike in {row['id'] for row in index.available(conn, first, last)}
+    assert not free(start_day, end_day)
+    assert not free(end_day - 1, end_day + 3)
+    assert free(end_day, end_day + 3)
+    assert free(start_day - 3, start_day)
+
+
+def test_writes_from_other_connections_are_synced(conn, index, bike):
+    start, end = days_ahead(30)
+    start_day, end_day = day_range(start, end)
+    reservation_id = reserve(conn, bike, start, end)
+    index.ensure_current(conn)
+    assert bike not in {b['id'] for b in index.available(conn, start_day, end_day)}
+
+    conn.execute('DELETE FROM reservations WHERE id = ?', (reservation_id,))
+    conn.commit()
+    index.ensure_current(conn)
+    assert bike in {b['id'] for b in index.available(conn, start_day, end_day)}
+
+
+def test_past_the_horizon_falls_back_to_sql(conn, index, bike):
+    start, end = days_ahead(200)
+    reserve(conn, bike, start, end)
+    index.ensure_current(conn)
+    assert bike not in {b['id'] for b in index.available(conn, *day_range(start, end))}
+
+
+def test_endpoint_excludes_booked_and_maintenance_bikes(client, conn, make_bike):
+    booked, free, broken = make_bike(), make_bike(), make_bike(status='Maintenance')
+    start, end = days_ahead(40)
+    reserve(conn, booked, start, end)
+    ids = available_ids(client, start, end)
+    assert free in ids
+    assert booked not in ids
+    assert broken not in ids
+
+
+def test_endpoint_filters_by_type_and_price(client, make_bike):
+    cheap = make_bike(price=20.0, bike_type='Scooter')
+    dear = make_bike(price=500.0, bike_type='Scooter')
+    other = make_bike(price=20.0, bike_type='Cruiser')
+    ids = available_ids(client, *days_ahead(50), type='Scooter', max_price='100')
+    assert cheap in ids
+    assert dear not in ids
+    assert other not in ids
+
+
+@pytest.mark.parametrize('args, message', [
+    ({'start': '2030-01-01'}, 'Missing start or end date'),
+    ({'start': '2030-01-01', 'end': 'soon'}, 'Invalid date format'),
+    ({'start': '2030-01-05', 'end': '2030-01-01'}, 'Invalid date range'),
+])
+def test_endpoint_rejects_bad_dates(client, args, message):
+    response = client.get('/api/bikes/available', query_string=args)
+    assert response.status_code == 400
+    assert response.get_json() == {'error': message}
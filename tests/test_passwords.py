@@ -0,0 +1,93 @@
+import pytest
+from werkzeug.security import check_password_hash
+
+from conftest import unique
+from passwords import HashingBusy, LoginThrottled, PasswordHasher
+
+METHOD = 'pbkdf2:sha256:1000'
+
+
+@pytest.fixture
+def inline():
+    return PasswordHasher(METHOD, workers=0, failed_limit=3, failed_ttl=60)
+
+
+@pytest.fixture
+def account(conn, inline):
+    username = unique('hashed')
+    conn.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, inline.hash('secret')))
+    conn.commit()
+    return username
+
+
+def test_hashes_use_the_configured_method(inline):
+    stored = inline.hash('secret')
+    assert stored.startswith(METHOD + '$')
+    assert not inline.needs_rehash(stored)
+    assert inline.needs_rehash(PasswordHasher('pbkdf2:sha256:2000', workers=0).hash('secret'))
+
+
+def test_login_upgrades_outdated_hashes(conn, account):
+    stronger = PasswordHasher('pbkdf2:sha256:2000', workers=0)
+    assert stronger.authenticate(conn, account, 'secret')['username'] == account
+    stored = conn.execute('SELECT password FROM users WHERE username = ?', (account,)).fetchone()[0]
+    assert stored.startswith('pbkdf2:sha256:2000$')
+
+
+def test_failed_logins_are_throttled_per_client(conn, inline, account):
+    for _ in range(3):
+        assert inline.authenticate(conn, account, 'wrong', client='10.0.0.1') is None
+    with pytest.raises(LoginThrottled) as excinfo:
+        inline.authenticate(conn, account, 'secret', client='10.0.0.1')
+    assert 0 < excinfo.value.retry_after <= 60
+    assert inline.authenticate(conn, account, 'secret', client='10.0.0.2') is not None
+
+
+def test_success_resets_the_failure_count(conn, inline, account):
+    for _ in range(2):
+        inline.authenticate(conn, account, 'wrong')
+    assert inline.authenticate(conn, account, 'secret') is not None
+    for _ in range(2):
+        inline.authenticate(conn, account, 'wrong')
+    assert inline.authenticate(conn, account, 'secret') is not None
+
+
+def test_unknown_users_count_as_failures(conn, inline):
+    username = unique('nobody')
+    for _ in range(3):
+        assert inline.authenticate(conn, username, 'secret') is None
+    with pytest.raises(LoginThrottled):
+        inline.authenticate(conn, username, 'secret')
+
+
+def test_full_queue_is_busy():
+    hasher = PasswordHasher(METHOD, workers=0, max_pending=1, queue_timeout=0.01)
+    hasher._slots.acquire()
+    with pytest.raises(HashingBusy):
+        hasher.hash('secret')
+
+
+def test_hashing_pool_runs_off_the_request_thread(app):
+    from passwords import hasher
+
+    assert hasher.workers
+    assert check_password_hash(hasher.hash('secret'), 'secret')
+
+
+def test_api_register_and_login(client):
+    username = unique('api')
+    body = {'username': username, 'password': 'secret'}
+    assert client.post('/api/user/register', json=body).status_code == 200
+    assert client.post('/api/user/register', json=body).status_code == 409
+    response = client.post('/api/user/login', json=body)
+    assert response.status_code == 200
+    assert response.get_json()['message'] == 'Login successful'
+
+
+def test_api_login_answers_429_with_retry_after(client, user):
+    body = {'username': user['username'], 'password': 'wrong'}
+    for _ in range(5):
+        assert client.post('/api/user/login', json=body).status_code == 401
+    response = client.post('/api/user/login', json={**body, 'password': user['password']})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) > 0
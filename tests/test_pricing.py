@@ -0,0 +1,129 @@
+import random
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import pricing as pricing_module
+from availability import day_range
+from booking import BookingError, book
+from conftest import window
+from pricing import PricingEngine, quote_items
+
+# A Monday, so days 5 and 6 of the week are the weekend
+MONDAY = date(2030, 6, 3).toordinal()
+
+
+def test_flat_engine_charges_the_daily_rate():
+    assert PricingEngine().quote(40.0, 'Cruiser', MONDAY, MONDAY + 3) == 120.0
+
+
+def test_weekends_and_types_change_the_rate():
+    engine = PricingEngine(weekend_multiplier=1.5, type_rates={'Sport Bike': 2.0})
+    assert engine.quote(10.0, 'Cruiser', MONDAY, MONDAY + 7) == 80.0
+    assert engine.quote(10.0, 'Sport Bike', MONDAY + 5, MONDAY + 6) == 30.0
+
+
+def test_seasons_may_wrap_the_new_year():
+    engine = PricingEngine(seasons=[('1220', '0105', 2.0)])
+    assert engine.day_multiplier(date(2030, 12, 31).toordinal()) == 2.0
+    assert engine.day_multiplier(date(2031, 1, 5).toordinal()) == 2.0
+    assert engine.day_multiplier(date(2031, 1, 6).toordinal()) == 1.0
+
+
+def test_longest_reached_length_discount_applies():
+    engine = PricingEngine(length_discounts=[(7, 0.1), (3, 0.05)])
+    assert engine.discount(2) == 0.0
+    assert engine.discount(3) == 0.05
+    assert engine.discount(30) == 0.1
+    assert engine.quote(100.0, 'Cruiser', MONDAY, MONDAY + 7) == 630.0
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_batches_match_single_quotes(monkeypatch, use_numpy):
+    if use_numpy:
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(pricing_module, 'numpy', None)
+    engine = PricingEngine(weekend_multiplier=1.25, seasons=[('0601', '0831', 1.2)],
+                           length_discounts=[(5, 0.1)], type_rates={'Scooter': 0.5})
+    rng = random.Random(7)
+    items = []
+    for _ in range(200):
+        start = MONDAY + rng.randrange(400)
+        items.append((rng.choice([25.0, 80.5]), rng.choice(['Scooter', 'Cruiser']), start, start + rng.randrange(1, 15)))
+    expected = [round(price * engine.type_rates.get(kind, 1.0) * (1 - engine.discount(end - start))
+                      * sum(engine.day_multiplier(day) for day in range(start, end)), 2)
+                for price, kind, start, end in items]
+    assert engine.quote_many(items) == pytest.approx(expected, abs=0.011)
+    assert engine.quote_many([]) == []
+
+
+def test_quote_items_prices_from_the_catalog(conn, make_bike):
+    from pricing import pricing
+
+    bike = make_bike(price=33.0, bike_type='Scooter')
+    start_date, end_date = window(days=3)
+    results = quote_items(conn, [
+        {'bike_id': bike, 'start_date': start_date, 'end_date': end_date},
+        {'bike_id': 999999, 'start_date': start_date, 'end_date': end_date},
+        {'bike_id': bike, 'start_date': end_date, 'end_date': start_date},
+        {'bike_id': bike},
+    ])
+    assert results[0]['days'] == 4
+    assert results[0]['total_cost'] == pricing.quote(33.0, 'Scooter', *day_range(start_date, end_date))
+    assert [result.get('error') for result in results[1:]] == [
+        'Bike not found', 'Invalid date range', 'Invalid quote request']
+
+
+def test_quotes_endpoint(client, bike):
+    start_date, end_date = window()
+    response = client.post('/api/quotes', json={'items': [
+        {'bike_id': bike, 'start_date': start_date, 'end_date': end_date}]})
+    assert response.status_code == 200
+    assert response.get_json()['quotes'][0]['total_cost'] > 0
+    assert client.post('/api/quotes', json={}).status_code == 400
+    assert client.post('/api/quotes', json={'items': []}).get_json() == {'error': 'quotes must be a non-empty list'}
+
+
+def test_booking_charges_the_quoted_price(logged_in, bike):
+    start_date, end_date = window(days=5)
+    item = {'bike_id': bike, 'start_date': start_date, 'end_date': end_date}
+    quoted = logged_in.post('/api/quotes', json={'items': [item]}).get_json()['quotes'][0]['total_cost']
+    assert logged_in.post('/api/reservations', json=item).get_json()['total_cost'] == quoted
+
+
+def test_far_apart_quotes_are_priced_separately():
+    engine = PricingEngine(weekend_multiplier=2.0)
+    early, late = date(1, 1, 1).toordinal(), date(9999, 12, 1).toordinal()
+    items = [(10.0, 'Cruiser', early, early + 7), (10.0, 'Cruiser', late, late + 7)]
+    start = time.perf_counter()
+    assert engine.quote_many(items) == [engine.quote(*item) for item in items]
+    assert time.perf_counter() - start < 0.5
+
+
+def test_check_bounds_rental_length_and_horizon():
+    engine = PricingEngine(max_days=10, horizon_days=30)
+    engine.check(MONDAY, MONDAY + 10, today=MONDAY)
+    with pytest.raises(ValueError, match='limited to 10 days'):
+        engine.check(MONDAY, MONDAY + 11, today=MONDAY)
+    with pytest.raises(ValueError, match='within the next 30 days'):
+        engine.check(MONDAY - 1, MONDAY + 2, today=MONDAY)
+    with pytest.raises(ValueError, match='within the next 30 days'):
+        engine.check(MONDAY + 25, MONDAY + 31, today=MONDAY)
+
+
+def test_quotes_endpoint_refuses_unbounded_rentals(client, bike):
+    start = time.perf_counter()
+    response = client.post('/api/quotes', json={'items': [
+        {'bike_id': bike, 'start_date': '0001-01-01', 'end_date': '9999-12-31'}]})
+    assert response.status_code == 400
+    assert 'Quote 0' in response.get_json()['error']
+    assert time.perf_counter() - start < 0.5
+
+
+def test_booking_refuses_overlong_rentals(conn, bike, user):
+    start_date, _ = window()
+    end_date = (date.fromisoformat(start_date) + timedelta(days=200)).isoformat()
+    with pytest.raises(BookingError, match='limited to'):
+        book(conn, user['id'], bike, start_date, end_date)
\ No newline at end of file
@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+from replicas import ReplicaSet
+
+
+@pytest.fixture
+def replicas(app, tmp_path):
+    from database import pool
+
+    made = []
+
+    def make(refresh=False, **kwargs):
+        made.append(ReplicaSet(pool, [str(tmp_path / 'replica.db')], pool_size=1, refresh=refresh, **kwargs))
+        return made[-1]
+
+    yield make
+    for replica_set in made:
+        replica_set.stop()
+
+
+def bike_ids(replica_pool):
+    conn = replica_pool.acquire()
+    try:
+        return {row[0] for row in conn.execute('SELECT id FROM bikes')}
+    finally:
+        replica_pool.release(conn)
+
+
+def test_reads_go_to_the_primary_until_the_first_copy(replicas, bike):
+    replica_set = replicas()
+    assert replica_set.choose() is None
+    replica_set.refresh()
+    replica_pool = replica_set.choose()
+    assert replica_pool is not None
+    assert bike in bike_ids(replica_pool)
+    assert replica_set.get_stats()['replica_reads'] == 1
+
+
+def test_unchanged_primary_is_not_copied_again(replicas, make_bike):
+    replica_set = replicas()
+    replica_set.refresh()
+    replica_set.refresh()
+    assert replica_set.replicas[0].refreshes == 1
+    bike = make_bike()
+    replica_set.refresh()
+    assert replica_set.replicas[0].refreshes == 2
+    assert bike in bike_ids(replica_set.choose())
+
+
+def test_own_writes_and_stale_copies_read_the_primary(replicas):
+    replica_set = replicas(max_staleness=5)
+    replica_set.refresh()
+    snapshot_at = replica_set.replicas[0].snapshot_at
+    assert replica_set.choose(wrote_at=snapshot_at - 1) is not None
+    assert replica_set.choose(wrote_at=snapshot_at + 1) is None
+    replica_set.replicas[0].stamp(time.time() - 10)
+    assert replica_set.choose() is None
+
+
+def test_other_processes_see_the_refreshers_stamp(replicas):
+    refresher = replicas(refresh=True, refresh_interval=0.01)
+    reader = replicas()
+    reader.start()
+    assert reader._thread is None
+    refresher.start()
+    deadline = time.monotonic() + 5
+    while reader.choose() is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert reader.choose() is not None
+
+
+def test_api_history_reads_from_a_fresh_replica(app, logged_in, user, monkeypatch, replicas):
+    import replicas as replicas_module
+
+    replica_set = replicas()
+    replica_set.refresh()
+    monkeypatch.setattr(replicas_module, 'replica_set', replica_set)
+    assert logged_in.get(f"/api/reservations/{user['id']}").status_code == 200
+    assert replica_set.get_stats()['replica_reads'] == 1
@@ -0,0 +1,78 @@
+import pytest
+
+from conftest import unique
+from search import facet_counts, match_expression
+
+
+@pytest.fixture
+def word():
+    return unique('quokka').lower()
+
+
+def search(client, **args):
+    response = client.get('/api/bikes/search', query_string=args)
+    assert response.status_code == 200
+    return response.get_json()
+
+
+@pytest.mark.parametrize('q, expression', [
+    ('red cruiser', '"red"* "cruiser"*'),
+    ('NEAR("a" OR b*', '"NEAR"* "a"* "OR"* "b"*'),
+    ('  ', ''),
+])
+def test_free_text_becomes_quoted_prefixes(q, expression):
+    assert match_expression(q) == expression
+
+
+def test_words_match_as_prefixes_in_any_column(client, conn, make_bike, word):
+    by_brand = make_bike(brand=word.title())
+    by_model = make_bike(brand=unique('Plain'))
+    conn.execute('UPDATE bikes SET model = ? WHERE id = ?', (f'{word} Special', by_model))
+    conn.commit()
+    result = search(client, q=word[:-1])
+    assert {hit['id'] for hit in result['hits']} == {by_brand, by_model}
+    # Brand is weighted above model
+    assert [hit['id'] for hit in result['hits']] == [by_brand, by_model]
+
+
+def test_pages_cover_every_hit_and_counts_cover_the_match(client, make_bike, word):
+    brand = word.title()
+    ids = [make_bike(brand=brand, bike_type='Scooter' if n % 2 else 'Cruiser', price=10.0 * n)
+           for n in range(1, 8)]
+    seen = []
+    args = {'q': word, 'limit': 3}
+    while True:
+        result = search(client, **args)
+        assert result['total'] == 7
+        assert result['facets'] == {'type': {'Cruiser': 3, 'Scooter': 4}, 'brand': {brand: 7}}
+        seen += [hit['id'] for hit in result['hits']]
+        if result['next_cursor'] is None:
+            break
+        args['after'] = result['next_cursor']
+    assert sorted(seen) == ids
+
+
+def test_filters_narrow_hits_and_counts(client, make_bike, word):
+    brand = word.title()
+    cheap = make_bike(brand=brand, bike_type='Scooter', price=20.0)
+    make_bike(brand=brand, bike_type='Scooter', price=200.0)
+    make_bike(brand=brand, bike_type='Cruiser', price=20.0)
+    result = search(client, brand=brand, type='Scooter', price_max=50)
+    assert [hit['id'] for hit in result['hits']] == [cheap]
+    assert result['facets']['type'] == {'Scooter': 1}
+
+
+@pytest.mark.parametrize('args', [{'after': 'nonsense'}, {'price_min': 'cheap'}, {'limit': '0'}])
+def test_bad_search_arguments_are_400(client, args):
+    assert client.get('/api/bikes/search', query_string=args).status_code == 400
+
+
+def test_facet_counts_match_the_search_api(logged_in, make_bike, word):
+    brand = word.title()
+    make_bike(brand=brand, bike_type='Scooter')
+    make_bike(brand=brand, bike_type='Scooter')
+    page = logged_in.get('/bikes').get_data(as_text=True)
+    assert f'<option value="{brand}">{brand} (2)</option>' in page
+    everything = search(logged_in, limit=1)
+    rows = logged_in.get('/api/bikes').get_json()
+    assert facet_counts(rows) == everything['facets']
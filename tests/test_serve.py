@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+import pytest
+from werkzeug.test import Client, create_environ
+
+import serve
+from config import CONFIG
+from serve import Worker, WorkerApp
+
+
+def streaming_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return iter([b'one', b'two'])
+
+
+def test_healthz_reports_the_worker(app):
+    worker = WorkerApp(app, 'frontend', 3)
+    response = Client(worker).get('/healthz')
+    health = json.loads(response.data)
+    assert (health['pid'], health['role'], health['generation']) == (os.getpid(), 'frontend', 3)
+    assert 'pool' in health
+
+
+def test_api_workers_only_serve_the_api(app, bike):
+    client = Client(WorkerApp(app, 'api', 1))
+    assert client.get('/bikes').status_code == 404
+    assert client.get(f'/api/bikes/{bike}').status_code == 200
+
+
+def test_requests_stay_in_flight_until_their_body_is_sent():
+    worker = WorkerApp(streaming_app, 'frontend', 1)
+    body = worker(create_environ('/stream'), lambda status, headers: None)
+    assert worker.in_flight == 1
+    assert not worker.drain(0.01)
+
+    threading.Timer(0.05, body.close).start()
+    assert list(body) == [b'one', b'two']
+    assert worker.drain(5)
+    assert (worker.requests, worker.in_flight) == (1, 0)
+
+
+def test_worker_reports_are_read_line_by_line():
+    read_fd, write_fd = os.pipe()
+    worker = Worker('frontend', 0, 1, os.getpid(), read_fd)
+    try:
+        assert worker.state(0, 30) == 'starting'
+        os.write(write_fd, b'{"requests": 1}\n{"requests"')
+        assert worker.read_reports()
+        assert worker.health == {'requests': 1}
+        assert worker.state(worker.last_report + 1, 30) == 'ready'
+        assert worker.state(worker.last_report + 31, 30) == 'unresponsive'
+        os.write(write_fd, b': 2}\n')
+        worker.read_reports()
+        assert worker.health == {'requests': 2}
+        os.close(write_fd)
+        assert not worker.read_reports()
+    finally:
+        os.close(read_fd)
+
+
+@pytest.fixture
+def launch(monkeypatch):
+    """Run ``serve.main`` without binding sockets or forking."""
+    started = []
+
+    class FakeLauncher:
+        def __init__(self, groups, **kwargs):
+            self.groups = groups
+
+        def run(self):
+            started.append(self.groups)
+            return 0
+
+    monkeypatch.setattr(serve, 'Launcher', FakeLauncher)
+    monkeypatch.setattr(serve, 'listen', lambda host, port: (host, port))
+    monkeypatch.setitem(CONFIG['launcher'], 'frontend_workers', '2')
+    monkeypatch.setitem(CONFIG['launcher'], 'api_workers', '1')
+    monkeypatch.setitem(CONFIG['session'], 'secret_key', '')
+    return started
+
+
+def test_memory_sessions_refuse_several_workers(launch, monkeypatch):
+    monkeypatch.setitem(CONFIG['session'], 'backend', 'memory')
+    assert serve.main() == 1
+    assert launch == []
+
+
+def test_workers_share_one_generated_secret_key(launch, monkeypatch):
+    monkeypatch.setitem(CONFIG['session'], 'backend', 'sqlite')
+    assert serve.main() == 0
+    assert [(role, count) for role, count, _ in launch[0]] == [('frontend', 2), ('api', 1)]
+    assert len(CONFIG['session']['secret_key']) == 64
+
+
+def test_warm_builds_the_catalog_fragments(app):
+    from catalog import catalog
+    from database import pool
+
+    # warm checks out every pooled connection, so none may be held here
+    serve.warm(app)
+    conn = pool.acquire()
+    try:
+        assert {'bike_cards', 'facets'} <= set(catalog.get(conn)['fragments'])
+    finally:
+        pool.release(conn)
+
+
+@pytest.mark.parametrize('server', ['waitress', 'werkzeug'])
+def test_shutdown_lets_in_flight_requests_finish(server):
+    if server == 'waitress' and serve.waitress is None:
+        pytest.skip('waitress is not installed')
+    started, release = threading.Event(), threading.Event()
+
+    def slow_app(environ, start_response):
+        started.set()
+        release.wait(5)
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        return [b'done']
+
+    worker = WorkerApp(slow_app, 'frontend', 1)
+    listener = serve.listen('127.0.0.1', 0)
+    url = 'http://127.0.0.1:%d/' % listener.getsockname()[1]
+    if server == 'waitress':
+        run, shutdown = serve.waitress_server(worker, listener, 2, 5)
+    else:
+        run, shutdown = serve.werkzeug_server(worker, listener, 5)
+
+    with ThreadPoolExecutor(4) as executor:
+        serving = executor.submit(run)
+        response = executor.submit(lambda: urlopen(url, timeout=5).read())
+        assert started.wait(5)
+        # As when SIGTERM reaches both the launcher's process group and the worker
+        executor.submit(shutdown)
+        executor.submit(shutdown)
+        release.set()
+        assert response.result() == b'done'
+        assert serving.result(timeout=10)
+    assert (worker.requests, worker.in_flight) == (1, 0)
\ No newline at end of file
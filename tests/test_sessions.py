@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from sessions import MemorySessionStore, ServerSession, SQLiteSessionStore
+
+TTL = 3600
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, app):
+    if request.param == 'memory':
+        return MemorySessionStore()
+    from database import pool
+    return SQLiteSessionStore(pool)
+
+
+def saved(store, **data):
+    session = ServerSession(store)
+    for key, value in data.items():
+        session[key] = value
+    return session.save(TTL)
+
+
+def test_untouched_sessions_never_reach_the_store(store):
+    session = ServerSession(store, 'unknown')
+    assert session.save(TTL) is None
+    assert not session.accessed
+
+
+def test_data_round_trips_under_a_random_id(store):
+    sid = saved(store, cart=[1, 2])
+    assert len(sid) >= 32
+    session = ServerSession(store, sid)
+    assert session['cart'] == [1, 2]
+    # Unchanged and far from expiry, so not rewritten
+    assert session.save(TTL) is None
+
+
+def test_login_moves_the_data_to_a_new_id(store):
+    sid = saved(store, cart=[1])
+    session = ServerSession(store, sid)
+    session['user_id'] = 7
+    new_sid = session.save(TTL)
+    assert new_sid and new_sid != sid
+    assert store.get(sid) is None
+    assert store.get(new_sid)[1] == {'cart': [1], 'user_id': 7}
+
+
+def test_clear_deletes_the_stored_entry(store):
+    sid = saved(store, user_id=7)
+    session = ServerSession(store, sid)
+    session.clear()
+    assert session.save(TTL) == ''
+    assert store.get(sid) is None
+
+
+def test_expired_entries_are_ignored(store):
+    store.save('stale', {'user_id': 1}, time.time() - 1)
+    assert 'user_id' not in ServerSession(store, 'stale')
+
+
+def test_memory_store_evicts_the_soonest_to_expire():
+    store = MemorySessionStore(max_entries=2)
+    now = time.time()
+    store.save('a', {}, now + 10)
+    store.save('b', {}, now + 20)
+    store.save('c', {}, now + 30)
+    assert store.get('a') is None
+    assert store.get('b') and store.get('c')
+
+
+def login(client, user):
+    return client.post('/login/', data={'username': user['username'], 'password': user['password']})
+
+
+def test_form_login_sets_a_fresh_id_cookie(app, client, user):
+    client.get('/overview')  # Starts a session with a flash message
+    before = client.get_cookie('session')
+    response = login(client, user)
+    assert response.headers['Location'].endswith('/overview')
+    after = client.get_cookie('session')
+    assert after is not None and len(after.value) < 64
+    assert before is None or after.value != before.value
+    assert client.get('/overview').status_code == 200
+
+
+def test_logout_deletes_the_session(app, client, user):
+    login(client, user)
+    sid = client.get_cookie('session').value
+    client.get('/logout/')
+    assert client.get_cookie('session') is None
+    assert app.session_interface.store.get(sid) is None
+    assert client.get('/overview').status_code == 302